@@ -0,0 +1,567 @@
+# benchmark.py
+"""
+Offline benchmarks for the bill processing pipeline
+
+Usage:
+    python benchmark.py ocr-backends [--image uploads/<file>.png] [--runs 5]
+    python benchmark.py llm [--server URL] [--bills 20] [--concurrency 4]
+    python benchmark.py stages [--corpus "uploads/*.png"] [--templates 200] [--runs 3]
+    python benchmark.py pipeline [--corpus ...] [--llm-latency-ms 50]
+    python benchmark.py upload [--corpus ...] [--requests 200] [--concurrency 16]
+    python benchmark.py suite [--corpus ...] [--save-baseline [FILE] | --baseline [FILE]]
+    python benchmark.py startup [--runs 5]
+
+stages, pipeline, upload and suite run in a scratch directory holding
+copies of templates/ and the corpus, so the OCR cache, job queue and
+result store start empty on every run and the repo's own are untouched.
+LLM calls go to llm_stub_server, so no network is needed. They report
+p50/p95 latencies, throughput and peak RSS; --save-baseline stores the
+results as JSON and --baseline compares a run against them, exiting with
+status 1 when a latency or throughput regressed by more than --tolerance.
+Without a FILE both use benchmarks/baseline.json, the committed baseline
+of the sample corpus. Timings depend on the machine, so refresh it (on
+the machine that checks for regressions) when the environment recorded
+in it no longer matches.
+"""
+import os
+import sys
+import glob
+import json
+import shutil
+import asyncio
+import argparse
+import platform
+import resource
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, List, Iterator, Optional
+
+import cv2
+
+import config
+from processor import OCR_BACKENDS, preprocess_image
+from llm_extractor import HTTPLLMDataExtractor, chunk_bill_text
+
+DEFAULT_CORPUS = ["uploads/*.png", "uploads/*.jpg", "uploads/*.jpeg", "uploads/*.pdf"]
+DEFAULT_BASELINE = "benchmarks/baseline.json"
+# Latencies, or times per item of a throughput, that grew by less than
+# this are timer noise, not regressions
+MIN_REGRESSION_S = 0.002
+
+def _sample_image() -> str:
+    """Pick the first sample upload as the default benchmark page"""
+    samples = sorted(glob.glob("uploads/*.png"))
+    if not samples:
+        raise SystemExit("No sample images found in uploads/, pass --image")
+    return samples[0]
+
+def benchmark_ocr_backends(image_path: str, runs: int = 5) -> Dict[str, Any]:
+    """
+    Time every available OCR backend on the same preprocessed page
+
+    Engine startup is reported separately from the per-page time, which is
+    where pytesseract pays for its temp file, process spawn and model load.
+    """
+    page = preprocess_image(cv2.imread(image_path))
+    results = {}
+
+    for name, backend_class in OCR_BACKENDS.items():
+        try:
+            start = time.perf_counter()
+            backend = backend_class()
+            backend.image_to_string(page)  # Warm up
+            startup = time.perf_counter() - start
+        except Exception as e:
+            results[name] = {"available": False, "error": str(e)}
+            continue
+
+        per_page: List[float] = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            backend.image_to_string(page)
+            per_page.append(time.perf_counter() - start)
+        backend.close()
+
+        results[name] = {
+            "available": True,
+            "version": backend.version(),
+            "startup_s": startup,
+            "per_page_median_s": statistics.median(per_page),
+            "per_page_min_s": min(per_page)
+        }
+
+    fallback = results.get("pytesseract", {})
+    for name, result in results.items():
+        if result.get("available") and fallback.get("available"):
+            result["saved_per_page_s"] = fallback["per_page_median_s"] - result["per_page_median_s"]
+
+    return results
+
+def synthetic_bill_text(number: int, filler_lines: int = 120) -> str:
+    """A long utility bill as OCR might read it, with fields at top and bottom"""
+    lines = [
+        "Bangalore Electricity Supply Company Limited",
+        f"Bill No: 11120124{number:08d}",
+        f"Bill Date: {number % 28 + 1:02d}/05/2024",
+        "Account ID: 4SEH2XXXXX",
+    ]
+    lines += [f"Slab {i}: {i * 10} units @ 5.90 = {i * 59.0:.2f}" for i in range(filler_lines)]
+    lines += [f"Due Date: {number % 28 + 1:02d}/06/2024", f"Net Payable: {1000 + number}.00"]
+    return "\n".join(lines)
+
+def benchmark_llm(server_url: str, bills: int, concurrency: int) -> Dict[str, Any]:
+    """
+    Compare one-at-a-time LLM extraction with concurrent, chunked extraction
+    """
+    extractor = HTTPLLMDataExtractor(server_url)
+    texts = [synthetic_bill_text(number) for number in range(bills)]
+    results = {"bills": bills, "chunks_per_bill": len(chunk_bill_text(texts[0]))}
+
+    for label, limit in (("sequential", 1), ("concurrent", concurrency)):
+        start = time.perf_counter()
+        extracted = extractor.extract_many(texts, concurrency=limit)
+        elapsed = time.perf_counter() - start
+        results[label] = {
+            "concurrency": limit,
+            "seconds": elapsed,
+            "bills_per_second": bills / elapsed,
+            "errors": sum(1 for data in extracted if "error" in data)
+        }
+
+    return results
+
+def _start_stub_llm_server(latency_ms: float = 300, ms_per_token: float = 2) -> str:
+    """Run llm_stub_server in a background thread and return its URL"""
+    from llm_stub_server import serve
+
+    server = serve(0, latency_ms=latency_ms, ms_per_token=ms_per_token)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+def percentile(samples: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of a non-empty sample"""
+    ordered = sorted(samples)
+    return ordered[max(0, min(len(ordered) - 1, round(fraction * len(ordered)) - 1))]
+
+def summarize(samples: List[float]) -> Dict[str, Any]:
+    """Run count, mean, p50 and p95 of a list of durations in seconds"""
+    return {
+        "runs": len(samples),
+        "mean_s": statistics.mean(samples),
+        "p50_s": percentile(samples, 0.5),
+        "p95_s": percentile(samples, 0.95)
+    }
+
+def peak_rss_mb() -> Dict[str, float]:
+    """
+    Peak resident memory so far of this process and of its finished children
+
+    The peak covers the whole process lifetime, so run a benchmark on its
+    own to attribute memory to it. OCR pool workers count as children
+    once they exit.
+    """
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    unit = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit
+    }
+
+def find_corpus(patterns: Optional[List[str]] = None) -> List[str]:
+    """Absolute paths of the bills matching the glob patterns, in a stable order"""
+    paths = sorted({os.path.abspath(path) for pattern in (patterns or DEFAULT_CORPUS)
+                    for path in glob.glob(pattern)})
+    if not paths:
+        raise SystemExit("No bills found for the corpus, pass --corpus")
+    return paths
+
+@contextmanager
+def workspace(corpus: List[str]) -> Iterator[List[str]]:
+    """
+    Run inside a scratch directory with copies of templates/ and the corpus
+
+    Yields the corpus filenames as stored in the scratch uploads/. Every
+    component reads its relative default paths (cache, queue, results)
+    from the current directory, so nothing from earlier runs is reused.
+    """
+    original = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="bill-benchmark-") as scratch:
+        shutil.copytree(os.path.join(original, "templates"), os.path.join(scratch, "templates"))
+        os.makedirs(os.path.join(scratch, "uploads"))
+        filenames = []
+        for number, path in enumerate(corpus):
+            filename = f"{number:04d}_{os.path.basename(path)}"
+            shutil.copyfile(path, os.path.join(scratch, "uploads", filename))
+            filenames.append(filename)
+
+        os.chdir(scratch)
+        try:
+            yield filenames
+        finally:
+            os.chdir(original)
+
+def synthetic_template(number: int) -> Dict[str, Any]:
+    """A vendor template that looks like the real ones but matches no sample bill"""
+    return {
+        "name": f"Synthetic Vendor {number}",
+        "description": "Generated for benchmarking template identification",
+        "fields": {
+            "vendor_name": {"required": True, "type": "string", "default": f"Synthetic Vendor {number}"},
+            "invoice_number": {"required": True, "type": "string", "anchors": [f"ref {number}", "statement no"]},
+            "account_number": {"required": True, "type": "string", "anchors": [f"customer {number}"]},
+            "date": {"required": True, "type": "date", "anchors": ["statement date"]},
+            "total_amount": {"required": True, "type": "number", "anchors": ["amount due"]},
+            "usage": {"required": False, "type": "number", "anchors": [f"meter {number} usage"]}
+        },
+        "identification": {
+            "keywords": [f"vendor{number}", f"synthetic power {number}", {"keyword": f"svc{number}", "weight": 3}]
+        }
+    }
+
+def benchmark_stages(filenames: List[str], templates: int = 200, runs: int = 3) -> Dict[str, Any]:
+    """
+    Time each pipeline stage on its own, on the first page of every bill
+
+    Covers header fingerprinting, rasterizing, page analysis, every
+    preprocessing profile, OCR, generic field extraction, loading the
+    repo's templates plus `templates` synthetic ones (from the template
+    index, as a restarted process would), template identification among
+    them, template field extraction and mapping.
+    When OCR is unavailable the text stages run on synthetic bill text.
+    """
+    from processor import DocumentProcessor, PREPROCESS_PROFILES, run_preprocess_profile, create_ocr_backend
+    from page_analysis import analyze_page, normalize_page
+    from fingerprint_index import page_fingerprint
+    from template_manager import TemplateManager
+
+    processor = DocumentProcessor()
+    template_manager = TemplateManager()
+    for number in range(templates):
+        template_manager.save_template(f"synthetic_{number:04d}", synthetic_template(number))
+
+    samples: Dict[str, List[float]] = {}
+
+    def timed(stage: str, func, *args):
+        for _ in range(runs):
+            start = time.perf_counter()
+            result = func(*args)
+            samples.setdefault(stage, []).append(time.perf_counter() - start)
+        return result
+
+    timed("load_templates", TemplateManager)
+
+    try:
+        backend = create_ocr_backend(config.OCR_BACKEND)
+        backend_error = None
+    except Exception as e:
+        backend, backend_error = None, str(e)
+
+    texts = []
+    for filename in filenames:
+        timed("fingerprint", lambda: page_fingerprint(processor.header_page(filename)))
+        page = timed("rasterize", processor._render_page, filename, 1, config.RASTER_DPI, 1.0)
+        if config.PAGE_ANALYSIS:
+            page = timed("page_analysis", lambda img: normalize_page(img, analyze_page(img, config.PAGE_X_HEIGHT)), page)
+        preprocessed = {
+            profile: timed(f"preprocess_{profile}", run_preprocess_profile, page, profile)[0]
+            for profile in list(PREPROCESS_PROFILES) + ["auto"]
+        }
+        if backend is not None:
+            try:
+                page_words = timed("ocr", backend.image_to_data, preprocessed[config.PREPROCESS_PROFILE])
+                texts.append(page_words.text())
+            except Exception as e:
+                backend, backend_error = None, str(e)
+    if backend is not None:
+        backend.close()
+    if not texts:
+        texts = [synthetic_bill_text(number) for number in range(len(filenames))]
+
+    for text in texts:
+        bill_data = timed("extract_generic", processor._extract_bill_data, text)
+        template_id = timed("identify", template_manager.identify_template, bill_data, text)
+        extracted = dict(bill_data)
+        extracted.update(timed("extract_template", template_manager.extract_fields, template_id, text))
+        timed("map", template_manager.map_to_template, template_id, extracted)
+
+    results: Dict[str, Any] = {
+        "pages": len(filenames),
+        "templates": len(template_manager.snapshot().template_ids()),
+        "stages": {stage: summarize(durations) for stage, durations in samples.items()}
+    }
+    if backend_error:
+        results["ocr_error"] = backend_error
+    return results
+
+def benchmark_pipeline(filenames: List[str], llm_latency_ms: float = 50) -> Dict[str, Any]:
+    """
+    Process every bill end to end, once with an empty OCR cache and once warm
+
+    The LLM tier talks to an in-process llm_stub_server, so bills that
+    need it pay a realistic but fixed model latency.
+    """
+    config.LLM_SERVER_URL = _start_stub_llm_server(llm_latency_ms, ms_per_token=0.5)
+    # Imported here so the pipeline picks up the stub server and scratch directory
+    import pipeline
+
+    results: Dict[str, Any] = {"bills": len(filenames)}
+    try:
+        for label in ("cold", "warm"):
+            latencies, tiers, errors = [], {}, 0
+            start = time.perf_counter()
+            for number, filename in enumerate(filenames):
+                bill_start = time.perf_counter()
+                try:
+                    result = pipeline.process_document_task(filename, f"{label}-{number}")
+                    tier = result["extraction"]["tier"]
+                    tiers[tier] = tiers.get(tier, 0) + 1
+                except Exception:
+                    errors += 1
+                latencies.append(time.perf_counter() - bill_start)
+            elapsed = time.perf_counter() - start
+
+            results[label] = dict(summarize(latencies), bills_per_second=len(filenames) / elapsed,
+                                  tiers=tiers, errors=errors)
+    finally:
+        pipeline.document_processor.ocr_engine.shutdown()
+    return results
+
+def benchmark_upload(filenames: List[str], requests: int = 200, concurrency: int = 16) -> Dict[str, Any]:
+    """
+    Post bills to /upload-bill/ with `concurrency` requests in flight
+
+    Requests go through the ASGI app in process (no sockets), so this
+    measures the API's own cost: multipart parsing, writing the file and
+    enqueueing the job.
+    """
+    import httpx
+    import main
+
+    payloads = []
+    for filename in filenames:
+        with open(os.path.join("uploads", filename), "rb") as f:
+            payloads.append((filename, f.read()))
+
+    async def run() -> Dict[str, Any]:
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies: List[float] = []
+
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app),
+                                     base_url="http://benchmark") as client:
+            async def upload(number: int) -> int:
+                filename, content = payloads[number % len(payloads)]
+                async with semaphore:
+                    start = time.perf_counter()
+                    response = await client.post("/upload-bill/", files={"file": (filename, content)})
+                    latencies.append(time.perf_counter() - start)
+                    return response.status_code
+
+            start = time.perf_counter()
+            statuses = await asyncio.gather(*(upload(number) for number in range(requests)))
+            elapsed = time.perf_counter() - start
+
+        return dict(summarize(latencies), concurrency=concurrency, requests_per_second=requests / elapsed,
+                    errors=sum(1 for status in statuses if status != 200))
+
+    return asyncio.run(run())
+
+# Imports the entry module of a process and prints its startup report
+STARTUP_PROBE = """
+import json, time
+started = time.perf_counter()
+import {module}
+from telemetry import startup_report
+print(json.dumps(startup_report(started, time.perf_counter())))
+"""
+
+def benchmark_startup(runs: int = 5) -> Dict[str, Any]:
+    """
+    Cold-start cost of an API process (main) and a worker process (pipeline)
+
+    Each run imports the entry module in a fresh interpreter, so the
+    figures include everything a new replica pays before serving.
+    """
+    repo = os.path.dirname(os.path.abspath(__file__))
+    environment = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [repo, os.environ.get("PYTHONPATH")])))
+    results = {}
+
+    with workspace([]):
+        for role, module in (("api", "main"), ("worker", "pipeline")):
+            reports = []
+            for _ in range(runs):
+                output = subprocess.run([sys.executable, "-c", STARTUP_PROBE.format(module=module)],
+                                        capture_output=True, text=True, check=True, env=environment).stdout
+                reports.append(json.loads(output.strip().splitlines()[-1]))
+            results[role] = dict(
+                summarize([report["import_seconds"] for report in reports]),
+                peak_rss_mb=max(report["peak_rss_bytes"] for report in reports) / 2 ** 20,
+                worker_only_modules=", ".join(reports[-1]["worker_only_modules"]) or "none"
+            )
+    return results
+
+def run_suite(corpus: List[str], args: argparse.Namespace) -> Dict[str, Any]:
+    """Run the selected offline benchmarks on the corpus in a scratch directory"""
+    results: Dict[str, Any] = {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "ocr_backend": config.OCR_BACKEND,
+            "ocr_workers": config.OCR_WORKERS,
+            "corpus": [os.path.basename(path) for path in corpus]
+        }
+    }
+    with workspace(corpus) as filenames:
+        if args.command in ("stages", "suite"):
+            results["stages"] = benchmark_stages(filenames, args.templates, args.runs)
+        if args.command in ("pipeline", "suite"):
+            results["pipeline"] = benchmark_pipeline(filenames, args.llm_latency_ms)
+        if args.command in ("upload", "suite"):
+            results["upload"] = benchmark_upload(filenames, args.requests, args.upload_concurrency)
+    results["peak_rss_mb"] = peak_rss_mb()
+    return results
+
+def flatten_metrics(results: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    """Latency (*_s) and throughput (*_per_second) figures keyed by dotted path"""
+    metrics = {}
+    for key, value in results.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            metrics.update(flatten_metrics(value, path + "."))
+        elif isinstance(value, (int, float)) and key.endswith(("p50_s", "p95_s", "_per_second")):
+            metrics[path] = value
+    return metrics
+
+def compare_to_baseline(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    Figures that got worse than the baseline by more than `tolerance`
+
+    Latencies regress when they grow, throughputs when they shrink; in
+    either case the time per item must grow by at least
+    MIN_REGRESSION_S. Figures missing from either run are not compared.
+    """
+    current, previous = flatten_metrics(results), flatten_metrics(baseline)
+    regressions = []
+    for path, value in sorted(current.items()):
+        if path not in previous or not previous[path] or not value:
+            continue
+        change = value / previous[path] - 1
+        if path.endswith("_per_second"):
+            change = -change
+            if 1 / value - 1 / previous[path] < MIN_REGRESSION_S:
+                continue
+        elif value - previous[path] < MIN_REGRESSION_S:
+            continue
+        if change > tolerance:
+            regressions.append(f"{path}: {previous[path]:.4g} -> {value:.4g} ({change:+.0%} worse)")
+    return regressions
+
+def print_results(results: Dict[str, Any], indent: int = 0):
+    """Print nested results, one line per latency summary"""
+    pad = " " * indent
+    for key, value in results.items():
+        if isinstance(value, dict) and "p50_s" in value:
+            extra = "  ".join(f"{name} {value[name]:.2f}" if isinstance(value[name], float) else f"{name} {value[name]}"
+                              for name in value if name not in ("runs", "mean_s", "p50_s", "p95_s"))
+            print(f"{pad}{key:20} runs {value['runs']:4}  p50 {value['p50_s'] * 1000:9.1f} ms  "
+                  f"p95 {value['p95_s'] * 1000:9.1f} ms  {extra}".rstrip())
+        elif isinstance(value, dict):
+            print(f"{pad}{key}:")
+            print_results(value, indent + 2)
+        elif isinstance(value, list):
+            print(f"{pad}{key}: {len(value)} items")
+        else:
+            print(f"{pad}{key}: {value:.1f}" if isinstance(value, float) else f"{pad}{key}: {value}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Bill processing benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ocr_parser = subparsers.add_parser("ocr-backends", help="Compare per-page OCR backend overhead")
+    ocr_parser.add_argument("--image", help="Page image to OCR (default: first sample upload)")
+    ocr_parser.add_argument("--runs", type=int, default=5)
+
+    llm_parser = subparsers.add_parser("llm", help="LLM extraction throughput against a local server")
+    llm_parser.add_argument("--server", help="LLM server URL (default: start llm_stub_server)")
+    llm_parser.add_argument("--bills", type=int, default=20)
+    llm_parser.add_argument("--concurrency", type=int, default=4)
+
+    suite_options = argparse.ArgumentParser(add_help=False)
+    suite_options.add_argument("--corpus", nargs="+", help="Glob patterns of bills (default: the sample uploads)")
+    suite_options.add_argument("--templates", type=int, default=200,
+                               help="Synthetic templates to identify among")
+    suite_options.add_argument("--runs", type=int, default=3, help="Timed runs per stage and page")
+    suite_options.add_argument("--llm-latency-ms", type=float, default=50, help="Stub LLM latency per call")
+    suite_options.add_argument("--requests", type=int, default=200, help="Uploads to post")
+    suite_options.add_argument("--upload-concurrency", type=int, default=16, help="Uploads in flight at once")
+    suite_options.add_argument("--json", help="Also write the results to this file")
+    suite_options.add_argument("--save-baseline", nargs="?", const=DEFAULT_BASELINE,
+                               help=f"Store the results as the baseline at this path (default {DEFAULT_BASELINE})")
+    suite_options.add_argument("--baseline", nargs="?", const=DEFAULT_BASELINE,
+                               help=f"Compare against the baseline at this path (default {DEFAULT_BASELINE})")
+    suite_options.add_argument("--tolerance", type=float, default=0.25,
+                               help="Allowed slowdown before a figure counts as a regression")
+    subparsers.add_parser("stages", parents=[suite_options], help="Per-stage latencies on the corpus")
+    subparsers.add_parser("pipeline", parents=[suite_options], help="End-to-end bills/s with a stub LLM")
+    subparsers.add_parser("upload", parents=[suite_options], help="Upload endpoint under concurrent load")
+    subparsers.add_parser("suite", parents=[suite_options], help="stages, pipeline and upload together")
+
+    startup_parser = subparsers.add_parser("startup", help="Cold import time and memory of API and worker processes")
+    startup_parser.add_argument("--runs", type=int, default=5)
+
+    args = parser.parse_args()
+
+    if args.command == "ocr-backends":
+        results = benchmark_ocr_backends(args.image or _sample_image(), args.runs)
+        for name, result in results.items():
+            if not result["available"]:
+                print(f"{name:12} unavailable: {result['error']}")
+                continue
+            line = (f"{name:12} tesseract {result['version']:8} "
+                    f"startup {result['startup_s'] * 1000:8.1f} ms  "
+                    f"per page {result['per_page_median_s'] * 1000:8.1f} ms")
+            if "saved_per_page_s" in result and name != "pytesseract":
+                line += f"  saved {result['saved_per_page_s'] * 1000:8.1f} ms/page"
+            print(line)
+
+    elif args.command == "llm":
+        results = benchmark_llm(args.server or _start_stub_llm_server(), args.bills, args.concurrency)
+        print(f"{results['bills']} bills, {results['chunks_per_bill']} chunks per bill")
+        for label in ("sequential", "concurrent"):
+            result = results[label]
+            print(f"{label:12} concurrency {result['concurrency']:3}  "
+                  f"{result['seconds']:7.2f} s  {result['bills_per_second']:7.2f} bills/s  "
+                  f"errors {result['errors']}")
+
+    elif args.command == "startup":
+        print_results(benchmark_startup(args.runs))
+
+    else:
+        results = run_suite(find_corpus(args.corpus), args)
+        print_results({key: value for key, value in results.items() if key != "environment"})
+
+        for path in (args.json, args.save_baseline):
+            if path:
+                if os.path.dirname(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "w") as f:
+                    json.dump(results, f, indent=2)
+        if args.baseline:
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+            for key, value in baseline.get("environment", {}).items():
+                if key != "corpus" and results["environment"].get(key) != value:
+                    print(f"WARNING baseline {key} was {value}, now {results['environment'].get(key)}; "
+                          "timings may not be comparable")
+            regressions = compare_to_baseline(results, baseline, args.tolerance)
+            for regression in regressions:
+                print(f"REGRESSION {regression}")
+            if regressions:
+                sys.exit(1)
+            print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# cache.py
+import os
+import json
+import time
+import sqlite3
+import hashlib
+from typing import Dict, Any, Optional
+
+import config
+
+def hash_file(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """SHA-256 of a file's bytes, read in chunks"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def hash_text(text: str) -> str:
+    """SHA-256 of a text's UTF-8 encoding"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def cache_key(*parts: Any) -> str:
+    """Combine several key parts (hashes, versions, settings) into one key"""
+    return hashlib.sha256("\x00".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+
+class ResultCache:
+    """
+    Content-addressed, size-bounded cache for OCR and extraction results
+
+    Values are stored as JSON in a SQLite file, grouped by namespace
+    ("ocr", "llm"). Least recently used entries are evicted once the
+    stored values exceed max_bytes. Hit/miss counters live in the same
+    database, so every API and worker process sharing the cache directory
+    reports the same numbers.
+    """
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.cache_dir = cache_dir or config.CACHE_DIR
+        self.max_bytes = config.CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.db_path = os.path.join(self.cache_dir, "cache.db")
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_access REAL NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_access)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS stats (
+                    namespace TEXT PRIMARY KEY,
+                    hits INTEGER NOT NULL DEFAULT 0,
+                    misses INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _count(self, conn: sqlite3.Connection, namespace: str, column: str):
+        conn.execute("INSERT OR IGNORE INTO stats (namespace) VALUES (?)", (namespace,))
+        conn.execute(f"UPDATE stats SET {column} = {column} + 1 WHERE namespace = ?", (namespace,))
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        """Return the cached value, or None on a miss"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value FROM entries WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+
+            if row is None:
+                self._count(conn, namespace, "misses")
+                return None
+
+            conn.execute(
+                "UPDATE entries SET last_access = ? WHERE namespace = ? AND key = ?",
+                (time.time(), namespace, key)
+            )
+            self._count(conn, namespace, "hits")
+            return json.loads(row[0])
+
+    def put(self, namespace: str, key: str, value: Any):
+        """Store a JSON-serializable value, evicting old entries if needed"""
+        data = json.dumps(value).encode("utf-8")
+        if len(data) > self.max_bytes:
+            return
+
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (namespace, key, value, size, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (namespace, key, data, len(data), time.time())
+            )
+            self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection):
+        """Drop least recently used entries until the cache fits max_bytes"""
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        rows = conn.execute("SELECT namespace, key, size FROM entries ORDER BY last_access")
+        evicted = []
+        for namespace, key, size in rows:
+            if total <= self.max_bytes:
+                break
+            evicted.append((namespace, key))
+            total -= size
+        conn.executemany("DELETE FROM entries WHERE namespace = ? AND key = ?", evicted)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Hit/miss counters and stored size per namespace"""
+        with self._connect() as conn:
+            stats = {
+                namespace: {"hits": hits, "misses": misses, "entries": 0, "bytes": 0}
+                for namespace, hits, misses in conn.execute("SELECT namespace, hits, misses FROM stats")
+            }
+            for namespace, entries, size in conn.execute(
+                "SELECT namespace, COUNT(*), SUM(size) FROM entries GROUP BY namespace"
+            ):
+                stats.setdefault(namespace, {"hits": 0, "misses": 0})
+                stats[namespace].update({"entries": entries, "bytes": size})
+
+        for counters in stats.values():
+            lookups = counters["hits"] + counters["misses"]
+            counters["hit_rate"] = counters["hits"] / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,121 @@
+# config.py
+import os
+from dotenv import load_dotenv
+
+# Settings can be overridden through the environment or a .env file
+load_dotenv()
+
+def _env_int(name: str, default: int) -> int:
+    """Read an integer setting, falling back to the default when unset"""
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+# OCR engine
+# Worker processes per node (python worker.py); each has its own pool of
+# OCR_WORKERS processes, which by default share the cores between them
+WORKER_CONCURRENCY = _env_int("WORKER_CONCURRENCY", 2)
+# Jobs each worker process runs at once. They share its OCR pool, and
+# their LLM calls are made concurrently (up to LLM_CONCURRENCY), so one
+# bill waiting on the model does not hold up the next
+WORKER_THREADS = _env_int("WORKER_THREADS", 4)
+# Number of OCR worker processes; 0 or 1 runs OCR inline in the caller
+OCR_WORKERS = _env_int("OCR_WORKERS", max(1, (os.cpu_count() or 1) // max(1, WORKER_CONCURRENCY)))
+# Maximum number of pages submitted to the pool but not yet finished,
+# shared by every document being processed at the same time
+OCR_QUEUE_DEPTH = _env_int("OCR_QUEUE_DEPTH", 2 * OCR_WORKERS)
+# OCR backend: "tesserocr" keeps tesseract loaded in each worker,
+# "pytesseract" spawns the tesseract binary per page, "auto" prefers tesserocr
+OCR_BACKEND = os.getenv("OCR_BACKEND", "auto")
+
+# Default image preprocessing profile: "fast", "balanced", "quality" or
+# "auto" (measure each page and pick the cheapest adequate profile).
+# Templates can override it with {"preprocessing": {"profile": ...}}.
+PREPROCESS_PROFILE = os.getenv("PREPROCESS_PROFILE", "auto")
+
+# Result cache: OCR text keyed by file hash, LLM output keyed by text hash
+CACHE_DIR = os.getenv("CACHE_DIR", "cache")
+CACHE_MAX_BYTES = _env_int("CACHE_MAX_BYTES", 512 * 1024 * 1024)
+
+# Job queue and workers (python worker.py)
+QUEUE_DB_PATH = os.getenv("QUEUE_DB_PATH", "queue/jobs.db")
+WORKER_POLL_INTERVAL = float(os.getenv("WORKER_POLL_INTERVAL", "0.5"))
+JOB_MAX_ATTEMPTS = _env_int("JOB_MAX_ATTEMPTS", 3)
+# Seconds a claimed job stays invisible to other workers without a heartbeat
+JOB_VISIBILITY_TIMEOUT = _env_int("JOB_VISIBILITY_TIMEOUT", 120)
+JOB_RETRY_BASE_DELAY = _env_int("JOB_RETRY_BASE_DELAY", 5)
+JOB_RETRY_MAX_DELAY = _env_int("JOB_RETRY_MAX_DELAY", 300)
+
+# Uploads: each file may be at most MAX_UPLOAD_BYTES (zip archives
+# included), and a request body at most MAX_REQUEST_BYTES; larger ones
+# are rejected with 413 before they are written to uploads/
+MAX_UPLOAD_BYTES = _env_int("MAX_UPLOAD_BYTES", 50 * 1024 * 1024)
+MAX_REQUEST_BYTES = _env_int("MAX_REQUEST_BYTES", 500 * 1024 * 1024)
+
+# Status push: the API checks the queue for job state changes every
+# STATUS_WATCH_INTERVAL seconds and pushes them to subscribers
+STATUS_WATCH_INTERVAL = float(os.getenv("STATUS_WATCH_INTERVAL", "0.5"))
+# Bills whose latest status is kept in memory for GET /bill/{id}
+STATUS_INDEX_SIZE = _env_int("STATUS_INDEX_SIZE", 10000)
+# Seconds between keep-alives on idle event streams
+EVENTS_KEEPALIVE_INTERVAL = float(os.getenv("EVENTS_KEEPALIVE_INTERVAL", "15"))
+
+# Templates: their metadata (names, keywords, required fields) is indexed
+# in TEMPLATE_INDEX_PATH, so processes only parse template files that
+# changed; each process checks templates/ for changes every
+# TEMPLATE_POLL_INTERVAL seconds
+TEMPLATE_INDEX_PATH = os.getenv("TEMPLATE_INDEX_PATH", os.path.join(CACHE_DIR, "templates.db"))
+TEMPLATE_POLL_INTERVAL = float(os.getenv("TEMPLATE_POLL_INTERVAL", "2"))
+
+# Result store for processed bills ("sqlite")
+RESULT_STORE = os.getenv("RESULT_STORE", "sqlite")
+RESULTS_DB_PATH = os.getenv("RESULTS_DB_PATH", "processed/results.db")
+
+# LLM extraction
+# Base URL of an HTTP model server (see llm_stub_server.py); when unset the
+# HuggingFace Hub model is used
+LLM_SERVER_URL = os.getenv("LLM_SERVER_URL", "")
+# Model calls in flight at once per process, across the chunks and bills
+# being extracted
+LLM_CONCURRENCY = _env_int("LLM_CONCURRENCY", 4)
+# Approximate prompt tokens of bill text per model call, and chunks per bill
+LLM_TOKEN_BUDGET = _env_int("LLM_TOKEN_BUDGET", 1500)
+LLM_MAX_CHUNKS = _env_int("LLM_MAX_CHUNKS", 3)
+
+# Shared local model server (python llm_server.py), one per node. When
+# LOCAL_LLM_URL is set (and LLM_SERVER_URL is not) workers extract with it
+LOCAL_LLM_URL = os.getenv("LOCAL_LLM_URL", "")
+LOCAL_LLM_MODEL_PATH = os.getenv("LOCAL_LLM_MODEL_PATH", "models/llama-3-8b.gguf")
+LOCAL_LLM_CONTEXT = _env_int("LOCAL_LLM_CONTEXT", 4096)
+# Prompt prefix states the server keeps (one per distinct instruction block)
+LOCAL_LLM_PREFIX_CACHE = _env_int("LOCAL_LLM_PREFIX_CACHE", 8)
+
+# Layout-aware OCR for templates that declare regions of interest: the
+# top HEADER_FRACTION of page 1 is read at HEADER_DPI to identify the
+# vendor, then just the template's regions are read at REGION_DPI
+HEADER_DPI = _env_int("HEADER_DPI", 100)
+HEADER_FRACTION = float(os.getenv("HEADER_FRACTION", "0.2"))
+REGION_DPI = _env_int("REGION_DPI", 400)
+
+# Route bills to a template before OCR by a perceptual hash of page 1's
+# header (rendered at HEADER_DPI), learned from bills whose template was
+# given or identified with every required field found. A match must be
+# within FINGERPRINT_MAX_DISTANCE of 128 bits
+FINGERPRINT_ROUTING = os.getenv("FINGERPRINT_ROUTING", "1").lower() not in ("0", "false", "no")
+FINGERPRINT_DB_PATH = os.getenv("FINGERPRINT_DB_PATH", "processed/fingerprints.db")
+FINGERPRINT_MAX_DISTANCE = _env_int("FINGERPRINT_MAX_DISTANCE", 20)
+
+# Resolution full pages of PDFs are rendered at for OCR
+RASTER_DPI = _env_int("RASTER_DPI", 300)
+# Before OCR, turn and straighten each page, crop it to its content and
+# rescale it so its text has an x-height of about PAGE_X_HEIGHT pixels
+PAGE_ANALYSIS = os.getenv("PAGE_ANALYSIS", "1").lower() not in ("0", "false", "no")
+PAGE_X_HEIGHT = _env_int("PAGE_X_HEIGHT", 20)
+# Read digitally generated PDFs from their embedded text layer, OCRing only
+# pages where it is missing or unusable
+PDF_TEXT_LAYER = os.getenv("PDF_TEXT_LAYER", "1").lower() not in ("0", "false", "no")
+
+# Observability: per-stage timings and counters from the API and every
+# worker are collected in METRICS_DB_PATH and served at GET /metrics
+METRICS_DB_PATH = os.getenv("METRICS_DB_PATH", "queue/metrics.db")
+# Log level of the API and workers; DEBUG logs every stage of every bill
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
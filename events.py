@@ -0,0 +1,113 @@
+# events.py
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, Any, Set, Callable, Optional
+
+from job_queue import JobQueue
+
+logger = logging.getLogger(__name__)
+
+class EventBus:
+    """
+    In-process publish/subscribe for bill status events
+
+    Each subscriber gets its own asyncio.Queue for a topic such as
+    "bill:<bill_id>" or "batch:<batch_id>". publish never blocks and must
+    be called from the event loop thread.
+    """
+    def __init__(self):
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+
+    def subscribe(self, topic: str) -> asyncio.Queue:
+        queue = asyncio.Queue()
+        self._subscribers.setdefault(topic, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, topic: str, queue: asyncio.Queue):
+        subscribers = self._subscribers.get(topic)
+        if subscribers is not None:
+            subscribers.discard(queue)
+            if not subscribers:
+                del self._subscribers[topic]
+
+    def publish(self, topic: str, event: Dict[str, Any]):
+        for queue in self._subscribers.get(topic, ()):
+            queue.put_nowait(event)
+
+    def subscriber_count(self) -> int:
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+class StatusIndex:
+    """
+    In-memory index of the latest status payload per bill
+
+    Holds at most max_size bills, dropping the least recently used.
+    """
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._statuses: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def get(self, bill_id: str) -> Optional[Dict[str, Any]]:
+        status = self._statuses.get(bill_id)
+        if status is not None:
+            self._statuses.move_to_end(bill_id)
+        return status
+
+    def put(self, bill_id: str, status: Dict[str, Any]):
+        self._statuses[bill_id] = status
+        self._statuses.move_to_end(bill_id)
+        while len(self._statuses) > self.max_size:
+            self._statuses.popitem(last=False)
+
+class StatusWatcher:
+    """
+    Turns job queue changes into status index updates and pushed events
+
+    Workers run in other processes, so one background task in the API
+    polls the queue for recently updated jobs: a single indexed query per
+    interval, however many clients are subscribed. Each status change is
+    written to the index and published on "bill:<id>" and, for batch
+    uploads, "batch:<id>".
+    """
+    # Re-read a few seconds of history each time so updates committed
+    # slightly out of timestamp order are not missed; repeats are ignored
+    OVERLAP = 5.0
+
+    def __init__(self, job_queue: JobQueue, bus: EventBus, index: StatusIndex,
+                 build_status: Callable[[Dict[str, Any]], Dict[str, Any]], interval: float):
+        self.job_queue = job_queue
+        self.bus = bus
+        self.index = index
+        self.build_status = build_status
+        self.interval = interval
+        self._cursor = time.time()
+
+    async def run(self):
+        while True:
+            try:
+                await self.poll()
+            except Exception as e:
+                logger.warning("Error watching job queue: %s", e)
+            await asyncio.sleep(self.interval)
+
+    async def poll(self):
+        """Publish every job state change since the last poll"""
+        jobs = await asyncio.to_thread(self.job_queue.get_updated_since, self._cursor - self.OVERLAP)
+
+        for job in jobs:
+            self._cursor = max(self._cursor, job["updated_at"])
+
+            known = self.index.get(job["bill_id"])
+            if known is not None and known.get("job_id", 0) > job["id"]:
+                continue  # Superseded by a newer job (reprocessing)
+            if known is not None and (known.get("job_id"), known.get("queue_status"), known.get("attempts")) == \
+                    (job["id"], job["status"], job["attempts"]):
+                continue  # Already published
+
+            status = await asyncio.to_thread(self.build_status, job)
+            self.index.put(job["bill_id"], status)
+            self.bus.publish(f"bill:{job['bill_id']}", status)
+            if job["batch_id"]:
+                self.bus.publish(f"batch:{job['batch_id']}", status)
@@ -0,0 +1,155 @@
+# field_extractor.py
+import re
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Value patterns by field type. They must not contain capturing groups,
+# as the compiler adds its own around them
+VALUE_PATTERNS = {
+    "string": r"[a-z0-9][a-z0-9\-/*]*",
+    "number": r"\d+(?:,\d+)*(?:\.\d+)?",
+    "date": r"\d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4}",
+}
+# Between an anchor keyword and its value
+DEFAULT_SEPARATOR = r"[\s:#.)]*"
+# Numbers may follow a currency symbol
+CURRENCY_PREFIX = r"(?:rs\.?|inr|[\$£€₹])?\s*"
+
+# Generic fields found on most bills, used when the template is unknown
+GENERIC_RULES = {
+    # Invoice numbers contain a digit, which keeps "Invoice Date" from
+    # reading as invoice number "Date"
+    "invoice_number": {"anchors": ["invoice number", "invoice no", "inv no", "invoice", "inv"],
+                       "type": "string", "pattern": r"(?=[a-z0-9\-/]*\d)[a-z0-9][a-z0-9\-/]*"},
+    "date": {"anchors": ["invoice date", "date"], "type": "date"},
+    "total_amount": {"anchors": ["total", "amount due", "balance due"], "type": "number"},
+}
+
+def _anchor_pattern(anchor: str) -> str:
+    """
+    Literal keyword, whole words only
+
+    Any punctuation or whitespace may separate its words, so "pres rdg"
+    matches "Pres. Rdg." and "consumption units" "Consumption(Units)".
+    """
+    words = [re.escape(word) for word in anchor.split()]
+    return r"\b" + r"\W+".join(words) + r"\b"
+
+def parse_value(value: str, parse: str) -> Any:
+    """Convert a matched value; numbers lose currency symbols and separators"""
+    value = value.strip()
+    if parse == "number":
+        try:
+            return float(re.sub(r"[^\d.\-]", "", value))
+        except ValueError:
+            return None
+    return value
+
+class TemplateExtractor:
+    """
+    All field rules of a template compiled into one regex
+
+    A rule is the field's config with "anchors" (keywords the value
+    follows) and/or "pattern":
+
+        {"type": "number", "anchors": ["units consumed", "usage"]}
+        {"type": "string", "anchors": ["account id"], "pattern": "[A-Z0-9*]+"}
+        {"type": "string", "pattern": "Period\\s*:\\s*([^\\n]+)"}
+
+    With anchors, "pattern" is the value pattern (the type's default when
+    omitted) and "separator" what may come between anchor and value.
+    Without anchors, "pattern" is a full regex whose first group, or the
+    whole match, is the value. "parse" is "number" or "string" (defaults
+    to "number" for number fields). Matching ignores case.
+
+    The rules are joined into a single lookahead alternation, so the text
+    is scanned once for every field, and each field keeps its first match.
+    At a position where several rules match, the alternation reports
+    only the first of them; the later ones are then tried at that
+    position alone, so no field hides another.
+    """
+    def __init__(self, rules: Dict[str, Dict[str, Any]]):
+        # (field, value group, parse, the rule's own regex, its value group)
+        self.fields: List[Tuple[str, int, str, re.Pattern, int]] = []
+        self._outer_groups: Dict[int, int] = {}  # Alternative group -> index in self.fields
+        alternatives = []
+        group = 1
+
+        for field, rule in rules.items():
+            alternative = self._compile_rule(field, rule)
+            if alternative is None:
+                continue
+            source, compiled = alternative
+            inner_groups = compiled.groups
+            value_group = group + 1 if inner_groups else group
+            self._outer_groups[group] = len(self.fields)
+            self.fields.append((field, value_group, rule.get("parse") or
+                                ("number" if rule.get("type") == "number" else "string"),
+                                compiled, 1 if inner_groups else 0))
+            alternatives.append(f"({source})")
+            group += 1 + inner_groups
+
+        # Zero-width matches, so one field's match cannot hide another's
+        # that starts inside it (fields matching at the same position are
+        # handled in extract)
+        self.regex: Optional[re.Pattern] = None
+        if alternatives:
+            self.regex = re.compile(f"(?={'|'.join(alternatives)})", re.IGNORECASE | re.MULTILINE)
+
+    @staticmethod
+    def _compile_rule(field: str, rule: Dict[str, Any]) -> Optional[Tuple[str, re.Pattern]]:
+        """Regex source for one rule, and the rule compiled on its own"""
+        anchors = rule.get("anchors") or []
+        pattern = rule.get("pattern")
+        if not anchors and not pattern:
+            return None
+
+        if anchors:
+            value = pattern or VALUE_PATTERNS.get(rule.get("type"), VALUE_PATTERNS["string"])
+            separator = rule.get("separator", DEFAULT_SEPARATOR)
+            if rule.get("type") == "number" and "separator" not in rule:
+                separator += CURRENCY_PREFIX
+            anchor = "|".join(_anchor_pattern(anchor) for anchor in anchors)
+            source = f"(?:{anchor}){separator}({value})"
+        else:
+            source = pattern
+
+        try:
+            compiled = re.compile(source, re.IGNORECASE | re.MULTILINE)
+        except re.error as e:
+            logger.warning("Skipping extraction rule for %s: %s", field, e)
+            return None
+        return source, compiled
+
+    def extract(self, text: str) -> Dict[str, Any]:
+        """Values of every field whose rule matched, by field name"""
+        extracted: Dict[str, Any] = {}
+        if self.regex is None:
+            return extracted
+
+        for match in self.regex.finditer(text):
+            first = self._outer_groups[match.lastindex]
+            field, value_group, parse, _, _ = self.fields[first]
+            if field not in extracted and match.group(value_group) is not None:
+                value = parse_value(match.group(value_group), parse)
+                if value is not None:
+                    extracted[field] = value
+
+            # Later rules matching here too were not reported
+            for field, _, parse, compiled, own_group in self.fields[first + 1:]:
+                if field in extracted:
+                    continue
+                own = compiled.match(text, match.start())
+                if own is not None and own.group(own_group) is not None:
+                    value = parse_value(own.group(own_group), parse)
+                    if value is not None:
+                        extracted[field] = value
+
+            if len(extracted) == len(self.fields):
+                break
+
+        return extracted
+
+GENERIC_EXTRACTOR = TemplateExtractor(GENERIC_RULES)
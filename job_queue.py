@@ -0,0 +1,249 @@
+# job_queue.py
+import os
+import time
+import sqlite3
+from typing import Dict, Any, List, Optional
+
+import config
+
+# Job states:
+#   queued -> processing -> completed
+#                        -> queued (failed, retried after a backoff)
+#                        -> error  (failed on its last attempt)
+# A processing job whose visibility timeout runs out (crashed or stuck
+# worker) goes back to queued, or to error once it has used its attempts.
+STATUS_QUEUED = "queued"
+STATUS_PROCESSING = "processing"
+STATUS_COMPLETED = "completed"
+STATUS_ERROR = "error"
+
+class JobQueue:
+    """
+    Durable, SQLite-backed queue of bill processing jobs
+
+    Jobs survive API and worker restarts. Workers in any process claim
+    jobs atomically, highest priority first, and hold them for a
+    visibility timeout that they extend with heartbeats while working.
+    """
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or config.QUEUE_DB_PATH
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    bill_id TEXT NOT NULL,
+                    filename TEXT NOT NULL,
+                    template_id TEXT,
+                    status TEXT NOT NULL,
+                    priority INTEGER NOT NULL DEFAULT 0,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL,
+                    available_at REAL NOT NULL,
+                    locked_until REAL,
+                    worker_id TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            # Columns added after the first release
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "batch_id" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN batch_id TEXT")
+            if "file_hash" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN file_hash TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, priority DESC, available_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_bill ON jobs (bill_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_batch ON jobs (batch_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_updated ON jobs (updated_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def enqueue(self, bill_id: str, filename: str, template_id: Optional[str] = None,
+                priority: int = 0, file_hash: Optional[str] = None) -> int:
+        """Add a job to the queue and return its id"""
+        return self.enqueue_many([{
+            "bill_id": bill_id,
+            "filename": filename,
+            "template_id": template_id,
+            "priority": priority,
+            "file_hash": file_hash
+        }])[0]
+
+    def enqueue_many(self, jobs: List[Dict[str, Any]], batch_id: Optional[str] = None) -> List[int]:
+        """
+        Add several jobs in a single transaction and return their ids
+
+        Each job is a dict with bill_id, filename and optionally
+        template_id, priority and file_hash (SHA-256 of the upload, when
+        the API already computed it).
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            job_ids = [
+                conn.execute(
+                    "INSERT INTO jobs (bill_id, filename, template_id, batch_id, file_hash, status, priority, "
+                    "max_attempts, available_at, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (job["bill_id"], job["filename"], job.get("template_id"), batch_id, job.get("file_hash"),
+                     STATUS_QUEUED, job.get("priority", 0), config.JOB_MAX_ATTEMPTS, now, now, now)
+                ).lastrowid
+                for job in jobs
+            ]
+            conn.execute("COMMIT")
+            return job_ids
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Claim the next runnable job for a worker, or return None
+
+        Jobs abandoned by crashed workers are requeued (or failed) first.
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            self._release_expired(conn, now)
+
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = ? AND available_at <= ? "
+                "ORDER BY priority DESC, available_at, id LIMIT 1",
+                (STATUS_QUEUED, now)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+
+            conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, locked_until = ?, "
+                "worker_id = ?, updated_at = ? WHERE id = ?",
+                (STATUS_PROCESSING, now + config.JOB_VISIBILITY_TIMEOUT, worker_id, now, row["id"])
+            )
+            conn.execute("COMMIT")
+
+            job = dict(row)
+            job.update(status=STATUS_PROCESSING, attempts=row["attempts"] + 1, worker_id=worker_id)
+            return job
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _release_expired(self, conn: sqlite3.Connection, now: float):
+        """Return jobs whose visibility timeout ran out to the queue"""
+        conn.execute(
+            "UPDATE jobs SET status = ?, error = ?, locked_until = NULL, updated_at = ? "
+            "WHERE status = ? AND locked_until < ? AND attempts >= max_attempts",
+            (STATUS_ERROR, "Worker stopped responding", now, STATUS_PROCESSING, now)
+        )
+        conn.execute(
+            "UPDATE jobs SET status = ?, locked_until = NULL, available_at = ?, updated_at = ? "
+            "WHERE status = ? AND locked_until < ?",
+            (STATUS_QUEUED, now, now, STATUS_PROCESSING, now)
+        )
+
+    def heartbeat(self, job_id: int, worker_id: str) -> bool:
+        """Extend a claimed job's visibility timeout; False if the job was lost"""
+        # updated_at only moves on state changes, which status watchers rely on
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET locked_until = ? WHERE id = ? AND worker_id = ? AND status = ?",
+                (time.time() + config.JOB_VISIBILITY_TIMEOUT, job_id, worker_id, STATUS_PROCESSING)
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, job_id: int, worker_id: str) -> bool:
+        """Mark a claimed job as completed"""
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, error = NULL, locked_until = NULL, updated_at = ? "
+                "WHERE id = ? AND worker_id = ? AND status = ?",
+                (STATUS_COMPLETED, now, job_id, worker_id, STATUS_PROCESSING)
+            )
+            return cursor.rowcount == 1
+
+    def fail(self, job_id: int, worker_id: str, error: str) -> Optional[str]:
+        """
+        Record a failed attempt
+
+        The job is retried after an exponential backoff while it has
+        attempts left, and marked as error otherwise. Returns the new
+        status, or None if the worker no longer owned the job.
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT attempts, max_attempts FROM jobs WHERE id = ? AND worker_id = ? AND status = ?",
+                (job_id, worker_id, STATUS_PROCESSING)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+
+            if row["attempts"] < row["max_attempts"]:
+                delay = min(config.JOB_RETRY_BASE_DELAY * 2 ** (row["attempts"] - 1),
+                            config.JOB_RETRY_MAX_DELAY)
+                status, available_at = STATUS_QUEUED, now + delay
+            else:
+                status, available_at = STATUS_ERROR, now
+
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, available_at = ?, locked_until = NULL, "
+                "updated_at = ? WHERE id = ?",
+                (status, error, available_at, now, job_id)
+            )
+            conn.execute("COMMIT")
+            return status
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def get_latest_job(self, bill_id: str) -> Optional[Dict[str, Any]]:
+        """Most recent job for a bill (reprocessing adds a new job)"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE bill_id = ? ORDER BY id DESC LIMIT 1", (bill_id,)
+            ).fetchone()
+            return dict(row) if row else None
+
+    def get_batch_jobs(self, batch_id: str) -> List[Dict[str, Any]]:
+        """All jobs enqueued together by a batch upload"""
+        with self._connect() as conn:
+            return [dict(row) for row in conn.execute(
+                "SELECT * FROM jobs WHERE batch_id = ? ORDER BY id", (batch_id,)
+            )]
+
+    def get_updated_since(self, since: float) -> List[Dict[str, Any]]:
+        """Jobs whose state changed at or after a timestamp, oldest first"""
+        with self._connect() as conn:
+            return [dict(row) for row in conn.execute(
+                "SELECT * FROM jobs WHERE updated_at >= ? ORDER BY updated_at, id", (since,)
+            )]
+
+    def counts(self) -> Dict[str, int]:
+        """Number of jobs in each state"""
+        with self._connect() as conn:
+            return {row["status"]: row["count"] for row in conn.execute(
+                "SELECT status, COUNT(*) AS count FROM jobs GROUP BY status"
+            )}
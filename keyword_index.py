@@ -0,0 +1,79 @@
+# keyword_index.py
+import re
+from typing import Dict, Any, List, Tuple
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased words of a text; punctuation and whitespace separate words"""
+    return TOKEN_PATTERN.findall(text.lower())
+
+def normalize_keyword(keyword: Any) -> Tuple[Tuple[str, ...], float]:
+    """
+    Words and weight of an identification keyword
+
+    Keywords are plain strings (weight 1) or {"keyword": ..., "weight": ...}.
+    """
+    if isinstance(keyword, dict):
+        return tuple(tokenize(str(keyword.get("keyword", "")))), float(keyword.get("weight", 1))
+    return tuple(tokenize(str(keyword))), 1.0
+
+class KeywordIndex:
+    """
+    Inverted index from keyword words to the templates that use them
+
+    Keywords are whole words or phrases, so "gas" does not match "Vegas".
+    Scoring tokenizes the text once and looks up each word, which costs
+    the same however many templates and keywords are indexed. Each
+    keyword counts once per template, with its weight, however often it
+    appears.
+    """
+    def __init__(self):
+        # First word -> [(phrase words, template_id, keyword number, weight)]
+        self._postings: Dict[str, List[Tuple[Tuple[str, ...], str, int, float]]] = {}
+        self._first_words: Dict[str, set] = {}
+
+    def copy(self) -> "KeywordIndex":
+        """An independent index with the same entries, to change without affecting this one"""
+        index = KeywordIndex()
+        index._postings = {word: list(postings) for word, postings in self._postings.items()}
+        index._first_words = dict(self._first_words)
+        return index
+
+    def add(self, template_id: str, keywords: List[Any]):
+        """Index a template's keywords, replacing any it had before"""
+        self.remove(template_id)
+        first_words = set()
+        for number, keyword in enumerate(keywords):
+            words, weight = normalize_keyword(keyword)
+            if not words:
+                continue
+            self._postings.setdefault(words[0], []).append((words, template_id, number, weight))
+            first_words.add(words[0])
+        self._first_words[template_id] = first_words
+
+    def remove(self, template_id: str):
+        """Drop a template's keywords from the index"""
+        for word in self._first_words.pop(template_id, ()):
+            postings = [posting for posting in self._postings[word] if posting[1] != template_id]
+            if postings:
+                self._postings[word] = postings
+            else:
+                del self._postings[word]
+
+    def score(self, text: str) -> Dict[str, float]:
+        """Summed weights of the keywords found in the text, by template"""
+        tokens = tokenize(text)
+        scores: Dict[str, float] = {}
+        seen = set()
+
+        for position, token in enumerate(tokens):
+            for words, template_id, number, weight in self._postings.get(token, ()):
+                if (template_id, number) in seen:
+                    continue
+                if len(words) > 1 and tuple(tokens[position:position + len(words)]) != words:
+                    continue
+                seen.add((template_id, number))
+                scores[template_id] = scores.get(template_id, 0.0) + weight
+
+        return scores
@@ -0,0 +1,196 @@
+# layout.py
+import xml.etree.ElementTree as ET
+from typing import Dict, Any, List, Sequence
+
+import numpy as np
+
+# Columns of Tesseract's TSV output (image_to_data)
+TSV_COLUMNS = ["level", "page_num", "block_num", "par_num", "line_num", "word_num",
+               "left", "top", "width", "height", "conf", "text"]
+WORD_LEVEL = 5
+
+# A PDF text layer is only trusted when a page has at least this many
+# words, mostly letters and digits, and no unmapped glyphs
+TEXT_LAYER_MIN_WORDS = 5
+TEXT_LAYER_MIN_ALNUM_RATIO = 0.6
+UNMAPPED_GLYPHS = ("\ufffd", "(cid:")
+
+def parse_tsv(tsv: str) -> Dict[str, List[Any]]:
+    """Tesseract TSV output as a dict of columns, like image_to_data's Output.DICT"""
+    data: Dict[str, List[Any]] = {column: [] for column in TSV_COLUMNS}
+    for row in tsv.splitlines():
+        values = row.split("\t")
+        if len(values) < len(TSV_COLUMNS) - 1 or values[0] == "level":
+            continue
+        values += [""] * (len(TSV_COLUMNS) - len(values))
+        for column, value in zip(TSV_COLUMNS, values):
+            data[column].append(value if column == "text" else float(value or -1))
+    return data
+
+class WordBoxes:
+    """
+    Words found on a page, with their boxes and confidences
+
+    Geometry lives in numpy arrays (one row per word) rather than one
+    dict per word, so a page of a few thousand words stays small and
+    regions can be selected with vectorized comparisons:
+
+        boxes       int32 (N, 4): left, top, width, height in pixels
+        confidences float32 (N,): Tesseract word confidence, 0-100
+        lines       int32 (N,):   line number, increasing in reading order
+        paragraphs  int32 (N,):   paragraph number, increasing in reading order
+
+    width and height are the size of the image the words were read from.
+    """
+    def __init__(self, words: List[str], boxes: np.ndarray, confidences: np.ndarray,
+                 lines: np.ndarray, paragraphs: np.ndarray, width: int, height: int):
+        self.words = words
+        self.boxes = boxes
+        self.confidences = confidences
+        self.lines = lines
+        self.paragraphs = paragraphs
+        self.width = width
+        self.height = height
+
+    @classmethod
+    def from_tesseract(cls, data: Dict[str, List[Any]], width: int, height: int) -> "WordBoxes":
+        """Build from image_to_data output (a dict of columns), keeping non-empty words"""
+        words, boxes, confidences, lines, paragraphs = [], [], [], [], []
+        line_ids: Dict[tuple, int] = {}
+        paragraph_ids: Dict[tuple, int] = {}
+
+        for index, text in enumerate(data["text"]):
+            text = str(text).strip()
+            if int(data["level"][index]) != WORD_LEVEL or not text:
+                continue
+            paragraph = (int(data["page_num"][index]), int(data["block_num"][index]), int(data["par_num"][index]))
+            line = paragraph + (int(data["line_num"][index]),)
+            words.append(text)
+            boxes.append(tuple(int(data[column][index]) for column in ("left", "top", "width", "height")))
+            confidences.append(float(data["conf"][index]))
+            lines.append(line_ids.setdefault(line, len(line_ids)))
+            paragraphs.append(paragraph_ids.setdefault(paragraph, len(paragraph_ids)))
+
+        return cls(
+            words,
+            np.array(boxes, dtype=np.int32).reshape(-1, 4),
+            np.array(confidences, dtype=np.float32),
+            np.array(lines, dtype=np.int32),
+            np.array(paragraphs, dtype=np.int32),
+            width, height
+        )
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def text(self) -> str:
+        """Words joined into lines, with a blank line between paragraphs"""
+        parts = []
+        for index, word in enumerate(self.words):
+            if index:
+                if self.paragraphs[index] != self.paragraphs[index - 1]:
+                    parts.append("\n\n")
+                elif self.lines[index] != self.lines[index - 1]:
+                    parts.append("\n")
+                else:
+                    parts.append(" ")
+            parts.append(word)
+        return "".join(parts)
+
+    def region(self, box: Sequence[float]) -> "WordBoxes":
+        """
+        Words whose centre lies inside a region of the page
+
+        box is (x0, y0, x1, y1) as fractions of the page width and height,
+        so the same region fits a page read at any resolution.
+        """
+        x0, y0, x1, y1 = box
+        centres_x = (self.boxes[:, 0] + self.boxes[:, 2] / 2) / max(self.width, 1)
+        centres_y = (self.boxes[:, 1] + self.boxes[:, 3] / 2) / max(self.height, 1)
+        keep = (centres_x >= x0) & (centres_x <= x1) & (centres_y >= y0) & (centres_y <= y1)
+        indices = np.flatnonzero(keep)
+
+        return WordBoxes(
+            [self.words[index] for index in indices],
+            self.boxes[indices], self.confidences[indices],
+            self.lines[indices], self.paragraphs[indices],
+            self.width, self.height
+        )
+
+    def mean_confidence(self) -> float:
+        """Mean word confidence, or 0 for a page with no words"""
+        valid = self.confidences[self.confidences >= 0]
+        return float(valid.mean()) if len(valid) else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-serializable form, for the result cache"""
+        return {
+            "words": self.words,
+            "boxes": self.boxes.tolist(),
+            "confidences": [round(float(conf), 1) for conf in self.confidences],
+            "lines": self.lines.tolist(),
+            "paragraphs": self.paragraphs.tolist(),
+            "width": self.width,
+            "height": self.height
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "WordBoxes":
+        return cls(
+            data["words"],
+            np.array(data["boxes"], dtype=np.int32).reshape(-1, 4),
+            np.array(data["confidences"], dtype=np.float32),
+            np.array(data["lines"], dtype=np.int32),
+            np.array(data["paragraphs"], dtype=np.int32),
+            data["width"], data["height"]
+        )
+
+def _local_name(element: ET.Element) -> str:
+    return element.tag.rsplit("}", 1)[-1]
+
+def parse_pdftotext_bbox(xhtml: str, scale: float) -> List[WordBoxes]:
+    """
+    Word boxes of every page in `pdftotext -bbox-layout` output
+
+    PDF coordinates are in points; scale converts them to pixels (DPI / 72)
+    so text-layer boxes line up with OCR boxes of the same page. Text-layer
+    words get confidence 100.
+    """
+    pages = []
+    for page in ET.fromstring(xhtml).iter():
+        if _local_name(page) != "page":
+            continue
+        words, boxes, lines, paragraphs = [], [], [], []
+        line_number = paragraph_number = -1
+        for element in page.iter():
+            name = _local_name(element)
+            if name == "block":
+                paragraph_number += 1
+            elif name == "line":
+                line_number += 1
+            elif name == "word" and (element.text or "").strip():
+                x_min, y_min = float(element.get("xMin")), float(element.get("yMin"))
+                x_max, y_max = float(element.get("xMax")), float(element.get("yMax"))
+                words.append(element.text.strip())
+                boxes.append((x_min * scale, y_min * scale, (x_max - x_min) * scale, (y_max - y_min) * scale))
+                lines.append(line_number)
+                paragraphs.append(paragraph_number)
+
+        pages.append(WordBoxes(
+            words,
+            np.array(boxes, dtype=np.float32).reshape(-1, 4).astype(np.int32),
+            np.full(len(words), 100, dtype=np.float32),
+            np.array(lines, dtype=np.int32),
+            np.array(paragraphs, dtype=np.int32),
+            int(float(page.get("width")) * scale), int(float(page.get("height")) * scale)
+        ))
+    return pages
+
+def text_layer_is_usable(words: WordBoxes) -> bool:
+    """Whether a page's text layer can stand in for OCR"""
+    if len(words) < TEXT_LAYER_MIN_WORDS:
+        return False
+    text = "".join(words.words)
+    if any(glyph in text for glyph in UNMAPPED_GLYPHS):
+        return False
+    return sum(char.isalnum() for char in text) / len(text) >= TEXT_LAYER_MIN_ALNUM_RATIO
@@ -1,138 +1,357 @@
 # llm_extractor.py
-import os
-from langchain.llms import HuggingFaceHub
-from langchain.chains import LLMChain
-from langchain.prompts import PromptTemplate
+import re
+import asyncio
+import logging
+import urllib.request
 import json
-from typing import Dict, Any
+import threading
+from typing import Dict, Any, List, Optional, Tuple
 
-class LLMDataExtractor:
+import config
+from structured_output import JSONObjectScanner, json_schema, max_output_tokens, parse_json_object
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the extraction prompt changes, so cached LLM results
+# produced with the old prompt are no longer used
+PROMPT_VERSION = "3"
+
+# Prompt shared by all extractors. Prompts are plain format strings, so
+# extractors that talk to a model server never import langchain
+EXTRACTION_PROMPT = """
+    Extract the following information from this bill text.
+    Return the results in JSON format with these keys:
+    - invoice_number
+    - date
+    - due_date
+    - total_amount (as a number without currency symbols)
+    - vendor_name
+    - vendor_address
+    - bill_to_name
+    - bill_to_address
+    - line_items (as an array of objects with description, quantity, unit_price, and total)
+
+    If any field is not found, use null.
+
+    BILL TEXT:
+    {bill_text}
+
+    JSON RESULT:
+    """
+
+# Everything up to this marker is the same for every bill, so model servers
+# can reuse its evaluation (see llm_server.py)
+BILL_TEXT_MARKER = "BILL TEXT:"
+
+# Prompt for filling in only the fields deterministic extraction missed
+FIELDS_PROMPT = """
+    Extract only the following information from this bill text.
+    Return the results in JSON format with exactly these keys:
+{field_list}
+
+    If any field is not found, use null.
+
+    BILL TEXT:
+    {bill_text}
+
+    JSON RESULT:
+    """
+
+# How to ask for the fields the full prompt describes
+FIELD_HINTS = {
+    "total_amount": "as a number without currency symbols",
+    "line_items": "as an array of objects with description, quantity, unit_price, and total",
+}
+TYPE_HINTS = {
+    "number": "as a number without currency symbols or units",
+    "date": "as written on the bill",
+    "array": "as an array",
+}
+
+def describe_fields(fields: Dict[str, Dict[str, Any]]) -> str:
+    """Key list for FIELDS_PROMPT from field name -> template field config"""
+    lines = []
+    for field, field_config in fields.items():
+        hint = FIELD_HINTS.get(field) or TYPE_HINTS.get(field_config.get("type"))
+        lines.append(f"    - {field} ({hint})" if hint else f"    - {field}")
+    return "\n".join(lines)
+
+# Lines around these words usually hold the fields we extract
+FIELD_LINE_PATTERN = re.compile(
+    r'invoice|bill\s*(?:no|number|date)|account|date|due|total|amount|balance|payable|period',
+    re.IGNORECASE
+)
+# The vendor name and bill header are at the top of the first page, and
+# the totals block is usually at the end of the last one
+HEADER_LINES = 15
+TAIL_LINES = 10
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token for English text)"""
+    return (len(text) + 3) // 4
+
+def chunk_bill_text(text: str, token_budget: Optional[int] = None,
+                    max_chunks: Optional[int] = None) -> List[str]:
+    """
+    Split OCR text into chunks that each fit the token budget
+
+    Short texts are sent whole. For longer ones the first chunk holds
+    the header, the last lines (totals block) and the lines most likely
+    to contain fields (dates, amounts, account numbers) with one line of
+    context. The remaining lines follow in order, up to max_chunks
+    chunks; anything beyond that is dropped.
+    """
+    token_budget = token_budget or config.LLM_TOKEN_BUDGET
+    max_chunks = max_chunks or config.LLM_MAX_CHUNKS
+
+    lines = [line for line in text.splitlines() if line.strip()]
+    if estimate_tokens("\n".join(lines)) <= token_budget:
+        return ["\n".join(lines)]
+
+    priority = set(range(min(HEADER_LINES, len(lines))))
+    priority.update(range(max(0, len(lines) - TAIL_LINES), len(lines)))
+    for index, line in enumerate(lines):
+        if FIELD_LINE_PATTERN.search(line):
+            priority.update(i for i in (index - 1, index, index + 1) if 0 <= i < len(lines))
+
+    ordered = [lines[i] for i in sorted(priority)]
+    ordered += [line for i, line in enumerate(lines) if i not in priority]
+
+    chunks, current, current_tokens = [], [], 0
+    for line in ordered:
+        line_tokens = estimate_tokens(line) + 1
+        if current and current_tokens + line_tokens > token_budget:
+            chunks.append("\n".join(current))
+            if len(chunks) == max_chunks:
+                return chunks
+            current, current_tokens = [], 0
+        current.append(line[:token_budget * 4])
+        current_tokens += min(line_tokens, token_budget)
+    if current:
+        chunks.append("\n".join(current))
+
+    return chunks[:max_chunks]
+
+def merge_extractions(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Merge per-chunk extraction results
+
+    Earlier chunks (header and totals) win for scalar fields; line items
+    from every chunk are concatenated.
+    """
+    merged: Dict[str, Any] = {}
+    for result in results:
+        for field, value in result.items():
+            if field == "line_items":
+                if isinstance(value, list):
+                    merged.setdefault("line_items", []).extend(value)
+            elif merged.get(field) is None:
+                merged[field] = value
+    return merged
+
+def _empty_result(error: str) -> Dict[str, Any]:
+    """Basic structure returned when extraction fails"""
+    return {
+        'invoice_number': None,
+        'date': None,
+        'due_date': None,
+        'total_amount': None,
+        'vendor_name': None,
+        'error': error
+    }
+
+class BaseLLMExtractor:
+    """
+    Common chunking, concurrency and parsing for LLM extractors
+
+    Subclasses implement _complete, which sends a formatted prompt to the
+    model and returns the raw model output. They also get the JSON schema
+    of the expected answer, to constrain decoding where the model server
+    supports it; output is parsed tolerantly either way, taking the first
+    JSON object and ignoring any chatter around it.
+
+    Passing fields (field name -> template field config) asks the model
+    for just those fields instead of the full bill structure, and only
+    those keys are returned.
+
+    extract_data runs on an event loop thread the extractor starts on
+    first use, under one semaphore: calls from the threads of a worker
+    process, each processing a bill, share at most LLM_CONCURRENCY model
+    calls in flight, and the chunks of every bill are requested
+    concurrently within that limit.
+    """
+    cache_version = f"base:{PROMPT_VERSION}"
+    prompt_template = EXTRACTION_PROMPT
+    _engine_lock = threading.Lock()
+    _engine_loop: Optional[asyncio.AbstractEventLoop] = None
+    _engine_semaphore: Optional[asyncio.Semaphore] = None
+
+    def _complete(self, prompt: str, schema: Dict[str, Any]) -> str:
+        raise NotImplementedError
+
+    def _prompt(self, bill_text: str, fields: Optional[Dict[str, Dict[str, Any]]] = None) -> str:
+        if fields:
+            return FIELDS_PROMPT.format(bill_text=bill_text, field_list=describe_fields(fields))
+        return self.prompt_template.format(bill_text=bill_text)
+
+    def _extract_chunk(self, bill_text: str, fields: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Any]:
+        result = self._parse(self._complete(self._prompt(bill_text, fields), json_schema(fields)))
+        if fields:
+            result = {field: result.get(field) for field in fields}
+        return result
+
+    def _parse(self, response: str) -> Dict[str, Any]:
+        return parse_json_object(response)
+
+    def _engine(self) -> Tuple[asyncio.AbstractEventLoop, asyncio.Semaphore]:
+        """The event loop extract_data calls run on, and the semaphore they share"""
+        with self._engine_lock:
+            if self._engine_loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="llm-extraction", daemon=True).start()
+                self._engine_semaphore = asyncio.Semaphore(config.LLM_CONCURRENCY)
+                self._engine_loop = loop
+        return self._engine_loop, self._engine_semaphore
+
+    def extract_data(self, text: str, fields: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """
+        Use the LLM to extract structured data from OCR text
+
+        Blocks the calling thread until the bill is extracted; other
+        threads' bills are extracted meanwhile (see the class docstring).
+        """
+        loop, semaphore = self._engine()
+        # aextract_data reports failures in its result rather than raising
+        return asyncio.run_coroutine_threadsafe(self.aextract_data(text, semaphore, fields), loop).result()
+
+    async def aextract_data(self, text: str, semaphore: Optional[asyncio.Semaphore] = None,
+                            fields: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """
+        Extract data without blocking the event loop
+
+        The chunks of a bill are requested concurrently; the semaphore caps
+        the number of model calls in flight across everything sharing it.
+        """
+        semaphore = semaphore or asyncio.Semaphore(config.LLM_CONCURRENCY)
+
+        async def complete(chunk: str) -> Dict[str, Any]:
+            async with semaphore:
+                return await asyncio.to_thread(self._extract_chunk, chunk, fields)
+
+        try:
+            results = await asyncio.gather(*(complete(chunk) for chunk in chunk_bill_text(text)))
+            return merge_extractions(results)
+        except Exception as e:
+            logger.exception("Error extracting data with LLM: %s", e)
+            return _empty_result(str(e))
+
+    def extract_many(self, texts: List[str], concurrency: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Extract data from several bills with up to `concurrency` model calls in flight
+
+        Results are returned in the order of the input texts.
+        """
+        async def run() -> List[Dict[str, Any]]:
+            semaphore = asyncio.Semaphore(concurrency or config.LLM_CONCURRENCY)
+            return await asyncio.gather(*(self.aextract_data(text, semaphore) for text in texts))
+
+        return asyncio.run(run())
+
+class LLMDataExtractor(BaseLLMExtractor):
     """
     Use a language model to extract structured data from OCR text
     """
     def __init__(self):
+        from langchain.llms import HuggingFaceHub
+        
         # Use HuggingFaceHub for accessing open source models
         # You'll need to set HUGGINGFACEHUB_API_TOKEN in your environment
         # or use a local model instead
+        repo_id = "mistralai/Mistral-7B-Instruct-v0.2"
         self.llm = HuggingFaceHub(
-            repo_id="mistralai/Mistral-7B-Instruct-v0.2",
+            repo_id=repo_id,
             model_kwargs={"temperature": 0.1, "max_length": 2048}
         )
-        
-        # Create a prompt template for extracting bill information
-        self.prompt_template = PromptTemplate(
-            input_variables=["bill_text"],
-            template="""
-            Extract the following information from this bill text. 
-            Return the results in JSON format with these keys:
-            - invoice_number
-            - date
-            - due_date
-            - total_amount (as a number without currency symbols)
-            - vendor_name
-            - vendor_address
-            - bill_to_name
-            - bill_to_address
-            - line_items (as an array of objects with description, quantity, unit_price, and total)
-            
-            If any field is not found, use null.
-            
-            BILL TEXT:
-            {bill_text}
-            
-            JSON RESULT:
-            """
+        # Identifies model and prompt in cache keys
+        self.cache_version = f"{repo_id}:{PROMPT_VERSION}"
+
+    def _complete(self, prompt: str, schema: Dict[str, Any]) -> str:
+        return self.llm(prompt)
+
+class HTTPLLMDataExtractor(BaseLLMExtractor):
+    """
+    Extract data through an LLM served over HTTP
+
+    POSTs {"prompt", "max_tokens", "prefix_chars", "json_schema",
+    "stream"} as JSON to {base_url}/generate and expects {"text": ...}
+    back, or with "stream" one such line per piece of output (NDJSON),
+    where an {"error": ...} line reports a failure after output began.
+    prefix_chars is the length of the prompt before the bill text, which
+    servers may cache; json_schema the answer's schema, which servers may
+    enforce with grammar-constrained decoding. max_tokens is capped at
+    what an answer matching the schema can need, and the response is
+    closed as soon as the JSON object is complete, which stops the server
+    generating. llm_stub_server.py implements the same API locally, so
+    throughput can be measured without a real model.
+    """
+    def __init__(self, base_url: Optional[str] = None, max_tokens: int = 512, timeout: float = 120):
+        self.base_url = (base_url or config.LLM_SERVER_URL).rstrip("/")
+        self.max_tokens = max_tokens
+        self.timeout = timeout
+        self.cache_version = f"{self.base_url}:{PROMPT_VERSION}"
+
+    def _complete(self, prompt: str, schema: Dict[str, Any]) -> str:
+        marker = prompt.find(BILL_TEXT_MARKER)
+        body = json.dumps({
+            "prompt": prompt,
+            "max_tokens": min(self.max_tokens, max_output_tokens(schema)),
+            "prefix_chars": marker + len(BILL_TEXT_MARKER) if marker >= 0 else 0,
+            "json_schema": schema,
+            "stream": True
+        }).encode("utf-8")
+        request = urllib.request.Request(
+            f"{self.base_url}/generate", data=body, headers={"Content-Type": "application/json"}
         )
-        
-        self.chain = LLMChain(llm=self.llm, prompt=self.prompt_template)
-    
-    def extract_data(self, text: str) -> Dict[str, Any]:
-        """
-        Use the LLM to extract structured data from OCR text
-        """
-        try:
-            # Get the LLM response
-            response = self.chain.run(bill_text=text)
-            
-            # Parse the JSON response
-            # This might need error handling for real-world use
-            # as the LLM output format isn't guaranteed
-            parsed_data = json.loads(response)
-            return parsed_data
-        except Exception as e:
-            print(f"Error extracting data with LLM: {str(e)}")
-            # Return a basic structure in case of error
-            return {
-                'invoice_number': None,
-                'date': None,
-                'due_date': None,
-                'total_amount': None,
-                'vendor_name': None,
-                'error': str(e)
-            }
-
-# Alternative implementation using a local model
-class LocalLLMDataExtractor:
-    """
-    Use a locally hosted language model for data extraction
-    """
-    def __init__(self, model_path="llama-3-8b"):
-        try:
-            from langchain.llms import LlamaCpp
-            
-            # Initialize local LLM
-            self.llm = LlamaCpp(
-                model_path=model_path,
-                temperature=0.1,
-                max_tokens=2048,
-                top_p=1
-            )
-            
-            # Create prompt template
-            self.prompt_template = PromptTemplate(
-                input_variables=["bill_text"],
-                template="""
-                Extract the following information from this bill text. 
-                Return the results in JSON format with these keys:
-                - invoice_number
-                - date
-                - due_date
-                - total_amount (as a number without currency symbols)
-                - vendor_name
-                - vendor_address
-                - bill_to_name
-                - bill_to_address
-                - line_items (as an array of objects with description, quantity, unit_price, and total)
-                
-                If any field is not found, use null.
-                
-                BILL TEXT:
-                {bill_text}
-                
-                JSON RESULT:
-                """
-            )
-            
-            self.chain = LLMChain(llm=self.llm, prompt=self.prompt_template)
-        except ImportError:
-            print("LlamaCpp not available. Install with: pip install llama-cpp-python")
-            self.llm = None
-    
-    def extract_data(self, text: str) -> Dict[str, Any]:
-        """Use the local LLM to extract data"""
-        if not self.llm:
-            return {'error': 'Local LLM not initialized'}
-        
-        try:
-            response = self.chain.run(bill_text=text)
-            parsed_data = json.loads(response)
-            return parsed_data
-        except Exception as e:
-            return {
-                'invoice_number': None,
-                'date': None,
-                'due_date': None,
-                'total_amount': None,
-                'vendor_name': None,
-                'error': str(e)
-            }
\ No newline at end of file
+
+        # Servers that do not stream send the whole answer as one line
+        scanner = JSONObjectScanner()
+        parts = []
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            for line in response:
+                if not line.strip():
+                    continue
+                message = json.loads(line)
+                if "error" in message:
+                    raise RuntimeError(f"LLM server error: {message['error']}")
+                parts.append(message["text"])
+                if scanner.feed(parts[-1]) is not None:
+                    return scanner.complete
+        return "".join(parts)
+
+class LocalLLMDataExtractor(HTTPLLMDataExtractor):
+    """
+    Use the node's shared local model server for data extraction
+
+    The model is loaded once per node by llm_server.py, which every
+    worker process talks to, instead of once per worker. The server
+    reports which model it runs, so cached results are keyed by it.
+    """
+    def __init__(self, base_url: Optional[str] = None, max_tokens: int = 512, timeout: float = 300):
+        super().__init__(base_url or config.LOCAL_LLM_URL, max_tokens, timeout)
+        with urllib.request.urlopen(f"{self.base_url}/health", timeout=10) as response:
+            self.model = json.loads(response.read())["model"]
+        self.cache_version = f"{self.model}:{PROMPT_VERSION}"
+
+def create_data_extractor() -> BaseLLMExtractor:
+    """
+    Create the extractor the pipeline uses
+
+    An HTTP model server is used when LLM_SERVER_URL is set, then the
+    node's shared local model server when LOCAL_LLM_URL is, otherwise
+    the HuggingFace Hub model.
+    """
+    if config.LLM_SERVER_URL:
+        return HTTPLLMDataExtractor()
+    if config.LOCAL_LLM_URL:
+        return LocalLLMDataExtractor()
+    return LLMDataExtractor()
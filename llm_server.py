@@ -0,0 +1,319 @@
+# llm_server.py
+"""
+Shared local model server, one per node
+
+Usage:
+    python llm_server.py --model models/llama-3-8b.gguf [--port 8090]
+
+Loads a GGUF model with llama-cpp-python once and serves every worker on
+the node over the /generate API that HTTPLLMDataExtractor speaks (see
+llm_stub_server.py), so the node holds one copy of the model however
+many worker processes it runs. Point the workers at it with
+LOCAL_LLM_URL=http://127.0.0.1:8090.
+
+Extraction prompts are a long fixed instruction block followed by the
+bill text. Clients send "prefix_chars", the length of that fixed part;
+the model state after evaluating it is kept in an LRU cache, so each
+request only evaluates its bill text. Requests are run one at a time on
+the model's single context by a scheduler that runs requests sharing the
+loaded prefix back to back, so concurrent chunks of the same bill or
+batch reuse it without even restoring a saved state.
+
+Requests with a "json_schema" are decoded under a grammar built from it,
+so the model can only produce a matching object, and generation stops as
+soon as that object closes. With "stream" the answer is sent as NDJSON
+lines ({"text": piece}) as it is generated, ending with an {"error": ...}
+line if generation fails, and a client that hangs up stops its
+generation.
+"""
+import json
+import time
+import queue
+import hashlib
+import argparse
+import threading
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Any, List, Optional
+
+import config
+from structured_output import JSONObjectScanner
+
+# After this many requests have jumped ahead of the oldest waiting one
+# (because they share the loaded prefix), the oldest runs next anyway
+MAX_SKIPS = 8
+# Compiled grammars kept, one per distinct schema
+GRAMMAR_CACHE_SIZE = 64
+
+class PrefixCache:
+    """
+    LRU cache of model states after evaluating a prompt prefix
+
+    A llama.cpp state holds the KV cache of the evaluated tokens, which
+    for an 8B model is a few MB per thousand tokens, so only a handful
+    of distinct prefixes are kept.
+    """
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._states: "OrderedDict[str, Any]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        state = self._states.get(key)
+        if state is None:
+            self.misses += 1
+            return None
+        self._states.move_to_end(key)
+        self.hits += 1
+        return state
+
+    def put(self, key: str, state: Any):
+        self._states[key] = state
+        self._states.move_to_end(key)
+        while len(self._states) > self.max_entries:
+            self._states.popitem(last=False)
+
+class GenerationRequest:
+    """A prompt waiting for the model, and its result once generated"""
+    def __init__(self, prompt: str, max_tokens: int, prefix_chars: int,
+                 schema: Optional[Dict[str, Any]] = None, stream: bool = False):
+        self.prompt = prompt
+        self.max_tokens = max_tokens
+        self.schema = schema
+        # Pieces of output for a streaming request; None marks the end
+        self.pieces: Optional[queue.Queue] = queue.Queue() if stream else None
+        self.cancelled = False
+        self.prefix = prompt[:max(0, min(prefix_chars, len(prompt)))]
+        self.prefix_key = hashlib.sha256(self.prefix.encode("utf-8")).hexdigest() if self.prefix else ""
+        self.done = threading.Event()
+        self.text: Optional[str] = None
+        self.error: Optional[str] = None
+        self.skips = 0
+
+class ModelScheduler:
+    """
+    Runs generation requests on one model, reusing evaluated prefixes
+
+    HTTP handler threads submit requests and wait; a single scheduler
+    thread owns the model. It prefers requests whose prefix is the one
+    already evaluated in the context, then restores a cached prefix
+    state, and only evaluates a prefix from scratch on a cache miss.
+    llama-cpp-python then evaluates just the prompt tokens after the
+    longest prefix already in the context.
+    """
+    def __init__(self, llm: Any, prefix_cache_size: int, temperature: float = 0.1):
+        self.llm = llm
+        self.temperature = temperature
+        self.prefix_cache = PrefixCache(prefix_cache_size)
+        self._grammars: "OrderedDict[str, Any]" = OrderedDict()
+        self._pending: List[GenerationRequest] = []
+        self._condition = threading.Condition()
+        self._loaded_prefix = None
+        self.completed = 0
+        self.prefix_reuses = 0
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, request: GenerationRequest) -> GenerationRequest:
+        """Queue a request; wait on request.done, or read request.pieces when streaming"""
+        with self._condition:
+            self._pending.append(request)
+            self._condition.notify()
+        return request
+
+    def generate(self, prompt: str, max_tokens: int, prefix_chars: int = 0,
+                 schema: Optional[Dict[str, Any]] = None) -> str:
+        """Queue a prompt and block until its completion is ready"""
+        request = self.submit(GenerationRequest(prompt, max_tokens, prefix_chars, schema))
+        request.done.wait()
+        if request.error is not None:
+            raise RuntimeError(request.error)
+        return request.text
+
+    def queue_depth(self) -> int:
+        with self._condition:
+            return len(self._pending)
+
+    def _next_request(self) -> GenerationRequest:
+        """Oldest request, unless a younger one can reuse the loaded prefix"""
+        with self._condition:
+            while not self._pending:
+                self._condition.wait()
+            oldest = self._pending[0]
+            if self._loaded_prefix and oldest.prefix_key != self._loaded_prefix and oldest.skips < MAX_SKIPS:
+                for request in self._pending[1:]:
+                    if request.prefix_key == self._loaded_prefix:
+                        oldest.skips += 1
+                        self._pending.remove(request)
+                        return request
+            return self._pending.pop(0)
+
+    def _load_prefix(self, request: GenerationRequest):
+        """Put the model in the state right after the request's prefix"""
+        if not request.prefix_key:
+            # The prompt replaces whatever prefix the context held
+            self._loaded_prefix = None
+            return
+        if request.prefix_key == self._loaded_prefix:
+            self.prefix_reuses += 1
+            return
+
+        state = self.prefix_cache.get(request.prefix_key)
+        if state is not None:
+            self.llm.load_state(state)
+        else:
+            self.llm.reset()
+            self.llm.eval(self.llm.tokenize(request.prefix.encode("utf-8")))
+            self.prefix_cache.put(request.prefix_key, self.llm.save_state())
+        self._loaded_prefix = request.prefix_key
+
+    def _grammar(self, schema: Dict[str, Any]) -> Any:
+        """Grammar that only admits JSON matching the schema, compiled once per schema"""
+        from llama_cpp import LlamaGrammar
+
+        key = json.dumps(schema, sort_keys=True)
+        grammar = self._grammars.get(key)
+        if grammar is None:
+            grammar = LlamaGrammar.from_json_schema(key, verbose=False)
+            self._grammars[key] = grammar
+            while len(self._grammars) > GRAMMAR_CACHE_SIZE:
+                self._grammars.popitem(last=False)
+        self._grammars.move_to_end(key)
+        return grammar
+
+    def _generate(self, request: GenerationRequest) -> str:
+        """
+        Run one request, streaming pieces to it as they are generated
+
+        Structured requests stop when their JSON object closes; any
+        request stops when its client has gone away.
+        """
+        scanner = JSONObjectScanner() if request.schema else None
+        pieces = []
+        for chunk in self.llm.create_completion(
+            request.prompt, max_tokens=request.max_tokens, temperature=self.temperature, top_p=1,
+            grammar=self._grammar(request.schema) if request.schema else None, stream=True
+        ):
+            piece = chunk["choices"][0]["text"]
+            pieces.append(piece)
+            if request.pieces is not None:
+                request.pieces.put(piece)
+            if request.cancelled or (scanner is not None and scanner.feed(piece) is not None):
+                break
+        return "".join(pieces)
+
+    def _run(self):
+        while True:
+            request = self._next_request()
+            try:
+                self._load_prefix(request)
+                request.text = self._generate(request)
+            except Exception as e:
+                request.error = str(e)
+                # The context may hold a half-evaluated prompt
+                self._loaded_prefix = None
+            else:
+                # Generation appended the bill text and answer to the
+                # context; the prefix is still its start, which is all
+                # the next request with this prefix needs
+                self.completed += 1
+            if request.pieces is not None:
+                request.pieces.put(None)
+            request.done.set()
+
+class LocalModelHandler(BaseHTTPRequestHandler):
+    scheduler: ModelScheduler = None
+    model_name = ""
+    started = 0.0
+
+    def _send_json(self, status: int, payload: Dict[str, Any]):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != "/health":
+            self.send_error(404)
+            return
+        scheduler = self.scheduler
+        self._send_json(200, {
+            "model": self.model_name,
+            "uptime_s": time.time() - self.started,
+            "queue_depth": scheduler.queue_depth(),
+            "completed": scheduler.completed,
+            "prefix_reuses": scheduler.prefix_reuses,
+            "prefix_cache_hits": scheduler.prefix_cache.hits,
+            "prefix_cache_misses": scheduler.prefix_cache.misses
+        })
+
+    def do_POST(self):
+        if self.path != "/generate":
+            self.send_error(404)
+            return
+
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        request = self.scheduler.submit(GenerationRequest(
+            body.get("prompt", ""), int(body.get("max_tokens", 512)), int(body.get("prefix_chars", 0)),
+            body.get("json_schema"), bool(body.get("stream"))
+        ))
+
+        if request.pieces is None:
+            request.done.wait()
+            if request.error is not None:
+                self._send_json(500, {"error": request.error})
+            else:
+                self._send_json(200, {"text": request.text})
+            return
+
+        # The status is sent with the first piece, so a request that fails
+        # before producing any output still gets a 500; one that fails
+        # later ends with an {"error": ...} line. Streamed responses end
+        # when the connection closes
+        piece = request.pieces.get()
+        if piece is None and request.error is not None:
+            self._send_json(500, {"error": request.error})
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        try:
+            while piece is not None:
+                self.wfile.write((json.dumps({"text": piece}) + "\n").encode("utf-8"))
+                self.wfile.flush()
+                piece = request.pieces.get()
+            if request.error is not None:
+                self.wfile.write((json.dumps({"error": request.error}) + "\n").encode("utf-8"))
+        except (BrokenPipeError, ConnectionResetError):
+            # The client has what it needs; stop generating for it
+            request.cancelled = True
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(model_path: str, port: int, n_ctx: int, n_threads: Optional[int],
+          prefix_cache_size: int) -> ThreadingHTTPServer:
+    """Load the model and create the server (call serve_forever on the result)"""
+    from llama_cpp import Llama
+
+    llm = Llama(model_path=model_path, n_ctx=n_ctx, n_threads=n_threads, verbose=False)
+    LocalModelHandler.scheduler = ModelScheduler(llm, prefix_cache_size)
+    LocalModelHandler.model_name = model_path.replace("\\", "/").rsplit("/", 1)[-1]
+    LocalModelHandler.started = time.time()
+    return ThreadingHTTPServer(("127.0.0.1", port), LocalModelHandler)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shared local model server")
+    parser.add_argument("--model", default=config.LOCAL_LLM_MODEL_PATH, help="Path to a GGUF model")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--n-ctx", type=int, default=config.LOCAL_LLM_CONTEXT)
+    parser.add_argument("--threads", type=int, default=None, help="Inference threads (default: llama.cpp's)")
+    parser.add_argument("--prefix-cache", type=int, default=config.LOCAL_LLM_PREFIX_CACHE,
+                        help="Prompt prefix states kept in memory")
+    args = parser.parse_args()
+
+    server = serve(args.model, args.port, args.n_ctx, args.threads, args.prefix_cache)
+    print(f"Local model server for {args.model} listening on http://127.0.0.1:{args.port}")
+    server.serve_forever()
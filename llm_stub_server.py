@@ -0,0 +1,128 @@
+# llm_stub_server.py
+"""
+Local stand-in for an LLM server, for offline benchmarks and development
+
+Usage:
+    python llm_stub_server.py [--port 8081] [--latency-ms 300] [--ms-per-token 2]
+                              [--ms-per-output-token 0] [--chatter]
+
+Implements the API HTTPLLMDataExtractor speaks: POST /generate with
+{"prompt", "max_tokens"} returns {"text": <JSON string>}, or with
+"stream" one {"text": piece} line per piece (NDJSON). Fields are found
+with simple regexes and limited to the request's "json_schema", if any.
+Each request sleeps for a fixed latency plus a per-prompt-token cost, and
+each streamed piece for a per-output-token cost, to imitate a model.
+--chatter makes it ramble on after the JSON object like an unconstrained
+model, to measure what stopping at the closing brace saves.
+"""
+import re
+import json
+import time
+import argparse
+from typing import Dict, Any, Optional
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+FIELD_PATTERNS = {
+    "invoice_number": r'(?:invoice|inv|bill)\s*(?:no|number|#)?[\s#:.]*([a-z0-9\-]{3,})',
+    "date": r'(?:bill\s*date|invoice\s*date|date)[\s:]*(\d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4})',
+    "due_date": r'due\s*(?:date)?[\s:]*(\d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4})',
+    "total_amount": r'(?:total|amount due|balance due|net payable)[\s:]*[\$£€₹]?(\d+(?:,\d+)*(?:\.\d+)?)',
+}
+
+# Text an unconstrained model tends to add after its answer
+CHATTER = ("\n\nHere is the extracted information in JSON format. Some fields could not be "
+           "found in the bill text and were set to null. Let me know if you need anything else!")
+# Characters per streamed piece, roughly one token
+PIECE_CHARS = 4
+
+def stub_extract(bill_text: str, schema: Optional[Dict[str, Any]] = None) -> dict:
+    """Answer the extraction prompt the way a well-behaved model would"""
+    result = {field: None for field in (
+        "invoice_number", "date", "due_date", "total_amount", "vendor_name",
+        "vendor_address", "bill_to_name", "bill_to_address"
+    )}
+    result["line_items"] = []
+
+    for field, pattern in FIELD_PATTERNS.items():
+        match = re.search(pattern, bill_text, re.IGNORECASE)
+        if match:
+            result[field] = match.group(1)
+    if result["total_amount"]:
+        result["total_amount"] = float(result["total_amount"].replace(',', ''))
+
+    lines = [line.strip() for line in bill_text.splitlines() if line.strip()]
+    if lines:
+        result["vendor_name"] = lines[0][:50]
+    if schema:
+        result = {field: result.get(field) for field in schema.get("properties", {})}
+    return result
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    latency = 0.3
+    seconds_per_token = 0.002
+    seconds_per_output_token = 0.0
+    chatter = False
+
+    def do_POST(self):
+        if self.path != "/generate":
+            self.send_error(404)
+            return
+
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        prompt = request.get("prompt", "")
+        bill_text = prompt.split("BILL TEXT:", 1)[-1].split("JSON RESULT:", 1)[0]
+
+        time.sleep(self.latency + self.seconds_per_token * len(prompt) / 4)
+
+        text = json.dumps(stub_extract(bill_text, request.get("json_schema")))
+        if self.chatter:
+            text += CHATTER
+        if request.get("stream"):
+            self._stream(text)
+            return
+
+        time.sleep(self.seconds_per_output_token * len(text) / PIECE_CHARS)
+        body = json.dumps({"text": text}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self, text: str):
+        """Send the answer a piece at a time until done or the client hangs up"""
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        try:
+            for start in range(0, len(text), PIECE_CHARS):
+                time.sleep(self.seconds_per_output_token)
+                self.wfile.write((json.dumps({"text": text[start:start + PIECE_CHARS]}) + "\n").encode("utf-8"))
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(port: int, latency_ms: float, ms_per_token: float,
+          ms_per_output_token: float = 0, chatter: bool = False) -> ThreadingHTTPServer:
+    """Create the stub server (call serve_forever on the result)"""
+    StubLLMHandler.latency = latency_ms / 1000
+    StubLLMHandler.seconds_per_token = ms_per_token / 1000
+    StubLLMHandler.seconds_per_output_token = ms_per_output_token / 1000
+    StubLLMHandler.chatter = chatter
+    return ThreadingHTTPServer(("127.0.0.1", port), StubLLMHandler)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stand-in LLM server")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--ms-per-token", type=float, default=2)
+    parser.add_argument("--ms-per-output-token", type=float, default=0)
+    parser.add_argument("--chatter", action="store_true", help="Add text after the JSON answer")
+    args = parser.parse_args()
+
+    server = serve(args.port, args.latency_ms, args.ms_per_token, args.ms_per_output_token, args.chatter)
+    print(f"Stub LLM server listening on http://127.0.0.1:{args.port}")
+    server.serve_forever()
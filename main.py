@@ -1,17 +1,46 @@
 # main.py
+"""
+Bill processing API
+
+The API only stores uploads, queues jobs and serves their state; OCR and
+LLM extraction run in worker.py. Nothing here imports the OCR/LLM stack
+(cv2, numpy, pdf2image, tesseract, langchain), so API replicas start
+fast and stay small. The startup log line reports import time, peak
+memory and any worker-only module that slipped in.
+"""
+import time
+IMPORT_STARTED = time.perf_counter()
+
 import os
 import json
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, BackgroundTasks
+import asyncio
+import logging
+import zipfile
+import tempfile
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse, Response
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple, AsyncIterator
 import uuid
+import hashlib
 from datetime import datetime
 
-from processor import DocumentProcessor
-from template_manager import TemplateManager
-from llm_extractor import LLMDataExtractor  # Or use LocalLLMDataExtractor
+import aiofiles
+import aiofiles.os
+
+import config
+
+from cache import ResultCache
+from template_manager import TemplateChangedError, TemplateManager, TemplateSnapshot
+from result_store import create_result_store
+from job_queue import JobQueue, STATUS_PROCESSING, STATUS_COMPLETED, STATUS_ERROR
+from events import EventBus, StatusIndex, StatusWatcher
+from telemetry import MetricsStore, render_metric, setup_logging, startup_report
+
+setup_logging()
+logger = logging.getLogger("api")
 
 # Create necessary directories
 os.makedirs("uploads", exist_ok=True)
@@ -19,17 +48,46 @@ os.makedirs("processed", exist_ok=True)
 os.makedirs("templates", exist_ok=True)
 os.makedirs("output", exist_ok=True)
 
-# Initialize components
-document_processor = DocumentProcessor()
-template_manager = TemplateManager()
+# File types the processor can handle
+SUPPORTED_EXTENSIONS = {'.pdf', '.jpg', '.jpeg', '.png'}
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
 
-# Try to initialize LLM extractor, but have a fallback if not available
-try:
-    data_extractor = LLMDataExtractor()
-except Exception as e:
-    print(f"Warning: LLM extractor not available: {str(e)}")
-    print("Using basic extraction only")
-    data_extractor = None
+# Leading bytes of the file types we accept, and the type each extension
+# must contain; an upload whose content does not match its name is refused
+MAGIC_NUMBERS = [
+    (b"%PDF-", "application/pdf"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"PK\x03\x04", "application/zip"),
+]
+EXTENSION_TYPES = {
+    '.pdf': "application/pdf",
+    '.png': "image/png",
+    '.jpg': "image/jpeg",
+    '.jpeg': "image/jpeg",
+    '.zip': "application/zip",
+}
+
+# Descriptions of the stored metrics served at /metrics
+METRIC_HELP = {
+    "bill_stage_seconds": "Seconds spent in each processing stage per bill",
+    "bill_page_stage_seconds": "Seconds spent in each OCR stage per page",
+    "upload_seconds": "Seconds spent writing uploaded files to disk",
+    "uploads_rejected_total": "Uploads refused, by reason",
+    "bills_processed_total": "Bills processed, by status, extraction tier, text source and template routing",
+    "bill_errors_total": "Failed processing attempts, by exception type and whether retries ran out",
+}
+
+# Initialize components. OCR and LLM extraction run in worker processes
+# (see worker.py); the API only enqueues jobs and reads their state.
+result_cache = ResultCache()
+metrics = MetricsStore()
+template_manager = TemplateManager()
+job_queue = JobQueue()
+result_store = create_result_store()
+event_bus = EventBus()
+status_index = StatusIndex(config.STATUS_INDEX_SIZE)
 
 # Create FastAPI application
 app = FastAPI(title="Bill Processing System")
@@ -43,6 +101,23 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def limit_request_size(request: Request, call_next):
+    """
+    Refuse request bodies over config.MAX_REQUEST_BYTES from their
+    Content-Length, before any of the body is read or spooled to disk
+    """
+    limit = config.MAX_REQUEST_BYTES
+    if request.url.path == "/upload-bill/":
+        # One file plus the multipart framing and form fields
+        limit = min(limit, config.MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES)
+    
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > limit:
+        await run_in_threadpool(metrics.inc, "uploads_rejected_total", {"reason": "request_too_large"})
+        return JSONResponse(status_code=413, content={"detail": f"Request exceeds {limit} bytes"})
+    return await call_next(request)
+
 # Define Pydantic models for request/response validation
 class ProcessingResult(BaseModel):
     bill_id: str
@@ -55,158 +130,475 @@ class ProcessingResult(BaseModel):
 class ProcessingRequest(BaseModel):
     bill_id: str
     template_id: Optional[str] = None
+    priority: int = 1  # Reprocessing is interactive, so it jumps ahead of uploads
 
 class TemplateData(BaseModel):
     name: str
     description: str
     fields: Dict[str, Any]
     identification: Optional[Dict[str, Any]] = None
-
-# Background task for processing documents
-def process_document_task(filename: str, bill_id: str, template_id: Optional[str] = None):
-    try:
-        # Step 1: Extract data using OCR
-        basic_data = document_processor.process_document(filename)
-        
-        # Get the full text from the document for better extraction
-        file_path = os.path.join("uploads", filename)
-        ocr_text = ""
-        
-        # This is a simplified version - in reality you'd reuse the OCR from process_document
-        if file_path.endswith('.pdf'):
-            from pdf2image import convert_from_path
-            import pytesseract
-            
-            pages = convert_from_path(file_path, 300)
-            for page in pages:
-                ocr_text += pytesseract.image_to_string(page) + "\n"
-        
-        # Step 2: Use LLM for enhanced extraction if available
-        if data_extractor:
-            extracted_data = data_extractor.extract_data(ocr_text)
-        else:
-            extracted_data = basic_data
-        
-        # Step 3: Identify the best template if none specified
-        if not template_id:
-            template_id = template_manager.identify_template(extracted_data, ocr_text)
-        
-        # Step 4: Map the data to the template
-        template_mapped = template_manager.map_to_template(template_id, extracted_data)
-        
-        # Step 5: Save the results
-        result = {
-            "bill_id": bill_id,
-            "filename": filename,
-            "processed_date": datetime.now().isoformat(),
-            "status": "completed",
-            "extracted_data": extracted_data,
-            "template_id": template_id,
-            "template_data": template_mapped,
-            "validation": template_mapped.get("validation", {})
-        }
-        
-        result_path = os.path.join("processed", f"{bill_id}.json")
-        with open(result_path, 'w') as f:
-            json.dump(result, f, indent=2)
-        
-        return result
-    
-    except Exception as e:
-        # Log the error
-        error_result = {
-            "bill_id": bill_id,
-            "status": "error",
-            "error": str(e)
-        }
-        
-        result_path = os.path.join("processed", f"{bill_id}.json")
-        with open(result_path, 'w') as f:
-            json.dump(error_result, f, indent=2)
-        
-        return error_result
+    preprocessing: Optional[Dict[str, Any]] = None
+    regions: Optional[List[Dict[str, Any]]] = None
 
 # API Endpoints
 @app.post("/upload-bill/", response_model=dict)
 async def upload_bill(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     template_id: str = Form(None),
-    notes: str = Form(None)
+    notes: str = Form(None),
+    priority: int = Form(0)
 ):
     """
     Upload a bill for processing
     """
-    # Generate unique identifiers
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    bill_id = str(uuid.uuid4())[:8]
-    extension = os.path.splitext(file.filename)[1]
+    if os.path.splitext(file.filename or "")[1].lower() not in SUPPORTED_EXTENSIONS:
+        raise HTTPException(status_code=415, detail="Unsupported file type")
     
     # Save the file
-    filename = f"{timestamp}_{bill_id}{extension}"
-    file_path = os.path.join("uploads", filename)
-    
-    with open(file_path, "wb") as buffer:
-        content = await file.read()
-        buffer.write(content)
+    bill_id, filename = _new_bill_filename(file.filename)
+    upload = await _save_upload(file, os.path.join("uploads", filename))
     
-    # Queue processing in background
-    background_tasks.add_task(process_document_task, filename, bill_id, template_id)
+    # Queue processing for the workers
+    await run_in_threadpool(job_queue.enqueue, bill_id, filename, template_id, priority, upload["sha256"])
     
     return {
         "status": "processing",
         "message": "Bill uploaded and queued for processing",
         "bill_id": bill_id,
-        "filename": filename
+        "filename": filename,
+        "file_hash": upload["sha256"],
+        "size": upload["size"]
     }
 
-@app.get("/bill/{bill_id}", response_model=dict)
-async def get_bill_status(bill_id: str):
+def _new_bill_filename(original_name: str) -> Tuple[str, str]:
+    """Generate a bill id and the upload filename it is stored under"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    bill_id = str(uuid.uuid4())[:8]
+    extension = os.path.splitext(original_name or "")[1]
+    return bill_id, f"{timestamp}_{bill_id}{extension}"
+
+def sniff_mime_type(head: bytes) -> Optional[str]:
+    """File type from the leading bytes of a file, if it is one we accept"""
+    for magic, mime_type in MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return mime_type
+    return None
+
+async def _reject_upload(status_code: int, reason: str, detail: str):
+    await run_in_threadpool(metrics.inc, "uploads_rejected_total", {"reason": reason})
+    raise HTTPException(status_code=status_code, detail=detail)
+
+class _UploadCheck:
     """
-    Get the status and data for a processed bill
+    Hash, size and type of a file being written, checked chunk by chunk
+
+    update() and finish() return the (status code, reason, detail) the
+    upload is refused with, or None while it is acceptable.
     """
-    result_path = os.path.join("processed", f"{bill_id}.json")
+    def __init__(self, filename: str):
+        self.expected_type = EXTENSION_TYPES.get(os.path.splitext(filename or "")[1].lower())
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.mime_type = None
     
-    if not os.path.exists(result_path):
-        return {
+    def update(self, chunk: bytes) -> Optional[Tuple[int, str, str]]:
+        if self.size == 0:
+            self.mime_type = sniff_mime_type(chunk)
+            if self.mime_type is None or self.mime_type != self.expected_type:
+                return 415, "content_mismatch", "File content does not match its type"
+        self.size += len(chunk)
+        if self.size > config.MAX_UPLOAD_BYTES:
+            return 413, "too_large", f"File exceeds {config.MAX_UPLOAD_BYTES} bytes"
+        self.digest.update(chunk)
+        return None
+    
+    def finish(self) -> Optional[Tuple[int, str, str]]:
+        return (400, "empty", "File is empty") if self.size == 0 else None
+    
+    def result(self) -> Dict[str, Any]:
+        return {"sha256": self.digest.hexdigest(), "mime_type": self.mime_type, "size": self.size}
+
+def _temp_upload_path(file_path: str) -> str:
+    """Name an upload is written under until it is complete"""
+    return os.path.join(os.path.dirname(file_path), f".{os.path.basename(file_path)}.part")
+
+async def _save_upload(file: UploadFile, file_path: str) -> Dict[str, Any]:
+    """
+    Stream an uploaded file to disk, hashing and checking it on the way
+
+    Chunks are written with non-blocking file I/O, so a large scan never
+    stalls the event loop, and only one chunk is held in memory. The
+    file is written under a temporary name and renamed into place once
+    complete, so nothing ever reads a partial upload. Files over
+    config.MAX_UPLOAD_BYTES (413) or whose content does not match their
+    extension (415) are refused. Returns {"sha256", "mime_type", "size"}.
+    """
+    start = time.perf_counter()
+    if file.size is not None and file.size > config.MAX_UPLOAD_BYTES:
+        await _reject_upload(413, "too_large", f"File exceeds {config.MAX_UPLOAD_BYTES} bytes")
+    
+    check = _UploadCheck(file.filename)
+    temp_path = _temp_upload_path(file_path)
+    
+    try:
+        async with aiofiles.open(temp_path, "wb") as buffer:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                rejection = check.update(chunk)
+                if rejection:
+                    await _reject_upload(*rejection)
+                await buffer.write(chunk)
+        
+        rejection = check.finish()
+        if rejection:
+            await _reject_upload(*rejection)
+        await aiofiles.os.replace(temp_path, file_path)
+    except BaseException:
+        if await aiofiles.os.path.exists(temp_path):
+            await aiofiles.os.remove(temp_path)
+        raise
+    
+    await run_in_threadpool(metrics.observe_many, "upload_seconds", [({}, time.perf_counter() - start)])
+    return check.result()
+
+def _copy_upload(source, name: str, file_path: str) -> Optional[Dict[str, Any]]:
+    """
+    Blocking counterpart of _save_upload, for files read from an archive
+
+    Copies the file-like source to file_path with the same checks and
+    atomic rename. Returns {"sha256", "mime_type", "size"}, or None when
+    the file is refused (the reason is counted in uploads_rejected_total).
+    """
+    check = _UploadCheck(name)
+    temp_path = _temp_upload_path(file_path)
+    rejection = None
+    
+    try:
+        with open(temp_path, "wb") as target:
+            for chunk in iter(lambda: source.read(UPLOAD_CHUNK_SIZE), b""):
+                rejection = check.update(chunk)
+                if rejection:
+                    break
+                target.write(chunk)
+        rejection = rejection or check.finish()
+        if rejection is None:
+            os.replace(temp_path, file_path)
+            return check.result()
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    
+    metrics.inc("uploads_rejected_total", {"reason": rejection[1]})
+    return None
+
+def _extract_zip(zip_path: str) -> Tuple[List[Tuple[str, str, str]], List[str]]:
+    """
+    Copy every supported bill out of a zip archive into uploads/
+
+    Returns (bill_id, filename, sha256) for each bill copied, and the
+    names of the members refused. Members are streamed out one at a
+    time, so archive size does not matter, and checked like any single
+    upload: members larger than config.MAX_UPLOAD_BYTES or whose content
+    does not match their extension are refused.
+    """
+    bills = []
+    skipped = []
+    with zipfile.ZipFile(zip_path) as archive:
+        for member in archive.infolist():
+            name = os.path.basename(member.filename)
+            if member.is_dir() or name.startswith('.') or "__MACOSX" in member.filename:
+                continue
+            if os.path.splitext(name)[1].lower() not in SUPPORTED_EXTENSIONS:
+                continue
+            if member.file_size > config.MAX_UPLOAD_BYTES:
+                metrics.inc("uploads_rejected_total", {"reason": "too_large"})
+                skipped.append(name)
+                continue
+            
+            bill_id, filename = _new_bill_filename(name)
+            with archive.open(member) as source:
+                upload = _copy_upload(source, name, os.path.join("uploads", filename))
+            if upload is None:
+                skipped.append(name)
+            else:
+                bills.append((bill_id, filename, upload["sha256"]))
+    return bills, skipped
+
+@app.post("/upload-bills/", response_model=dict)
+async def upload_bills(
+    files: List[UploadFile] = File(...),
+    template_id: str = Form(None),
+    priority: int = Form(0)
+):
+    """
+    Upload many bills at once, as separate files and/or zip archives
+
+    All bills are queued in one transaction under a batch id; follow
+    their progress at /batch/{batch_id}/events.
+    """
+    batch_id = uuid.uuid4().hex[:12]
+    bills = []
+    skipped = []
+    
+    for file in files:
+        extension = os.path.splitext(file.filename or "")[1].lower()
+        
+        if extension == '.zip':
+            fd, zip_path = tempfile.mkstemp(suffix='.zip', dir="uploads")
+            os.close(fd)
+            try:
+                await _save_upload(file, zip_path)
+                zip_bills, zip_skipped = await run_in_threadpool(_extract_zip, zip_path)
+                bills.extend(zip_bills)
+                skipped.extend(f"{file.filename}/{name}" for name in zip_skipped)
+            except (zipfile.BadZipFile, HTTPException):
+                skipped.append(file.filename)
+            finally:
+                if os.path.exists(zip_path):
+                    os.remove(zip_path)
+        elif extension in SUPPORTED_EXTENSIONS:
+            bill_id, filename = _new_bill_filename(file.filename)
+            try:
+                upload = await _save_upload(file, os.path.join("uploads", filename))
+            except HTTPException:
+                skipped.append(file.filename)
+                continue
+            bills.append((bill_id, filename, upload["sha256"]))
+        else:
+            skipped.append(file.filename)
+    
+    if not bills:
+        raise HTTPException(status_code=400, detail="No supported bill files in upload")
+    
+    # Queue every bill in a single transaction
+    await run_in_threadpool(job_queue.enqueue_many, [
+        {"bill_id": bill_id, "filename": filename, "template_id": template_id, "priority": priority,
+         "file_hash": file_hash}
+        for bill_id, filename, file_hash in bills
+    ], batch_id=batch_id)
+    
+    return {
+        "status": "processing",
+        "message": f"{len(bills)} bills uploaded and queued for processing",
+        "batch_id": batch_id,
+        "bills": [{"bill_id": bill_id, "filename": filename} for bill_id, filename, _ in bills],
+        "skipped": skipped
+    }
+
+def _format_event(event: Dict[str, Any], sse: bool) -> str:
+    """Frame an event as an NDJSON line or a Server-Sent Event"""
+    data = json.dumps(event)
+    return f"event: {event['event']}\ndata: {data}\n\n" if sse else data + "\n"
+
+async def _batch_events(batch_id: str, sse: bool) -> AsyncIterator[str]:
+    """Yield one event per bill as it finishes, then a batch summary"""
+    reported = set()
+    updates = event_bus.subscribe(f"batch:{batch_id}")
+    
+    try:
+        while True:
+            jobs = await run_in_threadpool(job_queue.get_batch_jobs, batch_id)
+            
+            for job in jobs:
+                if job["status"] in (STATUS_COMPLETED, STATUS_ERROR) and job["id"] not in reported:
+                    reported.add(job["id"])
+                    yield _format_event({
+                        "event": "bill",
+                        "batch_id": batch_id,
+                        "bill_id": job["bill_id"],
+                        "filename": job["filename"],
+                        "status": job["status"],
+                        "error": job["error"],
+                        "finished": len(reported),
+                        "total": len(jobs)
+                    }, sse)
+            
+            if len(reported) == len(jobs):
+                counts = {STATUS_COMPLETED: 0, STATUS_ERROR: 0}
+                for job in jobs:
+                    counts[job["status"]] += 1
+                yield _format_event({
+                    "event": "batch",
+                    "batch_id": batch_id,
+                    "status": "completed",
+                    "total": len(jobs),
+                    "completed": counts[STATUS_COMPLETED],
+                    "errors": counts[STATUS_ERROR]
+                }, sse)
+                return
+            
+            # Wake up when the status watcher sees a change in this batch;
+            # the timeout is only a safety net
+            try:
+                await asyncio.wait_for(updates.get(), timeout=config.EVENTS_KEEPALIVE_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        event_bus.unsubscribe(f"batch:{batch_id}", updates)
+
+@app.get("/batch/{batch_id}/events")
+async def get_batch_events(batch_id: str, request: Request):
+    """
+    Stream per-bill completion events for a batch upload
+
+    Responds with NDJSON by default, or Server-Sent Events when the
+    client accepts text/event-stream.
+    """
+    if not await run_in_threadpool(job_queue.get_batch_jobs, batch_id):
+        raise HTTPException(status_code=404, detail="Batch not found")
+    
+    sse = "text/event-stream" in request.headers.get("accept", "")
+    return StreamingResponse(
+        _batch_events(batch_id, sse),
+        media_type="text/event-stream" if sse else "application/x-ndjson"
+    )
+
+def _load_result(bill_id: str) -> Optional[Dict[str, Any]]:
+    """Load a bill's saved result, if there is one"""
+    return result_store.get(bill_id)
+
+def _build_bill_status(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Status payload for a bill's latest job, as served by GET /bill/{id}"""
+    bill_id = job["bill_id"]
+    
+    if job["status"] == STATUS_COMPLETED:
+        status = _load_result(bill_id) or {"bill_id": bill_id, "status": "completed"}
+    elif job["status"] == STATUS_ERROR:
+        status = {
+            "bill_id": bill_id,
+            "filename": job["filename"],
+            "status": "error",
+            "error": job["error"]
+        }
+    else:
+        status = {
+            "bill_id": bill_id,
             "status": "processing",
             "message": "Bill is still being processed"
         }
     
-    with open(result_path, 'r') as f:
-        result = json.load(f)
+    status.update(job_id=job["id"], queue_status=job["status"], attempts=job["attempts"])
+    return status
+
+def _get_bill_status(bill_id: str) -> Optional[Dict[str, Any]]:
+    """Current status of a bill, read from the queue and result file; None for unknown bills"""
+    job = job_queue.get_latest_job(bill_id)
     
-    return result
+    # Bills processed before the job queue existed only have a result file
+    if job is None:
+        return _load_result(bill_id)
+    
+    return _build_bill_status(job)
 
-@app.post("/reprocess-bill/", response_model=dict)
-async def reprocess_bill(
-    background_tasks: BackgroundTasks,
-    request: ProcessingRequest
+async def _bill_status(bill_id: str) -> Dict[str, Any]:
+    """
+    A bill's status from the status index, loading it there on a miss
+
+    Raises 404 for bills with neither a job nor a result. Bills with
+    only a result file are indexed too: their status is final until
+    they are reprocessed, which queues a job the watcher reports.
+    """
+    status = status_index.get(bill_id)
+    if status is None:
+        status = await run_in_threadpool(_get_bill_status, bill_id)
+        if status is None:
+            raise HTTPException(status_code=404, detail="Bill not found")
+        status_index.put(bill_id, status)
+    return status
+
+@app.get("/bill/{bill_id}", response_model=dict)
+async def get_bill_status(bill_id: str):
+    """
+    Get the status and data for a processed bill
+
+    Served from the in-memory status index; only bills the API has not
+    seen yet touch the queue database and result files.
+    """
+    return await _bill_status(bill_id)
+
+async def _bill_events(bill_id: str) -> AsyncIterator[str]:
+    """Yield the bill's current status, then every change until it finishes"""
+    updates = event_bus.subscribe(f"bill:{bill_id}")
+    
+    try:
+        status = await _bill_status(bill_id)
+        yield f"event: status\ndata: {json.dumps(status)}\n\n"
+        
+        while status.get("status") not in (STATUS_COMPLETED, STATUS_ERROR):
+            try:
+                status = await asyncio.wait_for(updates.get(), timeout=config.EVENTS_KEEPALIVE_INTERVAL)
+            except asyncio.TimeoutError:
+                # Keeps proxies from closing an idle connection
+                yield ": keep-alive\n\n"
+                continue
+            yield f"event: status\ndata: {json.dumps(status)}\n\n"
+    finally:
+        event_bus.unsubscribe(f"bill:{bill_id}", updates)
+
+@app.get("/bill/{bill_id}/events")
+async def get_bill_events(bill_id: str):
+    """
+    Subscribe to a bill's status changes as Server-Sent Events
+
+    Sends the current status immediately, then each transition as the
+    workers report it, and closes after the final result. Unknown bills
+    get a 404 instead of a stream that would never finish.
+    """
+    await _bill_status(bill_id)
+    return StreamingResponse(_bill_events(bill_id), media_type="text/event-stream")
+
+@app.get("/bills", response_model=dict)
+async def list_bills(
+    vendor: Optional[str] = None,
+    template: Optional[str] = None,
+    status: Optional[str] = None,
+    validation: Optional[str] = None,
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None
 ):
+    """
+    List processed bills, newest first, filtered by indexed fields
+
+    vendor matches a prefix of the vendor name; status is completed or
+    error; validation is complete or incomplete; from/to are ISO dates
+    (bill date, or processing date when the bill date is unreadable).
+    Pass next_cursor back as cursor to get the next page.
+    """
+    return await run_in_threadpool(
+        result_store.query,
+        vendor=vendor, template_id=template, status=status, validation=validation,
+        date_from=date_from, date_to=date_to, limit=limit, cursor=cursor
+    )
+
+def _find_original(bill_id: str) -> Tuple[Optional[str], Optional[str]]:
+    """Filename and SHA-256 of a bill's upload, from its latest job or saved result"""
+    job = job_queue.get_latest_job(bill_id)
+    if job is not None:
+        return job["filename"], job["file_hash"]
+    result = _load_result(bill_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Bill not found")
+    return result.get("filename"), result.get("file_hash")
+
+@app.post("/reprocess-bill/", response_model=dict)
+async def reprocess_bill(request: ProcessingRequest):
     """
     Reprocess a bill with a specific template
     """
     # Find the original file
     bill_id = request.bill_id
-    result_path = os.path.join("processed", f"{bill_id}.json")
-    
-    if not os.path.exists(result_path):
-        raise HTTPException(status_code=404, detail="Bill not found")
-    
-    with open(result_path, 'r') as f:
-        result = json.load(f)
+    filename, file_hash = await run_in_threadpool(_find_original, bill_id)
     
-    filename = result.get("filename")
     if not filename or not os.path.exists(os.path.join("uploads", filename)):
         raise HTTPException(status_code=404, detail="Original bill file not found")
     
-    # Queue reprocessing with specified template
-    background_tasks.add_task(
-        process_document_task, 
-        filename, 
-        bill_id, 
-        request.template_id
-    )
+    # Queue reprocessing with specified template; the hash lets the
+    # worker find the cached OCR without reading the file again
+    await run_in_threadpool(job_queue.enqueue, bill_id, filename, request.template_id, request.priority, file_hash)
     
     return {
         "status": "reprocessing",
@@ -214,30 +606,71 @@ async def reprocess_bill(
         "bill_id": bill_id
     }
 
+def _etag_matches(request: Request, etag: str) -> bool:
+    """Whether the client's If-None-Match already names this version"""
+    tags = [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]
+    return etag in tags or "*" in tags
+
+async def _cached_json(request: Request, etag: str, render) -> Response:
+    """
+    A JSON response clients revalidate with If-None-Match
+
+    Unchanged content is answered with 304 and no body; otherwise
+    render() produces the body, in the threadpool.
+    """
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    body = await run_in_threadpool(render)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+async def _with_fresh_templates(respond):
+    """
+    Await respond(snapshot) with the current templates, or with freshly
+    refreshed ones if a template file changed after the snapshot was built
+    """
+    try:
+        return await respond(await run_in_threadpool(template_manager.snapshot))
+    except TemplateChangedError:
+        return await respond(await run_in_threadpool(template_manager.refresh))
+
 @app.get("/templates/", response_model=Dict[str, Any])
-async def get_templates():
+async def get_templates(request: Request, summary: bool = False):
     """
     Get all available templates
+
+    With summary=true, only each template's name and description. The
+    ETag changes whenever any template does; the body is serialized once
+    per version of the templates.
     """
-    return template_manager.get_all_templates()
+    async def respond(templates: TemplateSnapshot) -> Response:
+        etag = f'"{templates.version}{"-summary" if summary else ""}"'
+        return await _cached_json(request, etag, lambda: templates.listing(summary))
+    
+    return await _with_fresh_templates(respond)
 
 @app.get("/template/{template_id}", response_model=Dict[str, Any])
-async def get_template(template_id: str):
+async def get_template(template_id: str, request: Request):
     """
     Get a specific template
+
+    The ETag changes whenever the template file does.
     """
-    template = template_manager.get_template(template_id)
-    if not template:
-        raise HTTPException(status_code=404, detail="Template not found")
+    async def respond(templates: TemplateSnapshot) -> Response:
+        entry = templates.entry(template_id)
+        template = await run_in_threadpool(lambda: entry.template) if entry else None
+        if not template:
+            raise HTTPException(status_code=404, detail="Template not found")
+        return await _cached_json(request, entry.etag, lambda: json.dumps(template))
     
-    return template
+    return await _with_fresh_templates(respond)
 
 @app.post("/template/{template_id}", response_model=Dict[str, str])
 async def save_template(template_id: str, template_data: TemplateData):
     """
     Save a new or update an existing template
     """
-    success = template_manager.save_template(template_id, template_data.dict())
+    success = await run_in_threadpool(template_manager.save_template, template_id, template_data.dict())
     
     if success:
         return {
@@ -247,6 +680,84 @@ async def save_template(template_id: str, template_data: TemplateData):
     else:
         raise HTTPException(status_code=500, detail="Failed to save template")
 
+@app.get("/cache/stats", response_model=Dict[str, Any])
+async def get_cache_stats():
+    """
+    Get hit/miss counters and size of the OCR and LLM result caches
+    """
+    return await run_in_threadpool(result_cache.stats)
+
+def _render_metrics() -> str:
+    """Stored histograms and counters plus the live queue and cache state"""
+    lines = metrics.render(METRIC_HELP)
+    
+    counts = job_queue.counts()
+    lines += render_metric("queue_jobs", "gauge", "Jobs in the queue, by status",
+                           [({"status": status}, count) for status, count in sorted(counts.items())])
+    lines += render_metric("jobs_in_flight", "gauge", "Jobs being processed by workers",
+                           [({}, counts.get(STATUS_PROCESSING, 0))])
+    
+    cache_stats = sorted(result_cache.stats().items())
+    lines += render_metric("cache_hits_total", "counter", "Result cache hits, by namespace",
+                           [({"namespace": namespace}, stats["hits"]) for namespace, stats in cache_stats])
+    lines += render_metric("cache_misses_total", "counter", "Result cache misses, by namespace",
+                           [({"namespace": namespace}, stats["misses"]) for namespace, stats in cache_stats])
+    lines += render_metric("cache_hit_ratio", "gauge", "Share of result cache lookups that hit, by namespace",
+                           [({"namespace": namespace}, stats["hit_rate"]) for namespace, stats in cache_stats])
+    lines += render_metric("cache_bytes", "gauge", "Size of stored cache entries, by namespace",
+                           [({"namespace": namespace}, stats["bytes"] or 0) for namespace, stats in cache_stats])
+    
+    lines += render_metric("event_subscribers", "gauge", "Open status event streams on this API process",
+                           [({}, event_bus.subscriber_count())])
+    
+    startup = getattr(app.state, "startup", None)
+    if startup is None:
+        return "\n".join(lines) + "\n"
+    lines += render_metric("api_startup_seconds", "gauge", "Seconds this API process took to import and start",
+                           [({"phase": "import"}, startup["import_seconds"]),
+                            ({"phase": "ready"}, startup["startup_seconds"])])
+    lines += render_metric("api_worker_only_modules", "gauge",
+                           "OCR/LLM modules loaded by this API process (should be 0)",
+                           [({}, len(startup["worker_only_modules"]))])
+    return "\n".join(lines) + "\n"
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Prometheus metrics: per-stage timing histograms and bill counters from
+    every worker, queue depth, in-flight jobs and cache hit rates
+    """
+    return PlainTextResponse(await run_in_threadpool(_render_metrics),
+                             media_type="text/plain; version=0.0.4")
+
+@app.on_event("startup")
+async def start_status_watcher():
+    """Push job state changes from the workers to the status index and subscribers"""
+    watcher = StatusWatcher(job_queue, event_bus, status_index, _build_bill_status,
+                            config.STATUS_WATCH_INTERVAL)
+    app.state.status_watcher = asyncio.create_task(watcher.run())
+
+@app.on_event("startup")
+async def report_startup():
+    """Log how long the API took to start, and any heavy module it loaded"""
+    app.state.startup = startup_report(IMPORT_STARTED, IMPORTED)
+    startup = app.state.startup
+    logger.info("API started in %.2fs (imports %.2fs), peak RSS %.0f MB",
+                startup["startup_seconds"], startup["import_seconds"], startup["peak_rss_bytes"] / 2 ** 20)
+    if startup["worker_only_modules"]:
+        logger.warning("API process loaded worker-only modules: %s", ", ".join(startup["worker_only_modules"]))
+
+@app.on_event("shutdown")
+async def stop_status_watcher():
+    app.state.status_watcher.cancel()
+
+@app.get("/queue/stats", response_model=Dict[str, int])
+async def get_queue_stats():
+    """
+    Get the number of jobs in each state
+    """
+    return await run_in_threadpool(job_queue.counts)
+
 @app.get("/")
 async def root():
     return {
@@ -255,6 +766,8 @@ async def root():
         "status": "running"
     }
 
+IMPORTED = time.perf_counter()
+
 # Run the application
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,258 @@
+# page_analysis.py
+"""
+Page analysis before OCR: orientation, skew, content area and text size
+
+Photos and scans arrive turned, slightly skewed, with wide margins, and
+often with far more pixels than OCR needs. analyze_page() measures all of
+that from the character-like connected components of a downsampled copy,
+for a small fraction of what OCR of the page costs. normalize_page()
+then turns, straightens, crops and rescales the full page, so Tesseract
+gets upright text at a consistent x-height and no more pixels than that
+takes.
+"""
+import math
+from typing import Dict, Any, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from layout import WordBoxes
+
+# Longest side of the copy the analysis runs on, at most; pages are
+# shrunk by a whole factor, which OpenCV's area resize does fastest
+ANALYSIS_MAX_SIDE = 1600
+# With fewer character-like components than this the page is left alone
+MIN_COMPONENTS = 30
+# Skew search range and steps, in degrees
+MAX_SKEW = 10.0
+COARSE_SKEW_STEP = 1.0
+FINE_SKEW_STEP = 0.1
+# Smaller skews are not worth a resampling pass
+MIN_SKEW = 0.2
+# Lines must be this much sharper across than down the page to turn it,
+# and descenders this much more common than ascenders to flip it
+ORIENTATION_MARGIN = 1.3
+# Minimum number of ascenders plus descenders for the flip decision
+MIN_ORIENTATION_VOTES = 20
+# Pages within this fraction of the target x-height are not rescaled,
+# and rescaling is limited to this range
+SCALE_TOLERANCE = 0.15
+MIN_SCALE = 0.25
+MAX_SCALE = 2.0
+# Margin kept around the content, in x-heights, and the share of the
+# page a crop must remove to be worth it
+CROP_MARGIN = 2.0
+MIN_CROP_SAVING = 0.05
+
+# cv2.rotate codes for turning a page counter-clockwise by 90, 180, 270 degrees
+ROTATE_CODES = {
+    90: cv2.ROTATE_90_COUNTERCLOCKWISE,
+    180: cv2.ROTATE_180,
+    270: cv2.ROTATE_90_CLOCKWISE,
+}
+
+def _character_boxes(binary: np.ndarray) -> np.ndarray:
+    """Boxes (x, y, w, h) of the components that look like characters"""
+    _, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    stats = stats[1:]
+    height = binary.shape[0]
+    w, h, area = stats[:, cv2.CC_STAT_WIDTH], stats[:, cv2.CC_STAT_HEIGHT], stats[:, cv2.CC_STAT_AREA]
+    # Not specks, rules, pictures or solid blocks
+    keep = (h >= 3) & (h <= height / 15) & (w <= 5 * h) & (area >= 4) & (area <= 0.9 * w * h)
+    return stats[keep, :4].astype(np.float64)
+
+def _line_sharpness(x: np.ndarray, y: np.ndarray, angle: float, bin_size: float, extent: float) -> float:
+    """
+    How sharply the points fall into horizontal lines after rotating by angle
+
+    Sum of squared histogram counts of the rotated y coordinates,
+    relative to an even spread over the same bins.
+    """
+    radians = math.radians(angle)
+    rotated = -math.sin(radians) * x + math.cos(radians) * y
+    bins = ((rotated + extent) / bin_size).astype(np.int64)
+    counts = np.bincount(bins, minlength=int(2 * extent / bin_size) + 1)
+    return float(np.dot(counts, counts)) * len(counts) / len(x) ** 2
+
+def _best_angle(x: np.ndarray, y: np.ndarray, around: float, bin_size: float, extent: float) -> Tuple[float, float]:
+    """Angle within MAX_SKEW of around that lines the points up best, and its sharpness"""
+    def search(center: float, span: float, step: float) -> Tuple[float, float]:
+        angles = np.arange(center - span, center + span + step / 2, step)
+        scores = [_line_sharpness(x, y, angle, bin_size, extent) for angle in angles]
+        best = int(np.argmax(scores))
+        return float(angles[best]), scores[best]
+
+    angle, _ = search(around, MAX_SKEW, COARSE_SKEW_STEP)
+    return search(angle, COARSE_SKEW_STEP, FINE_SKEW_STEP)
+
+def _turn_points(x: np.ndarray, y: np.ndarray, rotation: int, width: int, height: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Where points land when the page is turned counter-clockwise by cv2.rotate"""
+    if rotation == 90:
+        return y, width - 1 - x
+    if rotation == 180:
+        return width - 1 - x, height - 1 - y
+    if rotation == 270:
+        return height - 1 - y, x
+    return x, y
+
+def _descenders_dominate(centers_y: np.ndarray, heights: np.ndarray, x_height: float) -> bool:
+    """
+    Whether the text looks upside down
+
+    Latin-script lines have more ascenders (b, d, h, k, l, t, capitals
+    and digits) rising above the x-height than descenders (g, j, p, q, y)
+    dropping below the baseline. Upside down, that reverses.
+    """
+    order = np.argsort(centers_y)
+    centers_y, heights = centers_y[order], heights[order]
+    tops, bottoms = centers_y - heights / 2, centers_y + heights / 2
+    line_starts = np.flatnonzero(np.diff(centers_y) > 0.6 * x_height) + 1
+
+    ascenders = descenders = 0
+    for line in np.split(np.arange(len(centers_y)), line_starts):
+        if len(line) < 3:
+            continue
+        top, bottom = np.median(tops[line]), np.median(bottoms[line])
+        ascenders += int(np.sum(tops[line] < top - 0.3 * x_height))
+        descenders += int(np.sum(bottoms[line] > bottom + 0.3 * x_height))
+    return ascenders + descenders >= MIN_ORIENTATION_VOTES and descenders > ORIENTATION_MARGIN * ascenders
+
+def _identity(gray: np.ndarray) -> Dict[str, Any]:
+    height, width = gray.shape[:2]
+    return {"applied": False, "rotation": 0, "skew": 0.0, "x_height": None, "scale": 1.0,
+            "crop": [0, 0, width, height], "size": [width, height]}
+
+def analyze_page(gray: np.ndarray, target_x_height: Optional[float] = None, crop_margin: float = CROP_MARGIN,
+                 min_crop_saving: float = MIN_CROP_SAVING, crop_outliers: float = 0.0) -> Dict[str, Any]:
+    """
+    Measure a page's orientation, skew, content area and x-height
+
+    Returns {"applied": whether normalize_page changes anything,
+    "rotation": counter-clockwise turn (0, 90, 180 or 270), "skew":
+    further counter-clockwise degrees, "x_height" in pixels (None when
+    the page has too little text to tell), "scale" bringing it to
+    target_x_height (1 without a target), "crop": [x0, y0, x1, y1] of the content on the
+    turned and straightened page, "size": [width, height] of that page}.
+    The crop keeps crop_margin x-heights around the text, and is only
+    made when it removes at least min_crop_saving of the page. It may
+    leave out the crop_outliers share of character boxes furthest out on
+    each side, so specks and photo edges do not decide it.
+    """
+    if gray.ndim == 3:
+        gray = cv2.cvtColor(gray, cv2.COLOR_BGR2GRAY)
+    height, width = gray.shape
+    shrink = 1 / math.ceil(max(height, width) / ANALYSIS_MAX_SIDE)
+    small = gray if shrink == 1.0 else cv2.resize(gray, None, fx=shrink, fy=shrink, interpolation=cv2.INTER_AREA)
+    small_height, small_width = small.shape
+
+    # Ink is white; adaptive thresholding copes with uneven lighting in photos
+    binary = cv2.adaptiveThreshold(small, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 25, 15)
+    boxes = _character_boxes(binary)
+    if len(boxes) < MIN_COMPONENTS:
+        return _identity(gray)
+
+    x = boxes[:, 0] + boxes[:, 2] / 2
+    y = boxes[:, 1] + boxes[:, 3] / 2
+    size_hint = float(np.median(np.minimum(boxes[:, 2], boxes[:, 3])))
+    bin_size = max(1.0, size_hint / 3)
+    extent = math.hypot(small_width, small_height) / 2 + bin_size
+    centered_x, centered_y = x - small_width / 2, y - small_height / 2
+
+    # Text lines run across the page, or down it when the page is turned
+    angle, sharpness = _best_angle(centered_x, centered_y, 0.0, bin_size, extent)
+    turned_angle, turned_sharpness = _best_angle(centered_x, centered_y, 90.0, bin_size, extent)
+    rotation = 0
+    if turned_sharpness > ORIENTATION_MARGIN * sharpness:
+        rotation, angle = 90, turned_angle - 90
+    skew = angle if abs(angle) >= MIN_SKEW else 0.0
+
+    # Character boxes on the turned and straightened page
+    if rotation == 90:
+        upright_width, upright_height = small_height, small_width
+        heights = boxes[:, 2]
+    else:
+        upright_width, upright_height = small_width, small_height
+        heights = boxes[:, 3]
+    x, y = _turn_points(x, y, rotation, small_width, small_height)
+    if skew:
+        matrix = cv2.getRotationMatrix2D((upright_width / 2, upright_height / 2), skew, 1.0)
+        x, y = (matrix[0, 0] * x + matrix[0, 1] * y + matrix[0, 2],
+                matrix[1, 0] * x + matrix[1, 1] * y + matrix[1, 2])
+    widths = boxes[:, 3] if rotation == 90 else boxes[:, 2]
+
+    # Lowercase letters without ascenders are the most common characters,
+    # so the lower part of the height distribution is the x-height
+    x_height = float(np.percentile(heights, 35))
+    if _descenders_dominate(y, heights, x_height):
+        rotation = (rotation + 180) % 360
+        x, y = upright_width - 1 - x, upright_height - 1 - y
+
+    # Content area, with a margin, unless cropping saves too little
+    margin = crop_margin * x_height
+    low, high = 100 * crop_outliers, 100 * (1 - crop_outliers)
+    crop = np.array([
+        max(0.0, np.percentile(x - widths / 2, low) - margin), max(0.0, np.percentile(y - heights / 2, low) - margin),
+        min(float(upright_width), np.percentile(x + widths / 2, high) + margin),
+        min(float(upright_height), np.percentile(y + heights / 2, high) + margin)
+    ]) / shrink
+    full_width, full_height = (height, width) if rotation in (90, 270) else (width, height)
+    crop = [int(crop[0]), int(crop[1]), min(full_width, int(math.ceil(crop[2]))),
+            min(full_height, int(math.ceil(crop[3])))]
+    if (crop[2] - crop[0]) * (crop[3] - crop[1]) > (1 - min_crop_saving) * full_width * full_height:
+        crop = [0, 0, full_width, full_height]
+
+    x_height /= shrink
+    scale = min(MAX_SCALE, max(MIN_SCALE, target_x_height / x_height)) if target_x_height else 1.0
+    if abs(scale - 1) <= SCALE_TOLERANCE:
+        scale = 1.0
+
+    applied = bool(rotation or skew or scale != 1.0 or crop != [0, 0, full_width, full_height])
+    return {"applied": applied, "rotation": rotation, "skew": round(skew, 2), "x_height": round(x_height, 1),
+            "scale": round(scale, 3), "crop": crop, "size": [full_width, full_height]}
+
+def normalize_page(img: np.ndarray, analysis: Dict[str, Any]) -> np.ndarray:
+    """
+    Turn, straighten, crop and rescale a page as analyze_page found
+
+    Downscaling happens first and upscaling last, so the other steps
+    work on as few pixels as possible.
+    """
+    if not analysis["applied"]:
+        return img
+    if analysis["rotation"]:
+        img = cv2.rotate(img, ROTATE_CODES[analysis["rotation"]])
+
+    scale = analysis["scale"]
+    x0, y0, x1, y1 = analysis["crop"]
+    if scale < 1:
+        # Bilinear is as good as area averaging for mild reductions, and faster
+        interpolation = cv2.INTER_AREA if scale < 0.5 else cv2.INTER_LINEAR
+        img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=interpolation)
+        x0, y0, x1, y1 = (int(round(value * scale)) for value in (x0, y0, x1, y1))
+    if analysis["skew"]:
+        height, width = img.shape[:2]
+        matrix = cv2.getRotationMatrix2D((width / 2, height / 2), analysis["skew"], 1.0)
+        img = cv2.warpAffine(img, matrix, (width, height), flags=cv2.INTER_LINEAR,
+                             borderMode=cv2.BORDER_REPLICATE)
+    img = img[y0:max(y1, y0 + 1), x0:max(x1, x0 + 1)]
+    if scale > 1:
+        img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+    return np.ascontiguousarray(img)
+
+def unmap_words(words: WordBoxes, analysis: Dict[str, Any]) -> WordBoxes:
+    """
+    Word boxes read from a normalized page, in the coordinates of the
+    turned and straightened page before cropping and rescaling
+
+    Template regions are fractions of the whole upright page, so they
+    keep selecting the same words however much margin was cropped.
+    """
+    if not analysis["applied"]:
+        return words
+    x0, y0 = analysis["crop"][:2]
+    boxes = words.boxes.astype(np.float64) / analysis["scale"]
+    boxes[:, 0] += x0
+    boxes[:, 1] += y0
+    width, height = analysis["size"]
+    return WordBoxes(words.words, np.rint(boxes).astype(np.int32), words.confidences,
+                     words.lines, words.paragraphs, width, height)
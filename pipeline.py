@@ -0,0 +1,347 @@
+# pipeline.py
+import os
+import time
+import logging
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+from datetime import datetime
+
+import numpy as np
+
+import config
+from processor import DocumentProcessor, text_source
+from fingerprint_index import FINGERPRINT_FORMAT, FingerprintIndex, page_fingerprint
+from cache import ResultCache, hash_file, hash_text, cache_key
+from template_manager import TemplateChangedError, TemplateManager, TemplateSnapshot
+from result_store import create_result_store
+from llm_extractor import BaseLLMExtractor, create_data_extractor
+from telemetry import Trace, MetricsStore
+
+logger = logging.getLogger(__name__)
+
+# Create necessary directories
+os.makedirs("uploads", exist_ok=True)
+os.makedirs("processed", exist_ok=True)
+
+# Initialize components (once per worker process)
+result_cache = ResultCache()
+document_processor = DocumentProcessor(cache=result_cache)
+template_manager = TemplateManager()
+result_store = create_result_store()
+metrics = MetricsStore()
+fingerprint_index = FingerprintIndex()
+
+# The LLM extractor is created on first use, so workers whose bills never
+# reach the LLM tier do not load a model client at all
+_data_extractor = None
+_data_extractor_loaded = False
+_data_extractor_lock = threading.Lock()
+
+def get_data_extractor() -> Optional[BaseLLMExtractor]:
+    """The process's LLM extractor, or None when it cannot be created"""
+    global _data_extractor, _data_extractor_loaded
+    with _data_extractor_lock:
+        if not _data_extractor_loaded:
+            try:
+                _data_extractor = create_data_extractor()
+            except Exception as e:
+                logger.warning("LLM extractor not available, using basic extraction only: %s", e)
+            _data_extractor_loaded = True
+    return _data_extractor
+
+def extract_with_llm(ocr_text: str, fields: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    Run LLM extraction, reusing the cached output for identical text
+
+    fields (field name -> template field config) limits the request to
+    those fields.
+    """
+    data_extractor = get_data_extractor()
+    llm_key = cache_key(hash_text(ocr_text), data_extractor.cache_version, *sorted(fields or ()))
+    extracted_data = result_cache.get("llm", llm_key)
+    
+    if extracted_data is None:
+        extracted_data = data_extractor.extract_data(ocr_text, fields)
+        # Failed extractions are retried next time, not cached
+        if "error" not in extracted_data:
+            result_cache.put("llm", llm_key, extracted_data)
+    
+    return extracted_data
+
+def read_regions_first(filename: str, template_id: Optional[str], templates: TemplateSnapshot,
+                       header_page: Optional[np.ndarray] = None,
+                       file_hash: Optional[str] = None) -> Tuple[Optional[Dict[str, Any]], Dict[str, float]]:
+    """
+    Try to process a bill from its template's regions of interest alone
+
+    Unless the template is given, it is identified from a low-DPI pass
+    over the top of the first page. If that template declares regions,
+    only those are OCR'd, at high DPI. Returns the extraction when it
+    finds every required field, otherwise None (the caller then OCRs
+    whole pages), together with the time spent either way. templates is
+    the snapshot the bill is processed with; header_page the first page
+    at HEADER_DPI, when already rendered. Both passes are cached by
+    file_hash, so reprocessing reads neither again.
+    """
+    timings = {}
+    if not template_id:
+        header = document_processor.read_header(filename, page=header_page, file_hash=file_hash)
+        timings.update({f"header_{stage}": seconds for stage, seconds in header["timings"].items()})
+        template_id = templates.identify_template({}, header["text"])
+    if template_id not in templates.region_templates:
+        return None, timings
+    
+    profile = templates.get_preprocess_profile(template_id)
+    regions = document_processor.ocr_regions(filename, templates.get_regions(template_id), profile, file_hash)
+    timings.update({f"regions_{stage}": seconds for stage, seconds in regions["timings"].items()})
+    
+    start = time.perf_counter()
+    extracted_data = templates.extract_regions(
+        template_id, {name: region["text"] for name, region in regions["regions"].items()}
+    )
+    template_mapped = templates.map_to_template(template_id, extracted_data)
+    timings["regions_extract"] = time.perf_counter() - start
+    
+    if template_mapped.get("validation", {}).get("status") != "complete":
+        return None, timings
+    return {
+        "template_id": template_id,
+        "extracted_data": extracted_data,
+        "template_data": template_mapped,
+        "text_source": text_source(region["source"] for region in regions["regions"].values())
+    }, timings
+
+def _region_texts(pages: List[Dict[str, Any]], regions: List[Dict[str, Any]]) -> Dict[str, str]:
+    """Text of each region of interest, cut from the full pages' word boxes"""
+    texts = {}
+    for region in regions:
+        page_number = region.get("page", 1)
+        index = page_number - 1 if page_number > 0 else len(pages) + page_number
+        if 0 <= index < len(pages) and pages[index].get("words") is not None:
+            texts[region["name"]] = pages[index]["words"].region(region["box"]).text()
+    return texts
+
+def route_by_fingerprint(filename: str, template_id: Optional[str], templates: TemplateSnapshot,
+                         file_hash: str) -> Tuple[Optional[str], Optional[np.ndarray], np.ndarray]:
+    """
+    Fingerprint a bill's header and, unless its template is given, look it up
+
+    Returns the matched template (or None), the first page at HEADER_DPI
+    for the header pass to reuse (None when the fingerprint was cached),
+    and the fingerprint, so the bill can be learned from once its
+    template is confirmed.
+    """
+    key = cache_key(file_hash, config.HEADER_DPI, FINGERPRINT_FORMAT)
+    cached = result_cache.get("fingerprint", key)
+    if cached is not None:
+        page, fingerprint = None, np.frombuffer(bytes.fromhex(cached), dtype=np.uint8)
+    else:
+        page = document_processor.header_page(filename)
+        fingerprint = page_fingerprint(page)
+        result_cache.put("fingerprint", key, fingerprint.tobytes().hex())
+    if template_id:
+        return None, page, fingerprint
+    match = fingerprint_index.match(fingerprint, set(templates.template_ids()))
+    return (match[0] if match else None), page, fingerprint
+
+def learn_fingerprint(result: Dict[str, Any], fingerprint: Optional[np.ndarray]):
+    """
+    Remember a bill's fingerprint when its template assignment is confirmed
+
+    Confirmed means the template was given (on upload or reprocessing) or
+    identified from the text, and every required field was found. Bills
+    routed by fingerprint are not learned from, so a wrong match cannot
+    reinforce itself; neither is the catch-all generic template.
+    """
+    if (fingerprint is None or result["routing"] == "fingerprint" or result["template_id"] == "generic"
+            or result["validation"].get("status") != "complete"):
+        return
+    if fingerprint_index.add(result["template_id"], fingerprint, result["bill_id"]):
+        logger.info("Learned the header fingerprint of template %s from bill %s",
+                    result["template_id"], result["bill_id"])
+
+def _save_result(result: Dict[str, Any], trace: Trace) -> Dict[str, Any]:
+    """
+    Save a processed bill and record its timings in the shared metrics
+
+    The result carries every stage up to the save; the save itself
+    ("persist") is only known afterwards, so it goes to the metrics alone.
+    """
+    result["timings"]["total"] = trace.elapsed()
+    with trace.stage("persist"):
+        result_store.save(result)
+    
+    metrics.observe_stages(trace.timings)
+    if not result["ocr_cached"]:
+        metrics.observe_many("bill_page_stage_seconds", [
+            ({"stage": stage}, seconds)
+            for page in result["pages"] for stage, seconds in page["timings"].items()
+        ])
+    metrics.inc("bills_processed_total", {
+        "status": result["status"],
+        "tier": result["extraction"]["tier"],
+        "text_source": result["text_source"],
+        "routing": result["routing"]
+    })
+    logger.info("Processed bill %s (%s, %s tier) in %.2fs", result["bill_id"], result["template_id"],
+                result["extraction"]["tier"], trace.timings["total"])
+    return result
+
+# Times a bill starts over when a template it uses is rewritten while it
+# is being processed, before the job itself fails
+TEMPLATE_CHANGE_RESTARTS = 3
+
+def process_document_task(filename: str, bill_id: str, template_id: Optional[str] = None,
+                          file_hash: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Process an uploaded bill and save the result to the result store
+
+    Exceptions propagate to the caller so the job queue can retry the
+    job; save_error_result records a job that ran out of attempts.
+    The seconds spent in each stage are saved under "timings". file_hash
+    is the upload's SHA-256 when the API computed it.
+    """
+    # Every cached pass over the file (header, regions, pages) is keyed by it
+    file_hash = file_hash or hash_file(os.path.join(document_processor.uploads_dir, filename))
+    # One set of templates for the whole bill, even if they change meanwhile.
+    # A template file rewritten before it is first read cannot be read from
+    # the snapshot; the bill then starts over on the new templates, without
+    # using up a job attempt (OCR is cached, so a restart is cheap)
+    templates = template_manager.snapshot()
+    for restart in range(TEMPLATE_CHANGE_RESTARTS + 1):
+        try:
+            return _process_with_templates(filename, bill_id, template_id, file_hash, templates)
+        except TemplateChangedError as e:
+            if restart == TEMPLATE_CHANGE_RESTARTS:
+                raise
+            logger.info("Restarting bill %s on refreshed templates: %s", bill_id, e)
+            templates = template_manager.refresh()
+
+def _process_with_templates(filename: str, bill_id: str, template_id: Optional[str],
+                            file_hash: str, templates: TemplateSnapshot) -> Dict[str, Any]:
+    """Process a bill against one snapshot of the templates"""
+    trace = Trace(bill_id)
+    routing = "given" if template_id else "identified"
+    
+    # Step 0: Bills whose header matches a known vendor's go straight to
+    # that template, before any OCR
+    header_page, fingerprint = None, None
+    if config.FINGERPRINT_ROUTING:
+        try:
+            with trace.stage("fingerprint"):
+                matched, header_page, fingerprint = route_by_fingerprint(filename, template_id, templates, file_hash)
+        except Exception as e:
+            # Routing is an optimization; the bill can still be processed
+            logger.warning("Could not fingerprint bill %s: %s", bill_id, e)
+        else:
+            if matched:
+                template_id, routing = matched, "fingerprint"
+    
+    # Templates with regions of interest are read from those regions
+    # alone when that is enough
+    if templates.region_templates and (not template_id or template_id in templates.region_templates):
+        region_result, region_timings = read_regions_first(filename, template_id, templates, header_page, file_hash)
+        trace.add(region_timings)
+        if region_result is not None:
+            result = _save_result({
+                "bill_id": bill_id,
+                "filename": filename,
+                "processed_date": datetime.now().isoformat(),
+                "status": "completed",
+                **region_result,
+                "validation": region_result["template_data"].get("validation", {}),
+                "extraction": {"tier": "regions", "llm_fields": []},
+                "routing": routing,
+                "file_hash": file_hash,
+                "ocr_cached": False,
+                "timings": trace.timings,
+                "pages": []
+            }, trace)
+            learn_fingerprint(result, fingerprint)
+            return result
+    
+    # Step 1: Rasterize and OCR the document (once per page), using the
+    # template's preprocessing profile when the template is known
+    profile = templates.get_preprocess_profile(template_id) if template_id else None
+    ocr_result = document_processor.process_document(filename, profile, file_hash=file_hash)
+    basic_data = ocr_result["bill_data"]
+    ocr_text = ocr_result["text"]
+    trace.add(ocr_result["timings"])
+    
+    # Step 2: Identify the best template if none specified
+    if not template_id:
+        with trace.stage("identify"):
+            template_id = templates.identify_template(basic_data, ocr_text)
+    
+    # Step 3: Apply the template's own patterns over the generic ones, and
+    # values found inside its regions of interest over both
+    with trace.stage("extract_template"):
+        extracted_data = dict(basic_data)
+        extracted_data.update(templates.extract_fields(template_id, ocr_text))
+        regions = templates.get_regions(template_id)
+        if regions:
+            extracted_data.update(templates.extract_regions(
+                template_id, _region_texts(ocr_result["pages"], regions)
+            ))
+    with trace.stage("map"):
+        template_mapped = templates.map_to_template(template_id, extracted_data)
+    
+    # Step 4: Ask the LLM, if available, for just the required fields
+    # deterministic extraction could not find
+    missing_required = template_mapped.get("validation", {}).get("missing_required", [])
+    extraction = {"tier": "regex", "llm_fields": []}
+    if missing_required and get_data_extractor():
+        with trace.stage("extract_llm"):
+            fields = templates.get_fields(template_id)
+            llm_data = extract_with_llm(ocr_text, {field: fields[field] for field in missing_required})
+        if "error" in llm_data:
+            # The template's result stands; the bill is not counted as
+            # extracted by the LLM
+            extraction.update(tier="llm_failed", llm_error=llm_data["error"])
+            logger.warning("LLM extraction failed for bill %s: %s", bill_id, llm_data["error"])
+        else:
+            for field in missing_required:
+                if llm_data.get(field) is not None:
+                    extracted_data[field] = llm_data[field]
+            with trace.stage("map"):
+                template_mapped = templates.map_to_template(template_id, extracted_data)
+            extraction.update(tier="llm", llm_fields=missing_required)
+    
+    # Step 5: Save the results, and learn the layout of confirmed bills
+    result = _save_result({
+        "bill_id": bill_id,
+        "filename": filename,
+        "processed_date": datetime.now().isoformat(),
+        "status": "completed",
+        "extracted_data": extracted_data,
+        "template_id": template_id,
+        "template_data": template_mapped,
+        "validation": template_mapped.get("validation", {}),
+        "extraction": extraction,
+        "routing": routing,
+        "text_source": ocr_result["text_source"],
+        "file_hash": ocr_result["file_hash"],
+        "ocr_cached": ocr_result["cached"],
+        "timings": trace.timings,
+        "pages": [
+            {"page_number": page["page_number"], "source": page["source"],
+             "profile": page["profile"], "analysis": page.get("analysis"), "timings": page["timings"]}
+            for page in ocr_result["pages"]
+        ]
+    }, trace)
+    learn_fingerprint(result, fingerprint)
+    return result
+
+def save_error_result(bill_id: str, filename: str, error: str) -> Dict[str, Any]:
+    """Save the result of a bill that could not be processed"""
+    error_result = {
+        "bill_id": bill_id,
+        "filename": filename,
+        "processed_date": datetime.now().isoformat(),
+        "status": "error",
+        "error": error
+    }
+    
+    result_store.save(error_result)
+    
+    return error_result
@@ -1,84 +1,788 @@
 # processor.py
 import os
 import cv2
-import pytesseract
-from pdf2image import convert_from_path
 import numpy as np
-from PIL import Image
-import re
-from typing import Dict, List, Tuple, Any
+import time
+import logging
+import subprocess
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Tuple, Any, Iterable, Iterator, Optional
 
-# Configuration
-pytesseract.pytesseract.tesseract_cmd = r'tesseract'  # Update this path if needed
+import config
+from cache import ResultCache, hash_file, cache_key
+from field_extractor import GENERIC_EXTRACTOR
+from layout import WordBoxes, parse_tsv, parse_pdftotext_bbox, text_layer_is_usable
+from page_analysis import analyze_page, normalize_page, unmap_words
+
+logger = logging.getLogger(__name__)
+
+# pdf2image and the OCR bindings are imported where they are used, so
+# importing this module (e.g. for its helpers) stays cheap
+
+class OCRBackend:
+    """
+    Base class for OCR backends
+
+    A backend is created once per worker and reused for every page it
+    OCRs, so engines that can stay loaded between calls only pay their
+    startup cost once.
+    """
+    name = "base"
+    
+    def image_to_string(self, img: np.ndarray) -> str:
+        """Return the text found in an 8-bit grayscale or BGR image"""
+        raise NotImplementedError
+    
+    def image_to_data(self, img: np.ndarray) -> WordBoxes:
+        """Return the words found in an image with their boxes and confidences"""
+        raise NotImplementedError
+    
+    def version(self) -> str:
+        """Version of the underlying OCR engine"""
+        raise NotImplementedError
+    
+    def close(self):
+        """Release any resources held by the engine"""
+        pass
+
+class PytesseractBackend(OCRBackend):
+    """
+    Runs the tesseract binary once per page through pytesseract
+
+    Every call encodes the page to a temp file and starts a new tesseract
+    process, which has to load its language model again. Kept as the
+    fallback because it only needs the binary to be installed.
+    """
+    name = "pytesseract"
+    
+    def __init__(self):
+        import pytesseract
+        self._pytesseract = pytesseract
+        pytesseract.pytesseract.tesseract_cmd = r'tesseract'  # Update this path if needed
+    
+    def image_to_string(self, img: np.ndarray) -> str:
+        return self._pytesseract.image_to_string(img)
+    
+    def image_to_data(self, img: np.ndarray) -> WordBoxes:
+        # pytesseract.image_to_data starts an extra `tesseract --version`
+        # process on every call; run the TSV renderer directly instead
+        tsv = self._pytesseract.pytesseract.run_and_get_output(img, "tsv", None, "-c tessedit_create_tsv=1", 0, 0)
+        return WordBoxes.from_tesseract(parse_tsv(tsv), img.shape[1], img.shape[0])
+    
+    def version(self) -> str:
+        return str(self._pytesseract.get_tesseract_version())
+
+class TesserocrBackend(OCRBackend):
+    """
+    Keeps a tesseract engine loaded in-process through the tesserocr C API
+
+    Pages are handed over as raw pixel buffers, with no encoding, temp
+    files or process spawns per page. Requires `pip install tesserocr`.
+    """
+    name = "tesserocr"
+    
+    def __init__(self, lang: str = "eng"):
+        import tesserocr
+        self._tesserocr = tesserocr
+        self._api = tesserocr.PyTessBaseAPI(lang=lang)
+    
+    def _set_image(self, img: np.ndarray):
+        img = np.ascontiguousarray(img)
+        height, width = img.shape[:2]
+        bytes_per_pixel = 1 if img.ndim == 2 else img.shape[2]
+        if bytes_per_pixel == 3:
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        self._api.SetImageBytes(img.tobytes(), width, height,
+                                bytes_per_pixel, bytes_per_pixel * width)
+    
+    def image_to_string(self, img: np.ndarray) -> str:
+        self._set_image(img)
+        return self._api.GetUTF8Text()
+    
+    def image_to_data(self, img: np.ndarray) -> WordBoxes:
+        self._set_image(img)
+        return WordBoxes.from_tesseract(parse_tsv(self._api.GetTSVText(0)), img.shape[1], img.shape[0])
+    
+    def version(self) -> str:
+        return self._tesserocr.tesseract_version().split()[1]
+    
+    def close(self):
+        self._api.End()
+
+OCR_BACKENDS = {
+    PytesseractBackend.name: PytesseractBackend,
+    TesserocrBackend.name: TesserocrBackend,
+}
+
+def create_ocr_backend(name: Optional[str] = None) -> OCRBackend:
+    """
+    Create an OCR backend by name
+
+    "auto" picks tesserocr when it is installed and falls back to pytesseract.
+    """
+    name = name or config.OCR_BACKEND
+    if name == "auto":
+        try:
+            return TesserocrBackend()
+        except Exception:
+            return PytesseractBackend()
+    
+    if name not in OCR_BACKENDS:
+        raise ValueError(f"Unknown OCR backend: {name}")
+    return OCR_BACKENDS[name]()
+
+# One long-lived backend per worker (per thread when OCR runs inline)
+_worker_state = threading.local()
+
+def get_ocr_backend() -> OCRBackend:
+    """Return this worker's OCR backend, creating it on first use"""
+    backend = getattr(_worker_state, "backend", None)
+    if backend is None:
+        backend = create_ocr_backend()
+        _worker_state.backend = backend
+    return backend
+
+def _init_ocr_worker(backend_name: str):
+    """Pool initializer: load the OCR engine before the first page arrives"""
+    _worker_state.backend = create_ocr_backend(backend_name)
+
+def _timed(timings: Dict[str, float], stage: str, func, *args):
+    """Call func and add its duration to timings[stage]"""
+    start = time.perf_counter()
+    result = func(*args)
+    timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+    return result
+
+def _threshold(gray: np.ndarray) -> np.ndarray:
+    _, binary = cv2.threshold(gray, 150, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return binary
+
+# Preprocessing profiles, cheapest first. Each takes an 8-bit grayscale
+# page and returns the binarized image handed to OCR.
+def _profile_fast(gray: np.ndarray, timings: Dict[str, float]) -> np.ndarray:
+    """Clean scans and digital renders: Otsu is all they need"""
+    return _timed(timings, "threshold", _threshold, gray)
+
+def _profile_balanced(gray: np.ndarray, timings: Dict[str, float]) -> np.ndarray:
+    """Mildly noisy scans and photos: a 3px median removes speckle before Otsu"""
+    smoothed = _timed(timings, "denoise", cv2.medianBlur, gray, 3)
+    return _timed(timings, "threshold", _threshold, smoothed)
+
+def _profile_quality(gray: np.ndarray, timings: Dict[str, float]) -> np.ndarray:
+    """Very noisy pages: non-local means on the binarized page (slowest)"""
+    binary = _timed(timings, "threshold", _threshold, gray)
+    return _timed(timings, "denoise", cv2.fastNlMeansDenoising, binary, None, 10, 7, 21)
+
+PREPROCESS_PROFILES = {
+    "fast": _profile_fast,
+    "balanced": _profile_balanced,
+    "quality": _profile_quality,
+}
+
+# Thresholds used by the "auto" profile (noise sigma and p5-p95 contrast
+# in gray levels, measured on a downsampled copy of the page)
+AUTO_FAST_MAX_NOISE = 2.0
+AUTO_FAST_MIN_CONTRAST = 80
+AUTO_BALANCED_MAX_NOISE = 6.0
+
+def measure_image_quality(gray: np.ndarray) -> Dict[str, float]:
+    """
+    Estimate noise and contrast of a grayscale page
+
+    Works on a copy downsampled to at most 1000px so it costs a few
+    milliseconds regardless of page size.
+    """
+    scale = 1000 / max(gray.shape[:2])
+    if scale < 1:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    
+    # Robust noise sigma from the residual against a median-filtered copy
+    residual = cv2.absdiff(gray, cv2.medianBlur(gray, 3))
+    noise = float(np.median(residual)) * 1.4826
+    low, high = np.percentile(gray, (5, 95))
+    
+    return {"noise": noise, "contrast": float(high - low)}
+
+def choose_preprocess_profile(gray: np.ndarray) -> str:
+    """Pick the cheapest preprocessing profile adequate for this page"""
+    quality = measure_image_quality(gray)
+    if quality["noise"] <= AUTO_FAST_MAX_NOISE and quality["contrast"] >= AUTO_FAST_MIN_CONTRAST:
+        return "fast"
+    if quality["noise"] <= AUTO_BALANCED_MAX_NOISE:
+        return "balanced"
+    return "quality"
+
+def run_preprocess_profile(img: np.ndarray, profile: Optional[str] = None) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """
+    Preprocess image for better OCR results
+
+    Returns the preprocessed image together with the profile that was
+    applied and the time spent in each stage.
+    """
+    profile = profile or config.PREPROCESS_PROFILE
+    if profile != "auto" and profile not in PREPROCESS_PROFILES:
+        raise ValueError(f"Unknown preprocessing profile: {profile}")
+    
+    timings = {}
+    if img.ndim == 3:
+        gray = _timed(timings, "grayscale", cv2.cvtColor, img, cv2.COLOR_BGR2GRAY)
+    else:
+        gray = img
+    
+    if profile == "auto":
+        profile = _timed(timings, "analyze", choose_preprocess_profile, gray)
+    
+    preprocessed = PREPROCESS_PROFILES[profile](gray, timings)
+    return preprocessed, {"profile": profile, "timings": timings}
+
+def preprocess_image(img: np.ndarray, profile: Optional[str] = None) -> np.ndarray:
+    """Preprocess image for better OCR results"""
+    return run_preprocess_profile(img, profile)[0]
+
+def ocr_work_unit(work_unit: Tuple[str, int, np.ndarray, Optional[str], bool, Optional[int]]) -> Dict[str, Any]:
+    """
+    Analyze, preprocess and OCR a single (document, page) work unit
+
+    Runs inside an OCR pool worker, so it must stay a module-level function.
+    The preprocessed image is only sent back when keep_image is set.
+    When x_height is given the page is first normalized to it (see
+    page_analysis); word boxes are then in the coordinates of the upright,
+    uncropped page, while the kept image is the normalized one.
+    """
+    doc_id, page_number, img, profile, keep_image, x_height = work_unit
+    
+    analysis = None
+    if x_height:
+        start = time.perf_counter()
+        analysis = analyze_page(img, x_height)
+        img = normalize_page(img, analysis)
+        page_analysis_seconds = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    preprocessed, preprocess_info = run_preprocess_profile(img, profile)
+    timings = preprocess_info["timings"]
+    timings["preprocess"] = time.perf_counter() - start
+    if analysis is not None:
+        timings["page_analysis"] = page_analysis_seconds
+    
+    start = time.perf_counter()
+    try:
+        words = get_ocr_backend().image_to_data(preprocessed)
+    except Exception as e:
+        # pytesseract's exceptions cannot be unpickled in the parent and
+        # would break the whole pool, so send a plain error back instead
+        raise RuntimeError(f"OCR failed for {doc_id} page {page_number}: {e}") from None
+    timings["ocr"] = time.perf_counter() - start
+    if analysis is not None:
+        words = unmap_words(words, analysis)
+    
+    result = {
+        "doc_id": doc_id,
+        "page_number": page_number,
+        "text": words.text(),
+        "words": words,
+        "profile": preprocess_info["profile"],
+        "analysis": analysis,
+        "timings": timings
+    }
+    if keep_image:
+        result["image"] = preprocessed
+    return result
+
+class OCREngine:
+    """
+    Farms (document, page) work units out to a pool of OCR worker processes
+
+    One engine is shared by every document being processed, so a large
+    statement spreads across all cores and several small bills can be
+    OCR'd side by side. At most queue_depth pages are in flight at once;
+    callers block on submission beyond that instead of piling rasters up
+    in memory.
+    """
+    def __init__(self, workers: Optional[int] = None, queue_depth: Optional[int] = None,
+                 backend: Optional[str] = None):
+        self.workers = config.OCR_WORKERS if workers is None else workers
+        self.backend = backend or config.OCR_BACKEND
+        self.queue_depth = max(1, config.OCR_QUEUE_DEPTH if queue_depth is None else queue_depth)
+        self._slots = threading.BoundedSemaphore(self.queue_depth)
+        self._executor = None
+        self._version = None
+        self._lock = threading.Lock()
+    
+    def version(self) -> str:
+        """Backend name and tesseract version, used to key cached OCR results"""
+        if self._version is None:
+            backend = create_ocr_backend(self.backend)
+            try:
+                self._version = f"{backend.name}-{backend.version()}"
+            finally:
+                backend.close()
+        return self._version
+    
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """Start the worker pool on first use"""
+        with self._lock:
+            if self._executor is None:
+                # Spawned workers do not inherit the API's threads or locks
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_ocr_worker,
+                    initargs=(self.backend,)
+                )
+            return self._executor
+    
+    def _discard_executor(self, executor: ProcessPoolExecutor):
+        """Drop a broken pool so the next document starts a fresh one"""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+    
+    def run(self, doc_id: str, images: Iterable[np.ndarray], profile: Optional[str] = None,
+            keep_images: bool = False, x_height: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        OCR every page of a document and return the page results in page order
+
+        images may be a generator: pages are pulled from it only as slots
+        free up, so at most queue_depth rasters exist at once. Preprocessed
+        images are only kept in the results when keep_images is set. With
+        x_height, whole pages are normalized to that x-height first.
+        """
+        if self.workers <= 1:
+            if getattr(_worker_state, "backend", None) is None:
+                _init_ocr_worker(self.backend)
+            return [ocr_work_unit((doc_id, page_number, img, profile, keep_images, x_height))
+                    for page_number, img in enumerate(images, start=1)]
+        
+        executor = self._get_executor()
+        futures = []
+        try:
+            for page_number, img in enumerate(images, start=1):
+                self._slots.acquire()
+                try:
+                    future = executor.submit(ocr_work_unit, (doc_id, page_number, img, profile, keep_images, x_height))
+                except Exception:
+                    self._slots.release()
+                    raise
+                future.add_done_callback(lambda _: self._slots.release())
+                futures.append(future)
+            
+            # Futures were collected in submission order, which keeps page order
+            return [future.result() for future in futures]
+        except BrokenProcessPool:
+            # A worker died (OOM kill, crash in tesseract). The pages may
+            # have come from a generator and cannot be resubmitted, so the
+            # job fails and is retried by the queue, on a fresh pool
+            logger.warning("OCR worker pool broke while processing %s; restarting it", doc_id)
+            self._discard_executor(executor)
+            raise
+        except Exception:
+            for future in futures:
+                future.cancel()
+            raise
+    
+    def shutdown(self):
+        """Stop the worker pool"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
+
+def text_source(sources: Iterable[str]) -> str:
+    """Where a document's text came from: "text_layer", "ocr" or "mixed" (pages disagree)"""
+    sources = set(sources)
+    if len(sources) > 1:
+        return "mixed"
+    return sources.pop() if sources else "ocr"
+
+# Bump when the shape of cached OCR results changes
+OCR_CACHE_FORMAT = "words-3"
+
+# Page width assumed for photos and scans, whose DPI is unknown, when
+# sizing them for a header or region pass, and the most such an image is
+# enlarged for region OCR
+PAGE_WIDTH_INCHES = 8.5
+REGION_MAX_UPSCALE = 3.0
 
 class DocumentProcessor:
     """
     Handles the processing of bill documents, including OCR and data extraction
     """
-    def __init__(self, uploads_dir="uploads", processed_dir="processed"):
+    def __init__(self, uploads_dir="uploads", processed_dir="processed",
+                 ocr_engine: Optional[OCREngine] = None, cache: Optional[ResultCache] = None):
         self.uploads_dir = uploads_dir
         self.processed_dir = processed_dir
+        self.ocr_engine = ocr_engine or OCREngine()
+        self.cache = cache
         os.makedirs(processed_dir, exist_ok=True)
     
-    def process_document(self, filename: str) -> Dict[str, Any]:
+    def process_document(self, filename: str, profile: Optional[str] = None,
+                         keep_images: bool = False, file_hash: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Process a document and return its OCR result
+
+        Every page is read exactly once, from the PDF text layer when it is
+        usable and by OCR otherwise. The result carries everything later
+        stages need, so nothing downstream has to touch the original file
+        again:
+
+            {
+                "text": full document text (pages joined by newlines),
+                "pages": [{"page_number", "text", "words", "image", "profile", "analysis", "source",
+                           "timings"}, ...],
+                "text_source": "text_layer", "ocr" or "mixed",
+                "bill_data": structured data from _extract_bill_data,
+                "timings": seconds spent per stage for the whole document,
+                "file_hash": SHA-256 of the file (only when a cache is set),
+                "cached": True when the OCR text came from the cache
+            }
+
+        profile selects the preprocessing profile ("fast", "balanced",
+        "quality" or "auto"); it defaults to config.PREPROCESS_PROFILE.
+        file_hash, when the caller already knows it (the API hashes
+        uploads while saving them), saves reading the file once more.
+
+        "words" holds the page's word boxes (layout.WordBoxes). "image",
+        the preprocessed raster handed to Tesseract, is only kept when
+        keep_images is set, since holding every page would make memory
+        grow with document length. It must not be written into result
+        JSON, and is missing from pages served from the cache.
+        """
+        profile = profile or config.PREPROCESS_PROFILE
+        
+        if self.cache is None:
+            result = self._ocr_document(filename, profile, keep_images)
+            result["cached"] = False
+        else:
+            # Same bytes, profile, resolution, page analysis and OCR engine
+            # always give the same text. A document first OCR'd with the
+            # default profile, before its template was known, is reused
+            # when it is reprocessed with a template of its own: "auto"
+            # already picked an adequate profile for each page
+            start = time.perf_counter()
+            file_hash = file_hash or hash_file(os.path.join(self.uploads_dir, filename))
+            ocr_keys = [self._ocr_cache_key(file_hash, candidate)
+                        for candidate in dict.fromkeys([profile, config.PREPROCESS_PROFILE])]
+            result = None
+            for ocr_key in ocr_keys:
+                result = self.cache.get("ocr", ocr_key)
+                if result is not None:
+                    break
+            
+            if result is not None:
+                # Page timings describe the original OCR run; the document
+                # timings describe this one
+                result["timings"] = {"ocr_cache": time.perf_counter() - start}
+                result["cached"] = True
+                for page in result["pages"]:
+                    page["words"] = WordBoxes.from_dict(page["words"])
+            else:
+                result = self._ocr_document(filename, profile, keep_images)
+                self.cache.put("ocr", ocr_keys[0], {
+                    "text": result["text"],
+                    "text_source": result["text_source"],
+                    "pages": [{key: value.to_dict() if key == "words" else value
+                               for key, value in page.items() if key != "image"}
+                              for page in result["pages"]],
+                    "timings": result["timings"]
+                })
+                result["cached"] = False
+            result["file_hash"] = file_hash
+        
+        # Extract structured data
+        start = time.perf_counter()
+        result["bill_data"] = self._extract_bill_data(result["text"])
+        result["timings"]["extract"] = time.perf_counter() - start
+        
+        return result
+    
+    def _ocr_cache_key(self, file_hash: str, *parts: Any) -> str:
+        """Cache key of OCR output for a file, the settings in parts and the OCR engine"""
+        return cache_key(file_hash, *parts, config.RASTER_DPI, config.PDF_TEXT_LAYER, self._x_height(),
+                         self.ocr_engine.version(), OCR_CACHE_FORMAT)
+    
+    def _x_height(self) -> Optional[int]:
+        """x-height whole pages are normalized to before OCR, or None when page analysis is off"""
+        return config.PAGE_X_HEIGHT if config.PAGE_ANALYSIS else None
+    
+    def _ocr_document(self, filename: str, profile: str, keep_images: bool = False) -> Dict[str, Any]:
         """
-        Process a document and extract key information
+        Read every page of a document, from the PDF text layer or by OCR
+
+        PDF pages whose embedded text layer passes the quality check are
+        taken from it without rasterizing; the rest are rendered one at a
+        time as the OCR engine asks for them, so memory is bounded by the
+        engine's queue depth, not the page count. Each page records its
+        "source" ("text_layer" or "ocr"), and the document its
+        "text_source" ("text_layer", "ocr" or "mixed"). OCR'd pages also
+        record the page "analysis" (turn, skew, crop and scale applied
+        before OCR, see page_analysis.analyze_page).
         """
         file_path = os.path.join(self.uploads_dir, filename)
         extension = os.path.splitext(filename)[1].lower()
+        timings = {"rasterize": 0.0}
+        pages = []
         
-        # Convert document to images
         if extension == '.pdf':
-            images = self._pdf_to_images(file_path)
+            from pdf2image import pdfinfo_from_path
+            
+            text_layer = None
+            if config.PDF_TEXT_LAYER:
+                text_layer = _timed(timings, "text_layer", self._read_text_layer, file_path)
+            if text_layer is not None:
+                page_count = len(text_layer)
+                for page_number, words in enumerate(text_layer, start=1):
+                    if text_layer_is_usable(words):
+                        pages.append({"page_number": page_number, "text": words.text(), "words": words,
+                                      "profile": None, "analysis": None, "source": "text_layer", "timings": {}})
+            else:
+                page_count = _timed(timings, "rasterize", pdfinfo_from_path, file_path)["Pages"]
+            
+            from_layer = {page["page_number"] for page in pages}
+            ocr_page_numbers = [number for number in range(1, page_count + 1) if number not in from_layer]
+            images = self._iter_pdf_pages(file_path, config.RASTER_DPI, timings, ocr_page_numbers)
         elif extension in ['.jpg', '.jpeg', '.png']:
-            images = [cv2.imread(file_path)]
+            ocr_page_numbers = [1]
+            images = [_timed(timings, "rasterize", cv2.imread, file_path, cv2.IMREAD_GRAYSCALE)]
         else:
             raise ValueError(f"Unsupported file format: {extension}")
         
-        # Process each image
-        extracted_text = ""
-        for img in images:
-            # Preprocess image for better OCR
-            preprocessed = self._preprocess_image(img)
+        if ocr_page_numbers:
+            # Preprocess and OCR the pages on the worker pool; rasterize
+            # time is included, as pages are rendered while earlier ones
+            # are OCR'd
+            start = time.perf_counter()
+            ocr_pages = self.ocr_engine.run(filename, images, profile, keep_images, self._x_height())
+            timings["ocr_wall"] = time.perf_counter() - start
             
-            # Perform OCR
-            text = pytesseract.image_to_string(preprocessed)
-            extracted_text += text + "\n"
-        
-        # Extract structured data
-        bill_data = self._extract_bill_data(extracted_text)
+            # Per-stage totals summed over pages (worker time, not wall time)
+            for page_number, page in zip(ocr_page_numbers, ocr_pages):
+                del page["doc_id"]
+                page["page_number"] = page_number
+                page["source"] = "ocr"
+                for stage, seconds in page["timings"].items():
+                    timings[stage] = timings.get(stage, 0.0) + seconds
+            pages = sorted(pages + ocr_pages, key=lambda page: page["page_number"])
         
-        # Save processed results
-        processed_path = os.path.join(self.processed_dir, f"processed_{filename}.json")
-        # In a real implementation, save the bill_data to JSON here
+        return {
+            "text": "".join(page["text"] + "\n" for page in pages),
+            "pages": pages,
+            "text_source": text_source(page["source"] for page in pages),
+            "timings": timings
+        }
+    
+    def _read_text_layer(self, pdf_path: str, first_page: Optional[int] = None,
+                         last_page: Optional[int] = None) -> Optional[List[WordBoxes]]:
+        """
+        Word boxes of the PDF's embedded text layer, one per page
+
+        Uses poppler's pdftotext, installed alongside the pdftoppm that
+        pdf2image needs. Boxes are scaled to RASTER_DPI pixels. Returns
+        None when the text layer cannot be read.
+        """
+        command = ["pdftotext", "-bbox-layout"]
+        if first_page:
+            command += ["-f", str(first_page), "-l", str(last_page or first_page)]
+        command += [pdf_path, "-"]
         
-        return bill_data
+        try:
+            output = subprocess.run(command, capture_output=True, check=True, timeout=60).stdout
+            return parse_pdftotext_bbox(output.decode("utf-8", "replace"), config.RASTER_DPI / 72)
+        except Exception as e:
+            logger.warning("Could not read the text layer of %s: %s", pdf_path, e)
+            return None
     
-    def _pdf_to_images(self, pdf_path: str) -> List[np.ndarray]:
-        """Convert PDF to a list of images"""
-        pages = convert_from_path(pdf_path, 300)  # DPI=300
-        images = []
+    def _iter_pdf_pages(self, pdf_path: str, dpi: int, timings: Dict[str, float],
+                        page_numbers: Optional[List[int]] = None) -> Iterator[np.ndarray]:
+        """
+        Render PDF pages one at a time, as 8-bit grayscale images
+
+        Renders page_numbers (every page by default) in order. Only the
+        page being rendered is held here; each is released once the caller
+        moves on. Time spent rendering is added to timings["rasterize"].
+        """
+        from pdf2image import convert_from_path, pdfinfo_from_path
         
-        for page in pages:
-            # Convert PIL Image to OpenCV format
+        if page_numbers is None:
+            page_count = _timed(timings, "rasterize", pdfinfo_from_path, pdf_path)["Pages"]
+            page_numbers = range(1, page_count + 1)
+        for page_number in page_numbers:
+            start = time.perf_counter()
+            page = convert_from_path(pdf_path, dpi, first_page=page_number,
+                                     last_page=page_number, grayscale=True)[0]
             img = np.array(page)
-            img = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
-            images.append(img)
+            page.close()
+            timings["rasterize"] += time.perf_counter() - start
+            yield img
+    
+    def _render_page(self, filename: str, page_number: int, dpi: int, max_scale: float) -> np.ndarray:
+        """
+        Render one page as an 8-bit grayscale image at about the given DPI
+
+        page_number counts from 1, and -1 is the last page. PDFs are
+        rendered at that DPI; photos and scans (a single page) are resized
+        as if they were PAGE_WIDTH_INCHES wide, by at most max_scale.
+        """
+        file_path = os.path.join(self.uploads_dir, filename)
+        extension = os.path.splitext(filename)[1].lower()
+        
+        if extension == '.pdf':
+            from pdf2image import convert_from_path, pdfinfo_from_path
             
-        return images
+            if page_number < 0:
+                page_number += pdfinfo_from_path(file_path)["Pages"] + 1
+            page = convert_from_path(file_path, dpi, first_page=page_number,
+                                     last_page=page_number, grayscale=True)[0]
+            return np.array(page)
+        
+        if extension in ['.jpg', '.jpeg', '.png']:
+            img = cv2.imread(file_path, cv2.IMREAD_GRAYSCALE)
+            scale = min(max_scale, PAGE_WIDTH_INCHES * dpi / img.shape[1])
+            if abs(scale - 1) > 0.05:
+                interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC
+                img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=interpolation)
+            return img
+        
+        raise ValueError(f"Unsupported file format: {extension}")
     
-    def _preprocess_image(self, img: np.ndarray) -> np.ndarray:
-        """Preprocess image for better OCR results"""
-        # Convert to grayscale
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    def header_page(self, filename: str) -> np.ndarray:
+        """The first page at HEADER_DPI, as header reads and fingerprints use it"""
+        return self._render_page(filename, 1, config.HEADER_DPI, 1.0)
+    
+    def read_header(self, filename: str, profile: Optional[str] = None,
+                    page: Optional[np.ndarray] = None, file_hash: Optional[str] = None) -> Dict[str, Any]:
+        """
+        OCR only the top of the first page, at low resolution
+
+        Enough to recognise a known vendor's letterhead for a fraction of
+        the cost of a full page at 300 DPI. A usable PDF text layer is read
+        instead of OCR. page is the result of header_page(), when the
+        caller already has it. With a cache, the result is kept by
+        file_hash (computed when not given), like whole documents'.
+        Returns {"text", "words", "source", "timings"}.
+        """
+        profile = profile or config.PREPROCESS_PROFILE
+        if self.cache is None:
+            return self._read_header(filename, profile, page)
+        
+        start = time.perf_counter()
+        file_hash = file_hash or hash_file(os.path.join(self.uploads_dir, filename))
+        key = self._ocr_cache_key(file_hash, "header", config.HEADER_DPI, config.HEADER_FRACTION, profile)
+        cached = self.cache.get("header", key)
+        if cached is not None:
+            return {"text": cached["text"], "words": WordBoxes.from_dict(cached["words"]),
+                    "source": cached["source"], "timings": {"cache": time.perf_counter() - start}}
+        
+        result = self._read_header(filename, profile, page)
+        self.cache.put("header", key, {"text": result["text"], "words": result["words"].to_dict(),
+                                       "source": result["source"]})
+        return result
+    
+    def _read_header(self, filename: str, profile: str, page: Optional[np.ndarray]) -> Dict[str, Any]:
+        timings = {}
+        if filename.lower().endswith('.pdf') and config.PDF_TEXT_LAYER:
+            file_path = os.path.join(self.uploads_dir, filename)
+            text_layer = _timed(timings, "text_layer", self._read_text_layer, file_path, 1)
+            if text_layer and text_layer_is_usable(text_layer[0]):
+                words = text_layer[0].region((0.0, 0.0, 1.0, config.HEADER_FRACTION))
+                return {"text": words.text(), "words": words, "source": "text_layer", "timings": timings}
+        
+        if page is None:
+            page = _timed(timings, "rasterize", self.header_page, filename)
+        header = page[:max(1, int(page.shape[0] * config.HEADER_FRACTION))]
+        
+        start = time.perf_counter()
+        result = self.ocr_engine.run(f"{filename}#header", [header], profile)[0]
+        timings["ocr_wall"] = time.perf_counter() - start
+        
+        return {"text": result["text"], "words": result["words"], "source": "ocr", "timings": timings}
+    
+    def ocr_regions(self, filename: str, regions: List[Dict[str, Any]],
+                    profile: Optional[str] = None, file_hash: Optional[str] = None) -> Dict[str, Any]:
+        """
+        OCR only a template's regions of interest, at high resolution
+
+        Each region is {"name", "box": [x0, y0, x1, y1] as fractions of the
+        page, "page" (1 by default, -1 for the last page), "dpi"
+        (config.REGION_DPI by default)}. Regions on PDF pages with a usable
+        text layer are cut from it. For the rest each page is rendered once
+        per DPI and only the crops are OCR'd. With a cache, the result is
+        kept by file_hash and the regions' pages, boxes and DPIs. Returns
+        {"regions": {name: {"text", "words", "source"}}, "timings"}.
+        """
+        profile = profile or config.PREPROCESS_PROFILE
+        if self.cache is None:
+            return self._ocr_regions(filename, regions, profile)
         
-        # Apply thresholding
-        _, binary = cv2.threshold(gray, 150, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        start = time.perf_counter()
+        file_hash = file_hash or hash_file(os.path.join(self.uploads_dir, filename))
+        boxes = [(region.get("page", 1), list(region["box"]), region.get("dpi", config.REGION_DPI))
+                 for region in regions]
+        key = self._ocr_cache_key(file_hash, "regions", boxes, REGION_MAX_UPSCALE, profile)
+        cached = self.cache.get("regions", key)
+        if cached is not None:
+            return {
+                "regions": {region["name"]: {"text": value["text"], "words": WordBoxes.from_dict(value["words"]),
+                                             "source": value["source"]}
+                            for region, value in zip(regions, cached)},
+                "timings": {"cache": time.perf_counter() - start}
+            }
+        
+        result = self._ocr_regions(filename, regions, profile)
+        self.cache.put("regions", key, [
+            {"text": value["text"], "words": value["words"].to_dict(), "source": value["source"]}
+            for value in (result["regions"][region["name"]] for region in regions)
+        ])
+        return result
+    
+    def _ocr_regions(self, filename: str, regions: List[Dict[str, Any]], profile: str) -> Dict[str, Any]:
+        timings = {"rasterize": 0.0}
+        results = {}
         
-        # Optional: Apply noise reduction
-        denoised = cv2.fastNlMeansDenoising(binary, None, 10, 7, 21)
+        text_layer = None
+        if filename.lower().endswith('.pdf') and config.PDF_TEXT_LAYER:
+            file_path = os.path.join(self.uploads_dir, filename)
+            text_layer = _timed(timings, "text_layer", self._read_text_layer, file_path)
+        if text_layer:
+            for region in regions:
+                page_number = region.get("page", 1)
+                index = page_number - 1 if page_number > 0 else len(text_layer) + page_number
+                if 0 <= index < len(text_layer) and text_layer_is_usable(text_layer[index]):
+                    words = text_layer[index].region(region["box"])
+                    results[region["name"]] = {"text": words.text(), "words": words, "source": "text_layer"}
         
-        return denoised
+        pages = {}
+        crops = []
+        ocr_regions = [region for region in regions if region["name"] not in results]
+        for region in ocr_regions:
+            page_key = (region.get("page", 1), region.get("dpi", config.REGION_DPI))
+            if page_key not in pages:
+                pages[page_key] = _timed(timings, "rasterize", self._render_page,
+                                         filename, page_key[0], page_key[1], REGION_MAX_UPSCALE)
+            page = pages[page_key]
+            height, width = page.shape[:2]
+            x0, y0, x1, y1 = region["box"]
+            top, left = int(y0 * height), int(x0 * width)
+            # Copy, so the full page raster can be freed
+            crops.append(page[top:max(int(y1 * height), top + 1), left:max(int(x1 * width), left + 1)].copy())
+        pages.clear()
+        
+        if crops:
+            start = time.perf_counter()
+            ocr_results = self.ocr_engine.run(f"{filename}#regions", crops, profile)
+            timings["ocr_wall"] = time.perf_counter() - start
+            for region, result in zip(ocr_regions, ocr_results):
+                results[region["name"]] = {"text": result["text"], "words": result["words"], "source": "ocr"}
+        
+        return {"regions": {region["name"]: results[region["name"]] for region in regions}, "timings": timings}
+    
+    def _preprocess_image(self, img: np.ndarray, profile: Optional[str] = None) -> np.ndarray:
+        """Preprocess image for better OCR results"""
+        return preprocess_image(img, profile)
     
     def _extract_bill_data(self, text: str) -> Dict[str, Any]:
         """Extract structured data from OCR text"""
@@ -91,25 +795,8 @@ class DocumentProcessor:
             'line_items': []
         }
         
-        # Extract invoice number (typical formats: INV-12345, #12345, etc.)
-        inv_match = re.search(r'(?:invoice|inv|invoice number|inv no)[\s#:]*([a-z0-9\-]+)', 
-                             text, re.IGNORECASE)
-        if inv_match:
-            bill_data['invoice_number'] = inv_match.group(1)
-        
-        # Extract date (common formats: MM/DD/YYYY, DD-MM-YYYY, etc.)
-        date_match = re.search(r'(?:date|invoice date)[\s:]*(\d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4})', 
-                              text, re.IGNORECASE)
-        if date_match:
-            bill_data['date'] = date_match.group(1)
-        
-        # Extract total amount (look for patterns like "Total: $123.45")
-        amount_match = re.search(r'(?:total|amount due|balance due)[\s:]*[\$£€]?(\d+(?:,\d+)*(?:\.\d+)?)', 
-                                text, re.IGNORECASE)
-        if amount_match:
-            # Remove commas and convert to float
-            amount_str = amount_match.group(1).replace(',', '')
-            bill_data['total_amount'] = float(amount_str)
+        # Invoice number, date and total in one pass over the text
+        bill_data.update(GENERIC_EXTRACTOR.extract(text))
         
         # Extract vendor name (typically at the top of the invoice)
         # This is simplified and might need enhancement for real invoices
@@ -127,6 +814,6 @@ if __name__ == "__main__":
     # Test with a sample file
     if os.path.exists("uploads/sample_bill.pdf"):
         result = processor.process_document("sample_bill.pdf")
-        print(result)
+        print(result["bill_data"])
     else:
         print("Please upload a test file to the uploads directory")
\ No newline at end of file
@@ -0,0 +1,238 @@
+# result_store.py
+"""
+Indexed storage for bill processing results
+
+Usage (import existing processed/*.json results):
+    python result_store.py migrate [processed_dir]
+"""
+import os
+import json
+import sqlite3
+import argparse
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+import config
+
+# Bill date formats tried in order; day-first before month-first
+DATE_FORMATS = [
+    "%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y",
+    "%m/%d/%Y", "%d/%m/%y", "%d-%m-%y", "%d.%m.%y", "%m/%d/%y",
+]
+
+def normalize_date(value: Any) -> Optional[str]:
+    """Parse a bill date into ISO format (YYYY-MM-DD), or None"""
+    if not isinstance(value, str):
+        return None
+    value = value.strip()
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+def _to_number(value: Any) -> Optional[float]:
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value).replace(',', ''))
+    except (TypeError, ValueError):
+        return None
+
+class ResultStore:
+    """
+    Stores processing results and answers indexed queries over them
+
+    Backends must implement save, get and query.
+    """
+    def save(self, result: Dict[str, Any]):
+        """Insert or replace the result for result["bill_id"]"""
+        raise NotImplementedError
+
+    def get(self, bill_id: str) -> Optional[Dict[str, Any]]:
+        """Full stored result for a bill, or None"""
+        raise NotImplementedError
+
+    def query(self, vendor: Optional[str] = None, template_id: Optional[str] = None,
+              status: Optional[str] = None, validation: Optional[str] = None,
+              date_from: Optional[str] = None, date_to: Optional[str] = None,
+              limit: int = 50, cursor: Optional[str] = None) -> Dict[str, Any]:
+        """
+        One page of bill summaries matching every given filter
+
+        vendor matches a case-insensitive prefix of the vendor name.
+        Results are ordered newest bill date first. Pass the returned
+        next_cursor to fetch the following page.
+        """
+        raise NotImplementedError
+
+class SQLiteResultStore(ResultStore):
+    """
+    Result store on an embedded SQLite database in WAL mode
+
+    The full result is kept as compact JSON; the fields bills are looked
+    up by are copied into indexed columns. "date" is the bill date when
+    it can be parsed, otherwise the processing date, so bills with no
+    readable date can still be found by period.
+    """
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or config.RESULTS_DB_PATH
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS results (
+                    bill_id TEXT PRIMARY KEY,
+                    filename TEXT,
+                    template_id TEXT,
+                    vendor_name TEXT COLLATE NOCASE,
+                    status TEXT NOT NULL,
+                    validation_status TEXT,
+                    date TEXT NOT NULL,
+                    total_amount REAL,
+                    processed_date TEXT,
+                    data TEXT NOT NULL
+                )
+            """)
+            for column in ("template_id", "vendor_name", "status", "validation_status", "total_amount"):
+                conn.execute(f"CREATE INDEX IF NOT EXISTS results_{column} ON results ({column}, date)")
+            conn.execute("CREATE INDEX IF NOT EXISTS results_date ON results (date, bill_id)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @staticmethod
+    def _row(result: Dict[str, Any]) -> Tuple:
+        """Indexed column values for a result"""
+        extracted = result.get("extracted_data") or {}
+        mapped = (result.get("template_data") or {}).get("data") or {}
+        processed_date = result.get("processed_date")
+        date = (normalize_date(mapped.get("date")) or normalize_date(extracted.get("date"))
+                or (processed_date or "")[:10])
+
+        return (
+            result["bill_id"],
+            result.get("filename"),
+            result.get("template_id"),
+            mapped.get("vendor_name") or extracted.get("vendor_name"),
+            result.get("status", "completed"),
+            (result.get("validation") or {}).get("status"),
+            date,
+            _to_number(mapped.get("total_amount", extracted.get("total_amount"))),
+            processed_date,
+            json.dumps(result, separators=(',', ':'))
+        )
+
+    def save(self, result: Dict[str, Any]):
+        self.save_many([result])
+
+    def save_many(self, results: List[Dict[str, Any]]):
+        """Save several results in one transaction"""
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO results (bill_id, filename, template_id, vendor_name, status, "
+                "validation_status, date, total_amount, processed_date, data) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [self._row(result) for result in results]
+            )
+
+    def get(self, bill_id: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT data FROM results WHERE bill_id = ?", (bill_id,)).fetchone()
+        return json.loads(row["data"]) if row else None
+
+    def query(self, vendor: Optional[str] = None, template_id: Optional[str] = None,
+              status: Optional[str] = None, validation: Optional[str] = None,
+              date_from: Optional[str] = None, date_to: Optional[str] = None,
+              limit: int = 50, cursor: Optional[str] = None) -> Dict[str, Any]:
+        conditions, params = [], []
+        if vendor:
+            # Case-insensitive prefix match, which can still use the index
+            escaped = vendor.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            conditions.append("vendor_name LIKE ? ESCAPE '\\'")
+            params.append(escaped + "%")
+        for column, value in (("template_id", template_id), ("status", status),
+                              ("validation_status", validation)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if date_from:
+            conditions.append("date >= ?")
+            params.append(date_from)
+        if date_to:
+            conditions.append("date <= ?")
+            params.append(date_to)
+        if cursor:
+            # Keyset pagination: continue after the last (date, bill_id) returned
+            cursor_date, cursor_bill_id = cursor.split("|", 1)
+            conditions.append("(date, bill_id) < (?, ?)")
+            params.extend([cursor_date, cursor_bill_id])
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT bill_id, filename, template_id, vendor_name, status, validation_status, "
+                f"date, total_amount, processed_date FROM results {where} "
+                "ORDER BY date DESC, bill_id DESC LIMIT ?",
+                params + [limit + 1]
+            ).fetchall()
+
+        bills = [dict(row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = bills[-1]
+            next_cursor = f"{last['date']}|{last['bill_id']}"
+
+        return {"bills": bills, "next_cursor": next_cursor}
+
+def create_result_store() -> ResultStore:
+    """Create the result store selected by config.RESULT_STORE"""
+    if config.RESULT_STORE == "sqlite":
+        return SQLiteResultStore()
+    raise ValueError(f"Unknown result store: {config.RESULT_STORE}")
+
+def migrate_json_results(store: SQLiteResultStore, processed_dir: str, batch_size: int = 1000) -> int:
+    """Import processed/{bill_id}.json result files into the store"""
+    imported = 0
+    batch = []
+    for entry in os.scandir(processed_dir):
+        if not entry.name.endswith('.json') or not entry.is_file():
+            continue
+        try:
+            with open(entry.path, 'r') as f:
+                result = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Skipping {entry.name}: {str(e)}")
+            continue
+
+        result.setdefault("bill_id", os.path.splitext(entry.name)[0])
+        batch.append(result)
+        if len(batch) >= batch_size:
+            store.save_many(batch)
+            imported += len(batch)
+            batch = []
+
+    if batch:
+        store.save_many(batch)
+        imported += len(batch)
+    return imported
+
+def main():
+    parser = argparse.ArgumentParser(description="Bill result store tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = subparsers.add_parser("migrate", help="Import processed/*.json result files")
+    migrate_parser.add_argument("processed_dir", nargs="?", default="processed")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        imported = migrate_json_results(SQLiteResultStore(), args.processed_dir)
+        print(f"Imported {imported} results into {config.RESULTS_DB_PATH}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# structured_output.py
+import re
+import json
+from typing import Dict, Any, Optional
+
+# Fields of the full extraction prompt, in template field config form
+FULL_EXTRACTION_FIELDS = {
+    "invoice_number": {"type": "string"},
+    "date": {"type": "date"},
+    "due_date": {"type": "date"},
+    "total_amount": {"type": "number"},
+    "vendor_name": {"type": "string"},
+    "vendor_address": {"type": "string"},
+    "bill_to_name": {"type": "string"},
+    "bill_to_address": {"type": "string"},
+    "line_items": {"type": "array", "items": {
+        "description": {"type": "string"},
+        "quantity": {"type": "number"},
+        "unit_price": {"type": "number"},
+        "total": {"type": "number"},
+    }},
+}
+
+# Output tokens budgeted per field when bounding generation length:
+# key, quotes and punctuation plus a typical value, and for arrays a few
+# line items
+SCALAR_FIELD_TOKENS = 24
+ARRAY_FIELD_TOKENS = 320
+OBJECT_OVERHEAD_TOKENS = 8
+
+# Commas right before a closing bracket, which JSON does not allow
+TRAILING_COMMA = re.compile(r",\s*([}\]])")
+
+def _nullable(schema: Dict[str, Any]) -> Dict[str, Any]:
+    return {"anyOf": [schema, {"type": "null"}]}
+
+def _object_schema(fields: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    properties = {field: field_schema(field_config) for field, field_config in fields.items()}
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+        "additionalProperties": False
+    }
+
+def field_schema(field_config: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    JSON schema of one template field's value; every value may be null
+
+    Array fields may describe their items with "items", a dict of item
+    field name -> field config (like line_items above).
+    """
+    field_type = field_config.get("type")
+    if field_type == "number":
+        return _nullable({"type": "number"})
+    if field_type == "boolean":
+        return _nullable({"type": "boolean"})
+    if field_type == "array":
+        items = field_config.get("items")
+        return _nullable({"type": "array", "items": _object_schema(items) if items else {"type": "string"}})
+    return _nullable({"type": "string"})
+
+def json_schema(fields: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    JSON schema of the object the model must return
+
+    fields is field name -> template field config; by default the fields
+    of the full extraction prompt. Every field is required (null when not
+    found) and no others are allowed, so a schema-following model answers
+    with exactly the requested keys.
+    """
+    return _object_schema(fields or FULL_EXTRACTION_FIELDS)
+
+def max_output_tokens(schema: Dict[str, Any]) -> int:
+    """Generous upper bound on the tokens of an answer matching the schema"""
+    tokens = OBJECT_OVERHEAD_TOKENS
+    for value_schema in schema["properties"].values():
+        is_array = any(option.get("type") == "array" for option in value_schema.get("anyOf", [value_schema]))
+        tokens += ARRAY_FIELD_TOKENS if is_array else SCALAR_FIELD_TOKENS
+    return tokens
+
+class JSONObjectScanner:
+    """
+    Finds the first complete JSON object in model output, as it streams in
+
+    Text before the opening brace (chatter, code fences) is skipped.
+    Braces inside strings are ignored. feed() returns the object's text
+    as soon as its closing brace arrives, so the caller can stop reading,
+    and the model can stop generating, right there.
+    """
+    def __init__(self):
+        self._parts = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self.complete: Optional[str] = None
+
+    def feed(self, text: str) -> Optional[str]:
+        """Consume more output; returns the object text once it is complete"""
+        if self.complete is not None:
+            return self.complete
+
+        start = 0
+        if self._depth == 0:
+            start = text.find("{")
+            if start < 0:
+                return None
+
+        for index in range(start, len(text)):
+            char = text[index]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._parts.append(text[start:index + 1])
+                    self.complete = "".join(self._parts)
+                    return self.complete
+
+        self._parts.append(text[start:])
+        return None
+
+def parse_json_object(text: str) -> Dict[str, Any]:
+    """
+    The first JSON object in model output, tolerating common slips
+
+    Chatter around the object and trailing commas are ignored. Raises
+    ValueError when there is no complete object.
+    """
+    scanner = JSONObjectScanner()
+    candidate = scanner.feed(text)
+    if candidate is None:
+        raise ValueError("No complete JSON object in model output")
+    try:
+        return json.loads(candidate)
+    except json.JSONDecodeError:
+        return json.loads(TRAILING_COMMA.sub(r"\1", candidate))
@@ -0,0 +1,213 @@
+# telemetry.py
+"""
+Stage tracing, logging and metrics for the processing pipeline
+
+Workers and the API run in separate processes, so metrics are kept in a
+small SQLite database next to the job queue (like the cache's hit/miss
+counters) and rendered in Prometheus text format by the API's /metrics.
+"""
+import os
+import sys
+import time
+import logging
+import sqlite3
+import resource
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Tuple, Iterator
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the stage duration histogram buckets
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# The OCR and LLM stack, which only worker processes should load
+WORKER_ONLY_MODULES = ("cv2", "numpy", "PIL", "pytesseract", "tesserocr", "pdf2image",
+                       "langchain", "llama_cpp", "processor", "page_analysis", "fingerprint_index",
+                       "llm_extractor", "pipeline")
+
+def setup_logging():
+    """Configure the root logger once per process, at config.LOG_LEVEL"""
+    logging.basicConfig(
+        level=config.LOG_LEVEL,
+        format="%(asctime)s %(process)d %(levelname)s %(name)s: %(message)s"
+    )
+
+class Trace:
+    """
+    Times the stages of processing one bill
+
+        trace = Trace(bill_id)
+        with trace.stage("identify"):
+            ...
+
+    Durations accumulate in trace.timings by stage name, so a stage that
+    runs more than once (e.g. per page) reports its total.
+    """
+    def __init__(self, bill_id: str, timings: Optional[Dict[str, float]] = None):
+        self.bill_id = bill_id
+        self.timings = timings if timings is not None else {}
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.timings[name] = self.timings.get(name, 0.0) + seconds
+            logger.debug("bill %s: %s took %.3fs", self.bill_id, name, seconds)
+
+    def add(self, timings: Dict[str, float], prefix: str = ""):
+        """Merge stage durations measured elsewhere, e.g. by the document processor"""
+        for name, seconds in timings.items():
+            self.timings[prefix + name] = self.timings.get(prefix + name, 0.0) + seconds
+
+    def elapsed(self) -> float:
+        """Seconds since the trace started"""
+        return time.perf_counter() - self._start
+
+def startup_report(started: float, imported: float) -> Dict[str, Any]:
+    """
+    How long a process took to start and what it loaded
+
+    started and imported are time.perf_counter() readings taken when the
+    entry module began importing and when it finished.
+    """
+    return {
+        "import_seconds": imported - started,
+        "startup_seconds": time.perf_counter() - started,
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        "worker_only_modules": sorted(name for name in WORKER_ONLY_MODULES if name in sys.modules)
+    }
+
+def _label_string(labels: Dict[str, Any]) -> str:
+    """Labels in Prometheus syntax, sorted so equal label sets match"""
+    def escape(value: Any) -> str:
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    return ",".join(f'{name}="{escape(value)}"' for name, value in sorted(labels.items()))
+
+def _series(name: str, labels: str) -> str:
+    """Metric name with its label string, if any"""
+    return f"{name}{{{labels}}}" if labels else name
+
+class MetricsStore:
+    """
+    Counters and histograms shared by every API and worker process
+
+    Histograms keep one count per bucket (not cumulative) plus a sum and
+    count, so an observation is two upserts; render() adds the buckets up.
+    """
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or config.METRICS_DB_PATH
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS counters (
+                    name TEXT NOT NULL,
+                    labels TEXT NOT NULL,
+                    value REAL NOT NULL,
+                    PRIMARY KEY (name, labels)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS histogram_buckets (
+                    name TEXT NOT NULL,
+                    labels TEXT NOT NULL,
+                    bucket INTEGER NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (name, labels, bucket)
+                )
+            """)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    @staticmethod
+    def _add(conn: sqlite3.Connection, name: str, labels: str, value: float):
+        conn.execute(
+            "INSERT INTO counters (name, labels, value) VALUES (?, ?, ?) "
+            "ON CONFLICT (name, labels) DO UPDATE SET value = value + excluded.value",
+            (name, labels, value)
+        )
+
+    def inc(self, name: str, labels: Optional[Dict[str, Any]] = None, amount: float = 1):
+        """Add to a counter"""
+        try:
+            with self._connect() as conn:
+                self._add(conn, name, _label_string(labels or {}), amount)
+        except sqlite3.Error as e:
+            logger.warning("Could not record metric %s: %s", name, e)
+
+    def observe_many(self, name: str, observations: List[Tuple[Dict[str, Any], float]]):
+        """Record several histogram observations in one transaction"""
+        try:
+            with self._connect() as conn:
+                for labels, value in observations:
+                    label_string = _label_string(labels)
+                    conn.execute(
+                        "INSERT INTO histogram_buckets (name, labels, bucket, count) VALUES (?, ?, ?, 1) "
+                        "ON CONFLICT (name, labels, bucket) DO UPDATE SET count = count + 1",
+                        (name, label_string, bisect_left(STAGE_BUCKETS, value))
+                    )
+                    self._add(conn, f"{name}_sum", label_string, value)
+        except sqlite3.Error as e:
+            logger.warning("Could not record metric %s: %s", name, e)
+
+    def observe_stages(self, timings: Dict[str, float], labels: Optional[Dict[str, Any]] = None):
+        """Record each stage duration into bill_stage_seconds{stage=...}"""
+        self.observe_many("bill_stage_seconds", [
+            (dict(labels or {}, stage=stage), seconds) for stage, seconds in timings.items()
+        ])
+
+    def render(self, help_texts: Dict[str, str]) -> List[str]:
+        """Stored counters and histograms as Prometheus exposition lines"""
+        with self._connect() as conn:
+            counters = conn.execute("SELECT name, labels, value FROM counters ORDER BY name, labels").fetchall()
+            buckets = conn.execute(
+                "SELECT name, labels, bucket, count FROM histogram_buckets ORDER BY name, labels, bucket"
+            ).fetchall()
+
+        histograms: Dict[str, Dict[str, List[int]]] = {}
+        for name, labels, bucket, count in buckets:
+            histograms.setdefault(name, {}).setdefault(labels, [0] * (len(STAGE_BUCKETS) + 1))[bucket] = count
+        sums = {(name[:-4], labels): value for name, labels, value in counters
+                if name.endswith("_sum") and name[:-4] in histograms}
+
+        lines = []
+        for name, series in histograms.items():
+            lines += [f"# HELP {name} {help_texts.get(name, name)}", f"# TYPE {name} histogram"]
+            for labels, counts in series.items():
+                separator = "," if labels else ""
+                total = 0
+                for bound, count in zip(STAGE_BUCKETS + (float("inf"),), counts):
+                    total += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'{name}_bucket{{{labels}{separator}le="{le}"}} {total}')
+                lines.append(f"{_series(name + '_sum', labels)} {sums.get((name, labels), 0.0)}")
+                lines.append(f"{_series(name + '_count', labels)} {total}")
+
+        current = None
+        for name, labels, value in counters:
+            if name.endswith("_sum") and (name[:-4], labels) in sums:
+                continue
+            if name != current:
+                lines += [f"# HELP {name} {help_texts.get(name, name)}", f"# TYPE {name} counter"]
+                current = name
+            lines.append(f"{_series(name, labels)} {value:g}")
+        return lines
+
+def render_metric(name: str, kind: str, help_text: str, values: List[Tuple[Dict[str, Any], float]]) -> List[str]:
+    """A metric read at scrape time (kind "gauge" or "counter"), as Prometheus exposition lines"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    lines += [f"{_series(name, _label_string(labels))} {value:g}" for labels, value in values]
+    return lines
@@ -1,37 +1,386 @@
 # template_manager.py
 import json
 import os
-from typing import Dict, Any, List, Optional
+import time
+import logging
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+import config
+from field_extractor import TemplateExtractor
+from keyword_index import KeywordIndex
+
+logger = logging.getLogger(__name__)
+
+def _value_type(value: Any) -> str:
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, (int, float)):
+        return "number"
+    if isinstance(value, list):
+        return "array"
+    return "string"
+
+def normalize_field_config(value: Any) -> Dict[str, Any]:
+    """
+    Field config from a template's "fields" entry
+
+    Fields are normally configs like {"required": true, "type": "date"}.
+    Templates saved from a sample bill hold the sample's values instead;
+    those fields are optional, typed after the value, and keep it as
+    "example".
+    """
+    if isinstance(value, dict):
+        return value
+    return {"required": False, "type": _value_type(value), "example": value}
+
+def template_metadata(template: Dict[str, Any]) -> Dict[str, Any]:
+    """What identifying and listing a template needs, without its field specs"""
+    return {
+        "name": template.get("name", "Unknown Template"),
+        "description": template.get("description", ""),
+        "keywords": template.get("identification", {}).get("keywords", []),
+        "required": [field for field, value in template.get("fields", {}).items()
+                     if normalize_field_config(value).get("required", False)],
+        "regions": bool(template.get("regions"))
+    }
+
+class TemplateChangedError(RuntimeError):
+    """A template file changed after the snapshot reading it was built"""
+
+def _read_template(path: str) -> Tuple[Dict[str, Any], int, int]:
+    """A template file's contents, with the mtime_ns and size of the version read"""
+    with open(path, 'r') as f:
+        stat = os.fstat(f.fileno())
+        return json.load(f), stat.st_mtime_ns, stat.st_size
+
+class TemplateIndex:
+    """
+    Metadata of every template file, keyed by its size and mtime
+
+    Kept in SQLite and shared by the API and every worker, so a process
+    starting up only parses the template files that changed since some
+    process last indexed them.
+    """
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or config.TEMPLATE_INDEX_PATH
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS templates (
+                    template_id TEXT PRIMARY KEY,
+                    mtime_ns INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    metadata TEXT NOT NULL
+                )
+            """)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def load(self) -> Dict[str, Tuple[int, int, Dict[str, Any]]]:
+        """Template ID -> (mtime_ns, size, metadata) of every indexed file"""
+        try:
+            with self._connect() as conn:
+                rows = conn.execute("SELECT template_id, mtime_ns, size, metadata FROM templates").fetchall()
+        except sqlite3.Error as e:
+            logger.warning("Could not read the template index: %s", e)
+            return {}
+        return {template_id: (mtime_ns, size, json.loads(metadata)) for template_id, mtime_ns, size, metadata in rows}
+
+    def save(self, rows: List[Tuple[str, int, int, Dict[str, Any]]]):
+        """Record (template_id, mtime_ns, size, metadata) of freshly parsed files"""
+        if not rows:
+            return
+        try:
+            with self._connect() as conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO templates (template_id, mtime_ns, size, metadata) VALUES (?, ?, ?, ?)",
+                    [(template_id, mtime_ns, size, json.dumps(metadata)) for template_id, mtime_ns, size, metadata in rows]
+                )
+        except sqlite3.Error as e:
+            logger.warning("Could not update the template index: %s", e)
+
+class TemplateEntry:
+    """
+    One version of one template file
+
+    The metadata is available at once; the template itself and its
+    compiled extraction rules are only loaded when first used. Entries
+    are shared by every snapshot in which the file is unchanged, so that
+    work is done once per version of the file.
+    """
+    def __init__(self, template_id: str, path: str, mtime_ns: int, size: int,
+                 metadata: Dict[str, Any], template: Optional[Dict[str, Any]] = None):
+        self.template_id = template_id
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.metadata = metadata
+        self.etag = f'"{mtime_ns:x}-{size:x}"'
+        self._template = template
+        self._extractor: Optional[TemplateExtractor] = None
+
+    @property
+    def template(self) -> Dict[str, Any]:
+        """
+        The parsed template file; treat it as read-only
+
+        Raises TemplateChangedError when the file was rewritten since this
+        entry was indexed: the version whose metadata (required fields,
+        keywords, ETag) the snapshot holds is gone, and pairing the new
+        fields with it would be inconsistent. A fresh snapshot has the
+        new version.
+        """
+        if self._template is None:
+            try:
+                template, mtime_ns, size = _read_template(self.path)
+            except (OSError, ValueError) as e:
+                # Deleted or rewritten since it was indexed; the next
+                # refresh replaces this entry
+                logger.warning("Could not load template %s: %s", self.template_id, e)
+                return {}
+            if (mtime_ns, size) != (self.mtime_ns, self.size):
+                raise TemplateChangedError(f"Template {self.template_id} changed while in use")
+            self._template = template
+        return self._template
+
+    @property
+    def fields(self) -> Dict[str, Dict[str, Any]]:
+        return {field: normalize_field_config(value)
+                for field, value in self.template.get("fields", {}).items()}
+
+    @property
+    def extractor(self) -> TemplateExtractor:
+        if self._extractor is None:
+            self._extractor = TemplateExtractor(self.fields)
+        return self._extractor
+
+class TemplateSnapshot:
+    """
+    An immutable view of every template at one moment
+
+    Changes never modify a snapshot; TemplateManager builds a new one
+    sharing the unchanged entries and swaps it in, so a bill processed
+    with one snapshot sees one consistent set of templates. version
+    identifies the set (file names, sizes and mtimes) and is the ETag of
+    the /templates/ listing.
+    """
+    def __init__(self, entries: Dict[str, TemplateEntry], keyword_index: KeywordIndex):
+        self._entries = entries
+        self.keyword_index = keyword_index
+        self.region_templates = frozenset(
+            template_id for template_id, entry in entries.items() if entry.metadata["regions"]
+        )
+        digest = hashlib.sha256()
+        for template_id in sorted(entries):
+            digest.update(f"{template_id}\x00{entries[template_id].etag}\x00".encode("utf-8"))
+        self.version = digest.hexdigest()[:16]
+        self._listings: Dict[bool, bytes] = {}
+
+    def apply(self, changes: Dict[str, Optional[TemplateEntry]]) -> "TemplateSnapshot":
+        """A new snapshot with templates added or replaced, or removed where the entry is None"""
+        entries = dict(self._entries)
+        keyword_index = self.keyword_index.copy()
+        for template_id, entry in changes.items():
+            if entry is None:
+                entries.pop(template_id, None)
+                keyword_index.remove(template_id)
+            else:
+                entries[template_id] = entry
+                keyword_index.add(template_id, entry.metadata["keywords"])
+        return TemplateSnapshot(entries, keyword_index)
+
+    def template_ids(self) -> List[str]:
+        return list(self._entries)
+
+    def entry(self, template_id: str) -> Optional[TemplateEntry]:
+        return self._entries.get(template_id)
+
+    def get_template(self, template_id: str) -> Optional[Dict[str, Any]]:
+        """Get a specific template by ID"""
+        entry = self._entries.get(template_id)
+        return entry.template if entry else None
+
+    def get_all_templates(self) -> Dict[str, Any]:
+        """Get all available templates"""
+        return {template_id: entry.template for template_id, entry in self._entries.items()}
+
+    def listing(self, summary: bool = False) -> bytes:
+        """
+        All templates as a JSON body, serialized once per snapshot
+
+        With summary, only each template's name and description, which
+        needs no template file to be loaded.
+        """
+        body = self._listings.get(summary)
+        if body is None:
+            if summary:
+                templates = {template_id: {"name": entry.metadata["name"], "description": entry.metadata["description"]}
+                             for template_id, entry in self._entries.items()}
+            else:
+                templates = self.get_all_templates()
+            body = self._listings[summary] = json.dumps(templates).encode("utf-8")
+        return body
+
+    def get_preprocess_profile(self, template_id: str) -> Optional[str]:
+        """Get the image preprocessing profile a template asks for, if any"""
+        template = self.get_template(template_id) or {}
+        return (template.get("preprocessing") or {}).get("profile")
+
+    def get_fields(self, template_id: str) -> Dict[str, Dict[str, Any]]:
+        """Normalized field configs of a template, by field name"""
+        entry = self._entries.get(template_id)
+        return entry.fields if entry else {}
+
+    def get_required_fields(self, template_id: str) -> List[str]:
+        """Names of the fields a template requires"""
+        entry = self._entries.get(template_id)
+        return list(entry.metadata["required"]) if entry else []
+
+    def extract_fields(self, template_id: str, ocr_text: str) -> Dict[str, Any]:
+        """
+        Apply the template's extraction rules to the OCR text
+
+        Rules are declared on the template's fields (see TemplateExtractor)
+        and all fields are matched in a single pass. Only fields whose rule
+        matched are returned.
+        """
+        entry = self._entries.get(template_id)
+        return entry.extractor.extract(ocr_text) if entry else {}
+
+    def get_regions(self, template_id: str) -> List[Dict[str, Any]]:
+        """
+        Regions of interest a template declares
+
+        Each region is {"name", "box": [x0, y0, x1, y1] as fractions of the
+        page, "page" (default 1, -1 for the last page), "fields" found in
+        it, and optionally "dpi"}.
+        """
+        template = self.get_template(template_id) or {}
+        return template.get("regions") or []
+
+    def extract_regions(self, template_id: str, region_texts: Dict[str, str]) -> Dict[str, Any]:
+        """
+        Apply the template's extraction rules to the text of each region
+
+        Only the fields a region lists are taken from it (all fields when
+        it lists none); earlier regions win.
+        """
+        entry = self._entries.get(template_id)
+        extracted = {}
+        if not entry:
+            return extracted
+
+        for region in self.get_regions(template_id):
+            text = region_texts.get(region["name"])
+            if not text:
+                continue
+            fields = region.get("fields")
+            for field, value in entry.extractor.extract(text).items():
+                if (not fields or field in fields) and field not in extracted:
+                    extracted[field] = value
+        return extracted
+
+    def identify_template(self, extracted_data: Dict[str, Any], ocr_text: str) -> str:
+        """
+        Identify the most appropriate template for the extracted data
+
+        Identification keywords are whole words or phrases, optionally
+        weighted ({"keyword": "bescom", "weight": 5}); all templates are
+        scored in one pass over the OCR text.
+        """
+        best_match = "generic"  # Default to generic template
+        best_score = 0
+
+        # Check for keywords in OCR text
+        keyword_scores = self.keyword_index.score(ocr_text)
+
+        for template_id, entry in self._entries.items():
+            score = keyword_scores.get(template_id, 0)
+
+            # Check for field matches
+            for field in entry.metadata["required"]:
+                if field in extracted_data and extracted_data[field]:
+                    score += 2  # Give higher weight to matched required fields
+
+            if score > best_score:
+                best_score = score
+                best_match = template_id
+
+        return best_match
+
+    def map_to_template(self, template_id: str, extracted_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Map extracted data to the specified template format
+        """
+        template = self.get_template(template_id)
+        if not template:
+            return {'error': f'Template {template_id} not found'}
+
+        mapped_data = {
+            "template_id": template_id,
+            "template_name": template.get("name", "Unknown Template"),
+            "data": {}
+        }
+
+        # Map extracted data to template fields, falling back to the
+        # field's default (e.g. the vendor name of a vendor template)
+        for field, field_config in self.get_fields(template_id).items():
+            value = extracted_data.get(field)
+            mapped_data["data"][field] = field_config.get("default") if value is None else value
+
+        # Validate required fields
+        missing_required = []
+        for field in self.get_required_fields(template_id):
+            if mapped_data["data"].get(field) is None:
+                missing_required.append(field)
+
+        if missing_required:
+            mapped_data["validation"] = {
+                "status": "incomplete",
+                "missing_required": missing_required
+            }
+        else:
+            mapped_data["validation"] = {
+                "status": "complete"
+            }
+
+        return mapped_data
 
 class TemplateManager:
     """
     Manages the templates for different vendors or bill types
     and handles mapping extracted data to these templates
+
+    Templates are read through snapshots (see TemplateSnapshot). Every
+    poll_interval seconds, the next read checks templates/ for files that
+    were added, changed or removed, by any process, and swaps in a new
+    snapshot if there were any. Only changed files are parsed, and only
+    their metadata is needed up front.
     """
-    def __init__(self, templates_dir="templates"):
+    def __init__(self, templates_dir="templates", index_path: Optional[str] = None,
+                 poll_interval: Optional[float] = None):
         self.templates_dir = templates_dir
+        self.poll_interval = config.TEMPLATE_POLL_INTERVAL if poll_interval is None else poll_interval
         os.makedirs(templates_dir, exist_ok=True)
-        self.templates = self._load_templates()
-    
-    def _load_templates(self) -> Dict[str, Any]:
-        """Load all saved templates"""
-        templates = {}
-        
+
         # If no templates exist yet, create some sample ones
         if not os.listdir(self.templates_dir):
             self._create_sample_templates()
-            
-        # Load all template files
-        for filename in os.listdir(self.templates_dir):
-            if filename.endswith('.json'):
-                file_path = os.path.join(self.templates_dir, filename)
-                with open(file_path, 'r') as f:
-                    template_data = json.load(f)
-                    template_id = os.path.splitext(filename)[0]
-                    templates[template_id] = template_data
-        
-        return templates
-    
+
+        self.index = TemplateIndex(index_path)
+        self._snapshot = TemplateSnapshot({}, KeywordIndex())
+        self._lock = threading.Lock()
+        self._checked = 0.0
+        self.refresh()
+
     def _create_sample_templates(self):
         """Create sample templates for demonstration"""
         # Generic bill template
@@ -50,6 +399,9 @@ class TemplateManager:
             },
             "identification": {
                 "keywords": []
+            },
+            "preprocessing": {
+                "profile": "auto"
             }
         }
         
@@ -59,20 +411,34 @@ class TemplateManager:
             "description": "For electricity, water, gas bills",
             "fields": {
                 "vendor_name": {"required": True, "type": "string"},
-                "invoice_number": {"required": True, "type": "string"},
-                "account_number": {"required": True, "type": "string"},
-                "service_address": {"required": True, "type": "string"},
-                "service_period": {"required": True, "type": "string"},
-                "current_reading": {"required": False, "type": "number"},
-                "previous_reading": {"required": False, "type": "number"},
-                "usage": {"required": False, "type": "number"},
-                "rate": {"required": False, "type": "number"},
-                "date": {"required": True, "type": "date"},
-                "due_date": {"required": True, "type": "date"},
-                "total_amount": {"required": True, "type": "number"}
+                "invoice_number": {"required": True, "type": "string",
+                                   "anchors": ["bill no", "bill number", "invoice no", "invoice number"],
+                                   "pattern": r"(?=[a-z0-9\-/]*\d)[a-z0-9][a-z0-9\-/]*"},
+                "account_number": {"required": True, "type": "string",
+                                   "anchors": ["account id", "account no", "account number", "acct no"]},
+                "service_address": {"required": True, "type": "string",
+                                    "pattern": r"(?:service|supply)\s+address[\s:]*([^\n]+)"},
+                "service_period": {"required": True, "type": "string",
+                                   "anchors": ["billing period", "bill period", "service period"],
+                                   "pattern": r"\d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4}\s*(?:-|to)\s*"
+                                              r"\d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4}"},
+                "current_reading": {"required": False, "type": "number",
+                                    "anchors": ["present reading", "current reading"]},
+                "previous_reading": {"required": False, "type": "number",
+                                     "anchors": ["previous reading", "past reading"]},
+                "usage": {"required": False, "type": "number",
+                          "anchors": ["units consumed", "consumption", "usage"]},
+                "rate": {"required": False, "type": "number", "anchors": ["rate"]},
+                "date": {"required": True, "type": "date", "anchors": ["bill date", "invoice date"]},
+                "due_date": {"required": True, "type": "date", "anchors": ["due date", "pay by"]},
+                "total_amount": {"required": True, "type": "number",
+                                 "anchors": ["net payable", "amount payable", "total amount", "total"]}
             },
             "identification": {
                 "keywords": ["utility", "electric", "electricity", "water", "gas", "service", "meter"]
+            },
+            "preprocessing": {
+                "profile": "auto"
             }
         }
         
@@ -83,96 +449,142 @@ class TemplateManager:
         with open(os.path.join(self.templates_dir, "utility.json"), 'w') as f:
             json.dump(utility_template, f, indent=2)
     
+    def _template_path(self, template_id: str) -> str:
+        return os.path.join(self.templates_dir, f"{template_id}.json")
+
+    def _stat_templates(self, template_ids: Optional[List[str]] = None) -> Dict[str, Tuple[int, int]]:
+        """(mtime_ns, size) of the given template files that exist, or of all of them"""
+        stats = {}
+        if template_ids is None:
+            for dir_entry in os.scandir(self.templates_dir):
+                if dir_entry.name.endswith('.json') and not dir_entry.name.startswith('.'):
+                    stat = dir_entry.stat()
+                    stats[dir_entry.name[:-len('.json')]] = (stat.st_mtime_ns, stat.st_size)
+            return stats
+
+        for template_id in template_ids:
+            try:
+                stat = os.stat(self._template_path(template_id))
+            except FileNotFoundError:
+                continue
+            stats[template_id] = (stat.st_mtime_ns, stat.st_size)
+        return stats
+
+    def _refresh(self, template_ids: Optional[List[str]] = None):
+        """Swap in a new snapshot if template files changed; call with the lock held"""
+        self._checked = time.monotonic()
+        current = self._snapshot
+        stats = self._stat_templates(template_ids)
+        checked = current.template_ids() if template_ids is None else template_ids
+
+        changes: Dict[str, Optional[TemplateEntry]] = {
+            template_id: None for template_id in checked
+            if template_id not in stats and current.entry(template_id)
+        }
+        changed = {}
+        for template_id, (mtime_ns, size) in stats.items():
+            entry = current.entry(template_id)
+            if entry is None or (entry.mtime_ns, entry.size) != (mtime_ns, size):
+                changed[template_id] = (mtime_ns, size)
+
+        if changed:
+            indexed = self.index.load()
+            parsed = []
+            for template_id, (mtime_ns, size) in changed.items():
+                path = self._template_path(template_id)
+                row = indexed.get(template_id)
+                if row and row[:2] == (mtime_ns, size):
+                    changes[template_id] = TemplateEntry(template_id, path, mtime_ns, size, row[2])
+                    continue
+                try:
+                    # Keyed by the version actually read, should the file
+                    # have been replaced since it was listed
+                    template, mtime_ns, size = _read_template(path)
+                except (OSError, ValueError) as e:
+                    logger.warning("Skipping template %s: %s", template_id, e)
+                    continue
+                metadata = template_metadata(template)
+                changes[template_id] = TemplateEntry(template_id, path, mtime_ns, size, metadata, template)
+                parsed.append((template_id, mtime_ns, size, metadata))
+            self.index.save(parsed)
+
+        if changes:
+            self._snapshot = current.apply(changes)
+            logger.info("Applied %d template changes (%d templates)", len(changes), len(self._snapshot.template_ids()))
+
+    def refresh(self, template_ids: Optional[List[str]] = None) -> TemplateSnapshot:
+        """Pick up changed template files now (all of them, or just the given ones)"""
+        with self._lock:
+            self._refresh(template_ids)
+            return self._snapshot
+
+    def snapshot(self) -> TemplateSnapshot:
+        """
+        The current templates
+
+        Checks for changed files when poll_interval has passed. Readers
+        never wait for each other: while one thread checks, the rest keep
+        using the snapshot they would have got anyway.
+        """
+        if time.monotonic() - self._checked >= self.poll_interval and self._lock.acquire(blocking=False):
+            try:
+                self._refresh()
+            finally:
+                self._lock.release()
+        return self._snapshot
+
+    @property
+    def region_templates(self) -> frozenset:
+        """IDs of the templates that declare regions of interest"""
+        return self.snapshot().region_templates
+
     def get_template(self, template_id: str) -> Optional[Dict[str, Any]]:
-        """Get a specific template by ID"""
-        return self.templates.get(template_id)
-    
+        return self.snapshot().get_template(template_id)
+
     def get_all_templates(self) -> Dict[str, Any]:
-        """Get all available templates"""
-        return self.templates
-    
+        return self.snapshot().get_all_templates()
+
+    def get_preprocess_profile(self, template_id: str) -> Optional[str]:
+        return self.snapshot().get_preprocess_profile(template_id)
+
+    def get_fields(self, template_id: str) -> Dict[str, Dict[str, Any]]:
+        return self.snapshot().get_fields(template_id)
+
+    def get_required_fields(self, template_id: str) -> List[str]:
+        return self.snapshot().get_required_fields(template_id)
+
+    def extract_fields(self, template_id: str, ocr_text: str) -> Dict[str, Any]:
+        return self.snapshot().extract_fields(template_id, ocr_text)
+
+    def get_regions(self, template_id: str) -> List[Dict[str, Any]]:
+        return self.snapshot().get_regions(template_id)
+
+    def extract_regions(self, template_id: str, region_texts: Dict[str, str]) -> Dict[str, Any]:
+        return self.snapshot().extract_regions(template_id, region_texts)
+
     def identify_template(self, extracted_data: Dict[str, Any], ocr_text: str) -> str:
-        """
-        Identify the most appropriate template for the extracted data
-        """
-        best_match = "generic"  # Default to generic template
-        best_score = 0
-        
-        # Check each template for keyword matches
-        for template_id, template in self.templates.items():
-            score = 0
-            
-            # Check for keywords in OCR text
-            keywords = template.get("identification", {}).get("keywords", [])
-            for keyword in keywords:
-                if keyword.lower() in ocr_text.lower():
-                    score += 1
-            
-            # Check for field matches
-            required_fields = [field for field, config in template.get("fields", {}).items() 
-                              if config.get("required", False)]
-            
-            for field in required_fields:
-                if field in extracted_data and extracted_data[field]:
-                    score += 2  # Give higher weight to matched required fields
-            
-            if score > best_score:
-                best_score = score
-                best_match = template_id
-        
-        return best_match
-    
+        return self.snapshot().identify_template(extracted_data, ocr_text)
+
     def map_to_template(self, template_id: str, extracted_data: Dict[str, Any]) -> Dict[str, Any]:
-        """
-        Map extracted data to the specified template format
-        """
-        template = self.get_template(template_id)
-        if not template:
-            return {'error': f'Template {template_id} not found'}
-        
-        mapped_data = {
-            "template_id": template_id,
-            "template_name": template.get("name", "Unknown Template"),
-            "data": {}
-        }
-        
-        # Map extracted data to template fields
-        for field, config in template.get("fields", {}).items():
-            if field in extracted_data:
-                mapped_data["data"][field] = extracted_data[field]
-            else:
-                mapped_data["data"][field] = None
-        
-        # Validate required fields
-        missing_required = []
-        for field, config in template.get("fields", {}).items():
-            if config.get("required", False) and (field not in mapped_data["data"] or mapped_data["data"][field] is None):
-                missing_required.append(field)
-        
-        if missing_required:
-            mapped_data["validation"] = {
-                "status": "incomplete",
-                "missing_required": missing_required
-            }
-        else:
-            mapped_data["validation"] = {
-                "status": "complete"
-            }
-        
-        return mapped_data
-    
+        return self.snapshot().map_to_template(template_id, extracted_data)
+
     def save_template(self, template_id: str, template_data: Dict[str, Any]) -> bool:
         """
         Save a new or updated template
+
+        The file is replaced atomically, so other processes never read a
+        half-written template; they pick it up on their next poll, this
+        process at once.
         """
         try:
-            file_path = os.path.join(self.templates_dir, f"{template_id}.json")
-            with open(file_path, 'w') as f:
+            file_path = self._template_path(template_id)
+            temp_path = os.path.join(self.templates_dir, f".{template_id}.json.tmp")
+            with open(temp_path, 'w') as f:
                 json.dump(template_data, f, indent=2)
-            
-            # Update in-memory templates
-            self.templates[template_id] = template_data
+            os.replace(temp_path, file_path)
+
+            self.refresh([template_id])
             return True
         except Exception as e:
-            print(f"Error saving template: {str(e)}")
-            return False
\ No newline at end of file
+            logger.exception("Error saving template %s: %s", template_id, e)
+            return False
@@ -0,0 +1,121 @@
+# worker.py
+"""
+Bill processing workers
+
+Usage:
+    python worker.py [--concurrency N] [--threads T]
+
+Starts N worker processes that claim jobs from the durable job queue and
+run the OCR/extraction pipeline on them, T jobs at a time each. Run it next to the API
+(`python main.py`); both share the queue database.
+"""
+import os
+import signal
+import argparse
+import logging
+import threading
+import multiprocessing
+from typing import Dict, Any
+
+import config
+from job_queue import JobQueue, STATUS_ERROR
+from telemetry import setup_logging
+
+logger = logging.getLogger("worker")
+
+def _heartbeat(job_queue: JobQueue, job: Dict[str, Any], worker_id: str, done: threading.Event):
+    """Keep extending the job's visibility timeout until it finishes"""
+    interval = max(1.0, config.JOB_VISIBILITY_TIMEOUT / 3)
+    while not done.wait(interval):
+        if not job_queue.heartbeat(job["id"], worker_id):
+            break
+
+def _process_jobs(pipeline: Any, job_queue: JobQueue, worker_id: str, stopping: threading.Event):
+    """Claim and process jobs one at a time until told to stop"""
+    while not stopping.is_set():
+        job = job_queue.claim(worker_id)
+        if job is None:
+            stopping.wait(config.WORKER_POLL_INTERVAL)
+            continue
+
+        done = threading.Event()
+        heartbeat = threading.Thread(target=_heartbeat, args=(job_queue, job, worker_id, done), daemon=True)
+        heartbeat.start()
+        try:
+            pipeline.process_document_task(job["filename"], job["bill_id"], job["template_id"], job["file_hash"])
+            job_queue.complete(job["id"], worker_id)
+        except Exception as e:
+            logger.exception("Job %s for bill %s failed", job["id"], job["bill_id"])
+            error = f"{type(e).__name__}: {str(e)}"
+            status = job_queue.fail(job["id"], worker_id, error)
+            pipeline.metrics.inc("bill_errors_total", {"error": type(e).__name__, "final": status == STATUS_ERROR})
+            if status == STATUS_ERROR:
+                pipeline.save_error_result(job["bill_id"], job["filename"], error)
+        finally:
+            done.set()
+            heartbeat.join()
+
+def run_worker(worker_number: int, threads: int = 1):
+    """
+    Claim and process jobs until told to stop
+
+    Runs `threads` jobs at once. They share the process's OCR pool and
+    LLM extractor, so while one bill waits on the model the others keep
+    the OCR workers busy.
+    """
+    setup_logging()
+    # Imported here so only worker processes load the OCR/LLM stack
+    import pipeline
+
+    worker_id = f"{os.uname().nodename}:{os.getpid()}:{worker_number}"
+    job_queue = JobQueue()
+    stopping = threading.Event()
+
+    def stop(signum, frame):
+        # Finish the current jobs, then exit
+        stopping.set()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    logger.info("Worker %s started with %d threads", worker_id, threads)
+
+    job_threads = [
+        threading.Thread(target=_process_jobs, args=(pipeline, job_queue, f"{worker_id}.{number}", stopping),
+                         name=f"job-{number}")
+        for number in range(max(1, threads))
+    ]
+    for thread in job_threads:
+        thread.start()
+    for thread in job_threads:
+        thread.join()
+
+    pipeline.document_processor.ocr_engine.shutdown()
+    logger.info("Worker %s stopped", worker_id)
+
+def main():
+    parser = argparse.ArgumentParser(description="Bill processing workers")
+    parser.add_argument("--concurrency", type=int, default=config.WORKER_CONCURRENCY,
+                        help="Number of worker processes")
+    parser.add_argument("--threads", type=int, default=config.WORKER_THREADS,
+                        help="Jobs each worker process runs at once")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    workers = [context.Process(target=run_worker, args=(number, args.threads)) for number in range(args.concurrency)]
+    for worker in workers:
+        worker.start()
+
+    # Pass shutdown signals on to the workers and wait for them to drain
+    def stop(signum, frame):
+        for worker in workers:
+            if worker.is_alive():
+                os.kill(worker.pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for worker in workers:
+        worker.join()
+
+if __name__ == "__main__":
+    main()